@@ -0,0 +1,295 @@
+import threading
+import pandas as pd
+from timeseries import SalesTimeSeries
+
+class DatasetAggregates:
+    """Groupements calculés une seule fois par jeu de données, partagés par DataAnalyzer et ExcelGenerator
+    
+    Chaque collection est agrégée en une passe au grain le plus fin utile
+    (opérations par jour et shop, dépôts par shop et client, mouvements par shop,
+    type, devise et mois). Les vues par jour, shop, client ou type sont dérivées
+    de ces tables réduites et mémorisées.
+    """
+    
+    def __init__(self, operations_df, depots_df, mouvements_df):
+        self.operations_df = operations_df
+        self.depots_df = depots_df
+        self.mouvements_df = mouvements_df
+        self._cache = {}
+        self._lock = threading.RLock()
+        # Nombre de lignes par collection quand les DataFrames ne sont pas disponibles (voir from_state)
+        self._rows = {}
+    
+    @classmethod
+    def from_state(cls, state):
+        """Groupements dérivés d'un AggregateState: tables de base fournies, sans DataFrames bruts"""
+        aggregates = cls(None, None, None)
+        for collection, table_name in AggregateState.TABLES.items():
+            aggregates._cache[table_name] = state.tables[collection]
+        aggregates._rows = dict(state.rows)
+        return aggregates
+    
+    def row_count(self, collection):
+        """Nombre de lignes d'une collection (DataFrame brut, sinon compteur de l'état agrégé)"""
+        df = getattr(self, f"{collection}_df", None)
+        if df is not None:
+            return len(df)
+        return self._rows.get(collection, 0)
+    
+    def _memo(self, key, compute):
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+            return self._cache[key]
+    
+    # Opérations
+    
+    def operations_day_shop(self):
+        """Ventes par (jour, shop): somme, nombre d'opérations, première et dernière opération"""
+        def compute():
+            df = self.operations_df
+            grouped = df.groupby(
+                [df['date'].dt.normalize().rename('day'), 'shopId'], observed=True, dropna=False
+            ).agg(
+                sum=('total_general', 'sum'),
+                count=('total_general', 'count'),
+                first=('date', 'min'),
+                last=('date', 'max')
+            )
+            return grouped.reset_index()
+        return self._memo('operations_day_shop', compute)
+    
+    def operations_by_period(self, period):
+        """Ventes par période ('day', 'week', 'month', 'year'): somme, nombre, shops distincts"""
+        def compute():
+            base = self.operations_day_shop()
+            if period == 'day':
+                key = base['day'].dt.date
+            else:
+                key = base['day'].dt.to_period({'week': 'W', 'month': 'M', 'year': 'Y'}[period])
+            grouped = base.groupby(key.rename('period')).agg(
+                sum=('sum', 'sum'),
+                count=('count', 'sum'),
+                shops=('shopId', 'nunique')
+            )
+            grouped['mean'] = grouped['sum'] / grouped['count']
+            return grouped
+        return self._memo(('operations_by_period', period), compute)
+    
+    def operations_by_shop(self):
+        """Ventes par shop: somme, moyenne, nombre d'opérations"""
+        def compute():
+            grouped = self.operations_day_shop().groupby('shopId', observed=True).agg(
+                sum=('sum', 'sum'),
+                count=('count', 'sum')
+            )
+            grouped['mean'] = grouped['sum'] / grouped['count']
+            return grouped
+        return self._memo('operations_by_shop', compute)
+    
+    def operations_totals(self):
+        """Totaux des opérations: somme, nombre, moyenne, shops, premier et dernier jour"""
+        def compute():
+            base = self.operations_day_shop()
+            total = base['sum'].sum()
+            count = int(base['count'].sum())
+            return {
+                'sum': total,
+                'count': count,
+                'mean': total / count if count else float('nan'),
+                'shops': base['shopId'].nunique(),
+                'first_day': base['day'].min(),
+                'last_day': base['day'].max(),
+                'first': base['first'].min(),
+                'last': base['last'].max()
+            }
+        return self._memo('operations_totals', compute)
+    
+    def operations_timeseries(self):
+        """Séries journalières denses (shops × jours du calendrier): fenêtres glissantes, cumuls, année précédente"""
+        return self._memo('operations_timeseries', lambda: SalesTimeSeries(self.operations_day_shop()))
+    
+    # Dépôts
+    
+    def depots_shop_client(self):
+        """Dépôts par (shop, client): somme, nombre, premier et dernier dépôt"""
+        def compute():
+            grouped = self.depots_df.groupby(['shopId', 'clientId'], observed=True, dropna=False).agg(
+                sum=('montant', 'sum'),
+                count=('montant', 'count'),
+                first=('date', 'min'),
+                last=('date', 'max')
+            )
+            return grouped.reset_index()
+        return self._memo('depots_shop_client', compute)
+    
+    def depots_by_client(self):
+        """Dépôts par client: somme, nombre, moyenne, premier et dernier dépôt"""
+        def compute():
+            grouped = self.depots_shop_client().groupby('clientId', observed=True).agg(
+                sum=('sum', 'sum'),
+                count=('count', 'sum'),
+                first=('first', 'min'),
+                last=('last', 'max')
+            )
+            grouped['mean'] = grouped['sum'] / grouped['count']
+            return grouped
+        return self._memo('depots_by_client', compute)
+    
+    def depots_by_shop(self):
+        """Dépôts par shop: clients distincts, somme, nombre, moyenne"""
+        def compute():
+            grouped = self.depots_shop_client().groupby('shopId', observed=True).agg(
+                clients=('clientId', 'nunique'),
+                sum=('sum', 'sum'),
+                count=('count', 'sum')
+            )
+            grouped['mean'] = grouped['sum'] / grouped['count']
+            return grouped
+        return self._memo('depots_by_shop', compute)
+    
+    def depots_totals(self):
+        """Totaux des dépôts: somme, nombre, moyenne"""
+        def compute():
+            base = self.depots_shop_client()
+            total = base['sum'].sum()
+            count = int(base['count'].sum())
+            return {'sum': total, 'count': count, 'mean': total / count if count else float('nan')}
+        return self._memo('depots_totals', compute)
+    
+    # Mouvements
+    
+    def mouvements_core(self):
+        """Mouvements par (shop, type, devise, mois): somme et nombre"""
+        def compute():
+            df = self.mouvements_df
+            grouped = df.groupby(
+                ['shopId', 'type', 'devise', df['date'].dt.to_period('M').rename('month')],
+                observed=True, dropna=False
+            )['montant'].agg(['sum', 'count'])
+            return grouped.reset_index()
+        return self._memo('mouvements_core', compute)
+    
+    def mouvements_by_type(self):
+        """Mouvements par (type, devise): somme, nombre, moyenne"""
+        def compute():
+            grouped = self.mouvements_core().groupby(['type', 'devise'], observed=True).agg(
+                sum=('sum', 'sum'),
+                count=('count', 'sum')
+            )
+            grouped['mean'] = grouped['sum'] / grouped['count']
+            return grouped
+        return self._memo('mouvements_by_type', compute)
+    
+    def mouvements_by_shop(self):
+        """Mouvements par shop: somme, nombre, types distincts"""
+        def compute():
+            return self.mouvements_core().groupby('shopId', observed=True).agg(
+                sum=('sum', 'sum'),
+                count=('count', 'sum'),
+                types=('type', 'nunique')
+            )
+        return self._memo('mouvements_by_shop', compute)
+    
+    def mouvements_by_month(self):
+        """Mouvements par mois: somme et nombre"""
+        def compute():
+            return self.mouvements_core().groupby('month').agg(
+                sum=('sum', 'sum'),
+                count=('count', 'sum')
+            )
+        return self._memo('mouvements_by_month', compute)
+
+class AggregateState:
+    """État agrégé fusionnable: les tables de base de DatasetAggregates et le nombre de lignes par collection
+    
+    Sommes, nombres (donc moyennes), premières/dernières dates et clés distinctes (clientId, shopId) se
+    combinent sans revenir aux lignes: un état par bloc de lignes ou par jour, fusionnés dans n'importe quel
+    ordre (merge est associatif et commutatif). update() n'agrège que les nouvelles lignes puis regroupe les
+    tables réduites: le coût dépend du delta et du nombre de clés, pas de l'historique.
+    Un état n'est jamais modifié: merge et update retournent un nouvel état.
+    """
+    
+    # Table de base de chaque collection (méthode de DatasetAggregates), clés et fusion des métriques
+    TABLES = {
+        'operations': 'operations_day_shop',
+        'depots': 'depots_shop_client',
+        'mouvements': 'mouvements_core'
+    }
+    KEYS = {
+        'operations': ['day', 'shopId'],
+        'depots': ['shopId', 'clientId'],
+        'mouvements': ['shopId', 'type', 'devise', 'month']
+    }
+    MERGE = {
+        'operations': {'sum': 'sum', 'count': 'sum', 'first': 'min', 'last': 'max'},
+        'depots': {'sum': 'sum', 'count': 'sum', 'first': 'min', 'last': 'max'},
+        'mouvements': {'sum': 'sum', 'count': 'sum'}
+    }
+    COLLECTIONS = ('operations', 'depots', 'clients', 'mouvements')
+    
+    def __init__(self, tables=None, rows=None):
+        tables = tables or {}
+        self.tables = {
+            collection: tables[collection] if collection in tables else self._empty_table(collection)
+            for collection in self.TABLES
+        }
+        self.rows = {collection: 0 for collection in self.COLLECTIONS}
+        self.rows.update(rows or {})
+        self._aggregates = None
+    
+    @classmethod
+    def _empty_table(cls, collection):
+        return pd.DataFrame(columns=cls.KEYS[collection] + list(cls.MERGE[collection]))
+    
+    @classmethod
+    def from_frames(cls, operations_df=None, depots_df=None, clients_df=None, mouvements_df=None):
+        """État d'un bloc de lignes (un DataFrame par collection, None ou vide si aucune)"""
+        frames = {'operations': operations_df, 'depots': depots_df, 'mouvements': mouvements_df}
+        aggregates = DatasetAggregates(operations_df, depots_df, mouvements_df)
+        tables = {
+            collection: getattr(aggregates, cls.TABLES[collection])()
+            for collection, df in frames.items()
+            if df is not None and not df.empty
+        }
+        frames['clients'] = clients_df
+        rows = {collection: len(df) for collection, df in frames.items() if df is not None}
+        return cls(tables, rows)
+    
+    @classmethod
+    def combine(cls, states):
+        """Fusion d'un nombre quelconque d'états (blocs, jours) en une seule passe par collection"""
+        states = list(states)
+        tables = {}
+        for collection in cls.TABLES:
+            parts = [state.tables[collection] for state in states if not state.tables[collection].empty]
+            if len(parts) == 1:
+                tables[collection] = parts[0]
+            elif parts:
+                tables[collection] = pd.concat(parts, ignore_index=True).groupby(
+                    cls.KEYS[collection], observed=True, dropna=False, sort=False
+                ).agg(cls.MERGE[collection]).reset_index()
+        rows = {collection: sum(state.rows[collection] for state in states) for collection in cls.COLLECTIONS}
+        return cls(tables, rows)
+    
+    def merge(self, other):
+        return AggregateState.combine([self, other])
+    
+    def update(self, operations_df=None, depots_df=None, clients_df=None, mouvements_df=None):
+        """Nouvel état incluant les nouvelles lignes (seules ces lignes sont agrégées)"""
+        return self.merge(AggregateState.from_frames(operations_df, depots_df, clients_df, mouvements_df))
+    
+    def distinct(self, column):
+        """Valeurs distinctes de clientId (dépôts) ou shopId (toutes les collections), exactes"""
+        if column == 'clientId':
+            return pd.Index(self.tables['depots']['clientId'].unique())
+        values = [table[column] for table in self.tables.values() if not table.empty]
+        if not values:
+            return pd.Index([])
+        return pd.Index(pd.concat(values, ignore_index=True).unique())
+    
+    def aggregates(self):
+        """DatasetAggregates de l'état (vues dérivées mémorisées tant que l'état ne change pas)"""
+        if self._aggregates is None:
+            self._aggregates = DatasetAggregates.from_state(self)
+        return self._aggregates
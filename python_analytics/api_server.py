@@ -3,30 +3,106 @@
 Serveur API simple pour connecter React à Python
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import os
 import sys
 from datetime import datetime
 import threading
 import time
+import io
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 
-# Import des modules locaux
-from config import initialize_firebase
-from data_extractor import DataExtractor
-from data_analyzer import DataAnalyzer
-from excel_generator import ExcelGenerator
+# Import des modules locaux (légers: le pipeline pandas/xlsxwriter est importé au premier usage)
+from config import initialize_firebase, firebase_status
+from clients import CLIENTS
+from report_cache import ReportCache
+from report_store import ReportStore, report_key
+from job_queue import JobQueue, QueueFullError
+from metrics import REGISTRY, REPORT_SECONDS, REPORT_FILE_BYTES, REPORTS
 
 app = Flask(__name__)
 CORS(app)  # Permettre les requêtes depuis React
 
-# Initialiser Firebase
-initialize_firebase()
+# Démarrage rapide (ANALYTICS_FAST_START=1, par défaut): /api/health répond avant le chargement du pipeline
+FAST_START = os.environ.get('ANALYTICS_FAST_START', '1') == '1'
 
-# Dossier pour les rapports générés
-REPORTS_FOLDER = "/tmp/generated_reports"  # Utiliser /tmp sur Render
-if not os.path.exists(REPORTS_FOLDER):
-    os.makedirs(REPORTS_FOLDER)
+# Initialisation Firebase en démarrage rapide: 'background' (thread de préchauffage), 'lazy' (premier accès)
+# ou 'eager' (au chargement du serveur)
+FIREBASE_INIT = os.environ.get('ANALYTICS_FIREBASE_INIT', 'background')
+
+def warm_up():
+    """Initialise Firebase, ouvre les clients partagés puis précharge les modules du pipeline (pandas, xlsxwriter)"""
+    started = time.perf_counter()
+    if initialize_firebase():
+        try:
+            CLIENTS.firestore()
+            CLIENTS.bucket()
+        except Exception as e:
+            print(f"⚠️ Clients Firebase non ouverts: {e}")
+    import data_extractor
+    import excel_generator
+    import rollups
+    import exporters
+    print(f"🔥 Préchauffage terminé en {time.perf_counter() - started:.2f}s")
+
+if not FAST_START:
+    warm_up()
+elif FIREBASE_INIT == 'background':
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+elif FIREBASE_INIT == 'eager':
+    initialize_firebase()
+
+# Ping périodique des clients Firestore/Storage partagés (ANALYTICS_CLIENT_KEEPALIVE secondes)
+CLIENTS.start_keepalive()
+
+# Store des rapports générés (/tmp/generated_reports sur Render): un fichier par contenu, budget REPORT_STORE_MB,
+# index partagé entre les workers du serveur
+REPORT_STORE = ReportStore()
+
+# Synchronisation incrémentale via snapshot local (ANALYTICS_USE_SNAPSHOT=1)
+USE_SNAPSHOT = os.environ.get('ANALYTICS_USE_SNAPSHOT') == '1'
+
+# Jeu de données partagé entre workers (ANALYTICS_SHARED_DATASET=1, publié par shared_dataset.py load)
+USE_SHARED_DATASET = os.environ.get('ANALYTICS_SHARED_DATASET') == '1'
+_shared_dataset = {'instance': None, 'lock': threading.Lock()}
+
+def get_shared_dataset():
+    """Jeu de données partagé projeté dans ce worker (None hors mode partagé ou tant qu'aucune version n'est publiée)"""
+    if not USE_SHARED_DATASET:
+        return None
+    with _shared_dataset['lock']:
+        if _shared_dataset['instance'] is None:
+            from shared_dataset import SharedDataset
+            _shared_dataset['instance'] = SharedDataset()
+    dataset = _shared_dataset['instance']
+    if not dataset.available():
+        print("⚠️ Jeu de données partagé absent, extraction depuis Firestore")
+        return None
+    return dataset
+
+# Données brutes écrites en flux, en mémoire constante (ANALYTICS_STREAM_RAW_DATA=1)
+STREAM_RAW_DATA = os.environ.get('ANALYTICS_STREAM_RAW_DATA') == '1'
+
+# Rapports de synthèse (sans données brutes) agrégés page par page dans un état incrémental, sans DataFrames complets
+# (ANALYTICS_SUMMARY_FROM_STATE=0 pour extraire les collections)
+SUMMARY_FROM_STATE = os.environ.get('ANALYTICS_SUMMARY_FROM_STATE', '1') == '1'
+
+# Rapports annuels de synthèse complétés par les analyses approchées des sketches (quantiles, clients distincts)
+YEARLY_SKETCHES = os.environ.get('ANALYTICS_YEARLY_SKETCHES', '1') == '1'
+
+# Rapports assemblés en mémoire avant leur unique écriture dans le store (ANALYTICS_IN_MEMORY_REPORTS=0 pour écrire sur disque)
+IN_MEMORY_REPORTS = os.environ.get('ANALYTICS_IN_MEMORY_REPORTS', '1') == '1'
+
+# Cache des rapports générés (TTL + LRU, calculs identiques dédoublonnés)
+REPORT_CACHE = ReportCache()
+
+# Durée maximale de réutilisation d'un rapport (cache et store): borne le retard sur les modifications sans updatedAt
+REPORT_MAX_AGE = max(int(os.environ.get('ANALYTICS_REPORT_MAX_AGE', 900)), 1)
+
+# Uploads poursuivis après la réponse (generate-report avec "download": true)
+BACKGROUND_UPLOADS = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload")
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -34,136 +110,271 @@ def health_check():
     return jsonify({
         "status": "ok",
         "message": "API Python Shop Ararat fonctionnelle",
+        "firebase": firebase_status(),
+        "clients": CLIENTS.status(),
         "timestamp": datetime.now().isoformat()
     })
 
+def build_report(plan, include_raw_data, store_key, defer_upload=False):
+    """Pipeline complet d'un rapport: extraction → Excel → store → upload
+    
+    plan: ReportPlan du rapport (type, période, shop; voir report_planner.plan_report)
+    store_key: clé du rapport dans REPORT_STORE (voir report_key)
+    defer_upload: upload lancé en arrière-plan (le rapport est servi depuis le store en attendant)
+    """
+    from data_extractor import DataExtractor
+    from data_analyzer import DataAnalyzer
+    from aggregations import AggregateState
+    from excel_generator import ExcelGenerator, REPORT_FIELDS
+    from rollups import RollupStore
+    from sketches import SketchStore
+    from report_planner import month_range
+    
+    report_type, shop_id = plan.report_type, plan.shop_id
+    start_date, end_date = plan.start_date, plan.end_date
+    
+    # Initialiser les classes
+    extractor = DataExtractor(use_snapshot=USE_SNAPSHOT)
+    excel_gen = ExcelGenerator()
+    
+    print(f"📅 Extraction données: {start_date} à {end_date}")
+    
+    # Les rapports mensuels et annuels de synthèse sont servis depuis les agrégats journaliers
+    use_rollups = report_type in ('monthly', 'yearly') and not include_raw_data
+    # En flux, seules les colonnes de synthèse sont chargées et les données brutes sont relues page par page
+    stream_raw = include_raw_data and STREAM_RAW_DATA
+    # Les autres synthèses sont agrégées page par page (le snapshot et le jeu partagé sont déjà en mémoire)
+    dataset = get_shared_dataset()
+    use_state = SUMMARY_FROM_STATE and not include_raw_data and not use_rollups and not USE_SNAPSHOT and dataset is None
+    aggregates = None
+    sketch_analyses = None
+    
+    if use_rollups:
+        rollup_end = end_date
+        if report_type == 'monthly' and start_date:
+            # Comme create_monthly_report: la période s'arrête à la fin du mois de start_date
+            _, month_end = month_range(start_date[:7])
+            rollup_end = min(end_date, month_end) if end_date else month_end
+        rollups = RollupStore().sync_all(extractor, start_date, rollup_end, shop_id)
+        
+        if report_type == 'yearly' and YEARLY_SKETCHES:
+            # Quantiles des montants et clients distincts sur l'année, en mémoire bornée
+            analyzer, sketch_store = DataAnalyzer(), SketchStore()
+            sketches = {}
+            for collection in ('operations', 'depots'):
+                sketch_store.sync(extractor, collection)
+                for kind in ('distinct', 'quantiles'):
+                    sketches[collection, kind] = sketch_store.get_sketch(collection, kind, start_date, end_date, shop_id)
+            sketch_analyses = {
+                'ventes': analyzer.analyze_sales_performance_from_sketches(sketches['operations', 'quantiles']),
+                'clients': analyzer.analyze_client_behavior_from_sketches(
+                    sketches['depots', 'distinct'], sketches['depots', 'quantiles']
+                ),
+                'erreurs': analyzer.sketch_error_bounds(sketch_store.precision, sketch_store.relative_error)
+            }
+    elif use_state:
+        # Chaque page est agrégée dans l'état puis libérée: la mémoire dépend des clés, pas du nombre de documents
+        analyzer = DataAnalyzer()
+        for collection in AggregateState.TABLES:
+            query_start, query_end = plan.query_range(collection)
+            for chunk in extractor.iter_collection(
+                collection, query_start, query_end, shop_id, columns=REPORT_FIELDS['summary'][collection]
+            ):
+                analyzer.update_state(**{f"{collection}_df": chunk})
+        aggregates = (analyzer.state or AggregateState()).aggregates()
+        operations_df = depots_df = clients_df = mouvements_df = None
+        print(f"📊 État agrégé: {aggregates.row_count('operations')} opérations, "
+              f"{aggregates.row_count('depots')} dépôts, {aggregates.row_count('mouvements')} mouvements")
+    else:
+        # Extraire les données (vues sur le jeu de données partagé si un chargeur l'a publié)
+        extracted = plan.extract(
+            dataset or extractor,
+            fields=REPORT_FIELDS['full' if include_raw_data and not stream_raw else 'summary']
+        )
+        operations_df = extracted['operations']
+        depots_df = extracted['depots']
+        clients_df = extracted['clients']
+        mouvements_df = extracted['mouvements']
+        print(f"⏱️ Temps d'extraction: {extracted['timings']}")
+    
+    # Générer le nom du fichier
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"rapport_{report_type}_{timestamp}_{store_key[:8]}.xlsx"
+    
+    # En mémoire, le classeur est assemblé dans un tampon: une seule écriture (dans le store), pas de relecture
+    # pour l'upload. Le mode flux (mémoire constante) écrit dans un fichier temporaire du store.
+    in_memory = IN_MEMORY_REPORTS and not stream_raw
+    output = io.BytesIO() if in_memory else None
+    filepath = None if in_memory else REPORT_STORE.temp_path()
+    
+    print(f"📁 Création {'en mémoire' if in_memory else 'fichier'}: {filepath or filename}")
+    
+    # Créer le rapport Excel selon le type
+    if use_rollups:
+        created = excel_gen.create_rollup_report(
+            rollups['operations'], rollups['depots'], rollups['mouvements'],
+            filepath or filename, output=output, sketch_analyses=sketch_analyses
+        )
+    elif stream_raw:
+        raw_chunks = {
+            'operations': extractor.iter_collection('operations', start_date, end_date, shop_id),
+            'depots': extractor.iter_collection('depots', start_date, end_date, shop_id)
+        }
+        created = excel_gen.create_sales_report(
+            operations_df, depots_df, clients_df, mouvements_df,
+            filepath, constant_memory=True, raw_chunks=raw_chunks
+        )
+    elif report_type == 'monthly' and start_date:
+        month_year = start_date[:7]  # YYYY-MM
+        created = excel_gen.create_monthly_report(
+            operations_df, depots_df, clients_df, mouvements_df,
+            month_year, filepath or filename, include_raw_data, output=output
+        )
+    else:
+        # Rapport quotidien, annuel, personnalisé ou par défaut
+        created = excel_gen.create_sales_report(
+            operations_df, depots_df, clients_df, mouvements_df,
+            filepath or filename, include_raw_data, aggregates=aggregates, output=output
+        )
+    
+    # Vérifier si le rapport a été créé
+    if not created or (filepath and not os.path.exists(filepath)):
+        print(f"❌ Rapport non créé: {filepath or filename}")
+        raise Exception(f"Le rapport {filename} n'a pas été créé")
+    
+    # Écriture atomique dans le store (servi par /api/download-report, réutilisé par les autres workers)
+    data = output.getvalue() if in_memory else None
+    stored = REPORT_STORE.put(store_key, filename, data=data, source_path=filepath)
+    REPORT_FILE_BYTES.observe(stored['size'], report_type=report_type)
+    print(f"✅ Rapport créé: {filename} ({stored['size']} bytes)")
+    
+    report = {
+        "filename": filename,
+        "downloadUrl": f"/api/download-report/{filename}",
+        "localPath": stored['path']
+    }
+    metadata = {'shopId': shop_id, 'reportType': report_type, 'startDate': start_date, 'endDate': end_date}
+    
+    def upload():
+        # Upload vers Firebase Storage (depuis le tampon en mémoire, sinon depuis le fichier du store)
+        if data is not None:
+            download_url = excel_gen.upload_to_firebase(filename, "reports", metadata, data=data)
+        else:
+            with open(stored['path'], 'rb') as f:
+                download_url = excel_gen.upload_to_firebase(filename, "reports", metadata, data=f)
+        if not download_url:
+            print("⚠️ Échec de l'upload vers Firebase Storage")
+            return
+        # Le rapport en cache et l'index du store pointent désormais vers Storage
+        report["downloadUrl"] = download_url
+        REPORT_STORE.set_download_url(store_key, download_url)
+    
+    if defer_upload:
+        # Le classeur est renvoyé au client pendant que l'upload se poursuit
+        BACKGROUND_UPLOADS.submit(upload)
+    else:
+        upload()
+    
+    return report
+
+def run_report(params, defer_upload=False):
+    """Résout la période puis sert le rapport depuis le cache ou le pipeline (appelé en direct ou par un worker)"""
+    from data_extractor import DataExtractor
+    from report_planner import plan_report
+    
+    report_type = params.get('type', 'custom')  # React envoie 'type'
+    shop_id = params.get('shopId', 'all')
+    include_raw_data = params.get('includeRawData', True)
+    
+    # Même résolution de période que le CLI; les onglets Excel ne calculent aucune analyse à historique
+    plan = plan_report(report_type, start_date=params.get('startDate'), end_date=params.get('endDate'), shop_id=shop_id)
+    start_date, end_date = plan.start_date, plan.end_date
+    
+    # Même type, shop, période et état des données (créations, suppressions, updatedAt), dans la même
+    # fenêtre de REPORT_MAX_AGE secondes → même rapport
+    dataset = get_shared_dataset()
+    watermark = dataset.watermark() if dataset else DataExtractor().get_data_watermark()
+    window = int(time.time() // REPORT_MAX_AGE)
+    cache_key = (report_type, shop_id, start_date, end_date, bool(include_raw_data), watermark, window)
+    # État des données inconnu: rapport recalculé, sans entrée dans le cache (clé propre à cette demande)
+    store_key = report_key(*cache_key) if watermark is not None else uuid.uuid4().hex
+    
+    def generate():
+        # Un seul rendu par rapport, même entre workers: les suivants le lisent dans le store
+        with REPORT_STORE.lock(store_key):
+            stored = REPORT_STORE.get(store_key)
+            if stored is not None:
+                return {
+                    "filename": stored['filename'],
+                    "downloadUrl": stored['downloadUrl'] or f"/api/download-report/{stored['filename']}",
+                    "localPath": stored['path'],
+                    "stored": True
+                }
+            with REPORT_SECONDS.time(report_type=report_type):
+                return build_report(plan, include_raw_data, store_key, defer_upload)
+    
+    try:
+        if watermark is None:
+            report, cached = generate(), False
+        else:
+            report, cached = REPORT_CACHE.get_or_compute(cache_key, generate)
+    except Exception:
+        REPORTS.inc(report_type=report_type, status='failed')
+        raise
+    
+    # Rendu par une autre requête ou un autre worker: lu dans le store
+    cached = cached or report.get('stored', False)
+    REPORTS.inc(report_type=report_type, status='cached' if cached else 'generated')
+    
+    if cached:
+        print(f"⚡ Rapport servi depuis le cache: {report['filename']}")
+    
+    return {
+        "filename": report['filename'],
+        "downloadUrl": report['downloadUrl'],
+        "localPath": report['localPath'],
+        "cached": cached,
+        "reportType": report_type
+    }
+
+# Jobs de rapport asynchrones (pool de workers borné, état en SQLite)
+REPORT_JOBS = JobQueue(run_report)
+REPORT_JOBS.start()
+
 @app.route('/api/generate-report', methods=['POST'])
 def generate_report():
-    """Générer un rapport Excel"""
+    """Générer un rapport Excel (avec "async": true, le rapport est mis en file et un jobId est renvoyé)"""
     try:
         data = request.json
         report_type = data.get('type', 'custom')  # React envoie 'type'
         shop_id = data.get('shopId', 'all')
-        start_date = data.get('startDate')
-        end_date = data.get('endDate')
-        
-        print(f"📊 Données reçues: type={report_type}, shop={shop_id}, dates={start_date} à {end_date}")
         
-        print(f"Génération rapport: {report_type} pour shop {shop_id}")
-        
-        # Initialiser les classes
-        extractor = DataExtractor()
-        analyzer = DataAnalyzer()
-        excel_gen = ExcelGenerator()
-        
-        # Définir les dates selon le type de rapport
-        today = datetime.now().strftime("%Y-%m-%d")
-        current_year = datetime.now().year
-        
-        if report_type == 'daily':
-            # Rapport quotidien - données d'aujourd'hui
-            start_date = today
-            end_date = today
-        elif report_type == 'monthly':
-            # Rapport mensuel - données du mois en cours
-            if not start_date:
-                start_date = datetime.now().replace(day=1).strftime("%Y-%m-%d")
-            if not end_date:
-                end_date = today
-        elif report_type == 'yearly':
-            # Rapport annuel - données de l'année en cours
-            start_date = f"{current_year}-01-01"
-            end_date = today
-        else:
-            # Rapport personnalisé - utiliser les dates fournies ou toutes les données
-            if not start_date and not end_date:
-                start_date = None
-                end_date = None
+        print(f"📊 Données reçues: type={report_type}, shop={shop_id}, dates={data.get('startDate')} à {data.get('endDate')}")
         
-        print(f"📅 Extraction données: {start_date} à {end_date}")
+        if data.get('async'):
+            return submit_report_job(data)
         
-        # Extraire les données
-        operations_df = extractor.get_operations_data(
-            start_date=start_date,
-            end_date=end_date,
-            shop_id=shop_id
-        )
-        
-        depots_df = extractor.get_depots_data(
-            start_date=start_date,
-            end_date=end_date,
-            shop_id=shop_id
-        )
-        
-        clients_df = extractor.get_clients_data(shop_id=shop_id)
-        
-        mouvements_df = extractor.get_mouvements_data(
-            start_date=start_date,
-            end_date=end_date,
-            shop_id=shop_id
-        )
-        
-        # Générer le nom du fichier
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"rapport_{report_type}_{timestamp}.xlsx"
-        filepath = os.path.join(REPORTS_FOLDER, filename)
-        
-        print(f"📁 Création fichier: {filepath}")
-        
-        # Créer le rapport Excel selon le type
-        if report_type == 'monthly' and start_date:
-            month_year = start_date[:7]  # YYYY-MM
-            excel_gen.create_monthly_report(
-                operations_df, depots_df, clients_df, mouvements_df,
-                month_year, filepath
-            )
-        elif report_type == 'daily':
-            # Rapport quotidien - données du jour actuel
-            today = datetime.now().strftime("%Y-%m-%d")
-            excel_gen.create_sales_report(
-                operations_df, depots_df, clients_df, mouvements_df,
-                filepath
-            )
-        elif report_type == 'yearly':
-            # Rapport annuel - données de l'année en cours
-            current_year = datetime.now().year
-            excel_gen.create_sales_report(
-                operations_df, depots_df, clients_df, mouvements_df,
-                filepath
-            )
-        else:
-            # Rapport personnalisé ou par défaut
-            excel_gen.create_sales_report(
-                operations_df, depots_df, clients_df, mouvements_df,
-                filepath
-            )
+        print(f"Génération rapport: {report_type} pour shop {shop_id}")
         
-        # Vérifier si le fichier a été créé
-        if os.path.exists(filepath):
-            file_size = os.path.getsize(filepath)
-            print(f"✅ Fichier créé: {filepath} ({file_size} bytes)")
+        # "download": true → le classeur est renvoyé directement, l'upload se poursuit en arrière-plan
+        if data.get('download'):
+            report = run_report(data, defer_upload=True)
+            response = send_report_file(report['filename'])
+            if response is not None:
+                response.headers['X-Report-Cached'] = str(report['cached']).lower()
+                return response
         else:
-            print(f"❌ Fichier non créé: {filepath}")
-            raise Exception(f"Le fichier {filepath} n'a pas été créé")
-        
-        # Upload vers Firebase Storage
-        download_url = excel_gen.upload_to_firebase(filename, "reports")
-        
-        if not download_url:
-            print("⚠️ Échec de l'upload vers Firebase Storage")
-            # Créer une URL temporaire pour le fichier local
-            download_url = f"/api/download-report/{filename}"
-        else:
-            print(f"✅ Fichier uploadé vers Firebase: {download_url}")
+            report = run_report(data)
         
         return jsonify({
             "success": True,
-            "filename": filename,
-            "downloadUrl": download_url,
-            "localPath": filepath,
+            "filename": report['filename'],
+            "downloadUrl": report['downloadUrl'],
+            "localPath": report['localPath'],
+            "cached": report['cached'],
             "message": f"Rapport {report_type} généré avec succès"
         })
-        
+    
     except Exception as e:
         print(f"Erreur génération rapport: {e}")
         return jsonify({
@@ -172,18 +383,114 @@ def generate_report():
             "message": "Erreur lors de la génération du rapport"
         }), 500
 
+@app.route('/api/report-jobs', methods=['POST'])
+def create_report_job():
+    """Mettre un rapport en file et renvoyer immédiatement son jobId"""
+    try:
+        return submit_report_job(request.json or {})
+    except Exception as e:
+        print(f"Erreur création job: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+def submit_report_job(params):
+    """Enregistre un job de rapport (429 si la file est pleine)"""
+    params = {key: value for key, value in params.items() if key != 'async'}
+    try:
+        job_id = REPORT_JOBS.submit(params)
+    except QueueFullError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "message": "Trop de rapports en attente, réessayez plus tard"
+        }), 429, {'Retry-After': '30'}
+    
+    print(f"📥 Job de rapport en file: {job_id}")
+    return jsonify({
+        "success": True,
+        "jobId": job_id,
+        "status": "queued",
+        "statusUrl": f"/api/report-jobs/{job_id}"
+    }), 202
+
+@app.route('/api/report-jobs/<job_id>', methods=['GET'])
+def get_report_job(job_id):
+    """État et résultat d'un job de rapport"""
+    job = REPORT_JOBS.get(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": "Job non trouvé"
+        }), 404
+    
+    return jsonify(dict(job, success=True))
+
+@app.route('/api/report-jobs', methods=['GET'])
+def list_report_jobs():
+    """Lister les jobs de rapport récents"""
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        "success": True,
+        "jobs": REPORT_JOBS.list(limit),
+        "stats": REPORT_JOBS.stats()
+    })
+
+@app.route('/api/export/<collection>', methods=['GET'])
+def export_collection(collection):
+    """Exporter une collection en flux (csv.gz, parquet ou ndjson), sans fichier intermédiaire"""
+    from data_extractor import DataExtractor
+    from exporters import EXPORT_COLLECTIONS, EXPORT_FORMATS, iter_export, export_filename
+    
+    export_format = request.args.get('format', 'csv.gz')
+    shop_id = request.args.get('shopId', 'all')
+    start_date = request.args.get('startDate')
+    end_date = request.args.get('endDate')
+    
+    if collection not in EXPORT_COLLECTIONS or export_format not in EXPORT_FORMATS:
+        return jsonify({
+            "success": False,
+            "error": f"Collections: {', '.join(EXPORT_COLLECTIONS)} - formats: {', '.join(EXPORT_FORMATS)}"
+        }), 400
+    
+    print(f"📤 Export {collection} ({export_format}): shop={shop_id}, dates={start_date} à {end_date}")
+    
+    extractor = DataExtractor()
+    if collection == 'clients':
+        chunks = extractor.iter_collection(collection, shop_id=shop_id)
+    else:
+        chunks = extractor.iter_collection(collection, start_date, end_date, shop_id)
+    
+    # Réponse en transfert chunked: chaque page Firestore est envoyée dès qu'elle est sérialisée
+    filename = export_filename(collection, export_format)
+    return Response(
+        stream_with_context(iter_export(chunks, export_format)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def send_report_file(filename):
+    """Réponse de téléchargement depuis le store (None si le rapport n'y est plus)"""
+    stored = REPORT_STORE.find(filename)
+    if stored is None:
+        return None
+    
+    # Fichier ouvert tout de suite: une éviction pendant l'envoi ne coupe pas le téléchargement
+    return send_file(
+        open(stored['path'], 'rb'),
+        as_attachment=True,
+        download_name=filename,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
 @app.route('/api/download-report/<filename>', methods=['GET'])
 def download_report(filename):
     """Télécharger un rapport généré"""
     try:
-        filepath = os.path.join(REPORTS_FOLDER, filename)
-        if os.path.exists(filepath):
-            return send_file(
-                filepath,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+        response = send_report_file(filename)
+        if response is not None:
+            return response
         else:
             return jsonify({
                 "success": False,
@@ -197,38 +504,43 @@ def download_report(filename):
 
 @app.route('/api/list-reports', methods=['GET'])
 def list_reports():
-    """Lister tous les rapports disponibles depuis Firebase Storage"""
+    """Lister les rapports depuis le catalogue (pagination par curseur, filtres shopId et type)"""
     try:
-        from config import get_storage_client
-        
-        bucket = get_storage_client()
+        from report_catalog import REPORT_CATALOG, CATALOG_PAGE_SIZE
         
-        reports = []
-        blobs = bucket.list_blobs(prefix='reports/')
-        
-        for blob in blobs:
-            if blob.name.endswith('.xlsx'):
-                filename = blob.name.split('/')[-1]
-                reports.append({
-                    "filename": filename,
-                    "size": f"{blob.size / 1024 / 1024:.1f} MB",
-                    "createdAt": blob.time_created.isoformat(),
-                    "downloadUrl": blob.generate_signed_url(
-                        version="v4",
-                        expiration=3600,  # 1 heure
-                        method="GET"
-                    ),
-                    "shopName": "Shop"  # Par défaut
-                })
+        entries, next_cursor = REPORT_CATALOG.list(
+            folder=request.args.get('folder', 'reports'),
+            shop_id=request.args.get('shopId'),
+            report_type=request.args.get('type'),
+            limit=request.args.get('limit', CATALOG_PAGE_SIZE, type=int),
+            cursor=request.args.get('cursor')
+        )
         
-        # Trier par date de création (plus récent en premier)
-        reports.sort(key=lambda x: x['createdAt'], reverse=True)
+        # Une seule résolution du bucket par page; URLs signées servies depuis le cache tant qu'elles sont valides
+        bucket = CLIENTS.bucket() if entries else None
+        reports = [{
+            "filename": entry['filename'],
+            "size": f"{(entry['size'] or 0) / 1024 / 1024:.1f} MB",
+            "createdAt": entry['createdAt'],
+            "downloadUrl": REPORT_CATALOG.download_url(bucket, entry),
+            "shopId": entry['shopId'],
+            "reportType": entry['reportType'],
+            "startDate": entry['startDate'],
+            "endDate": entry['endDate'],
+            "shopName": "Shop"  # Par défaut
+        } for entry in entries]
         
         return jsonify({
             "success": True,
-            "reports": reports
+            "reports": reports,
+            "nextCursor": next_cursor
         })
-        
+    
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
     except Exception as e:
         print(f"Erreur list-reports: {e}")
         return jsonify({
@@ -236,10 +548,17 @@ def list_reports():
             "error": str(e)
         }), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Métriques du processus (durées par étape, documents lus, tailles, uploads) au format Prometheus"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/test-connection', methods=['GET'])
 def test_connection():
     """Tester la connexion Firebase"""
     try:
+        from data_extractor import DataExtractor
+        
         extractor = DataExtractor()
         
         # Tester l'extraction de quelques données
@@ -254,7 +573,7 @@ def test_connection():
                 "shops": shops_count
             }
         })
-        
+    
     except Exception as e:
         return jsonify({
             "success": False,
@@ -268,8 +587,12 @@ if __name__ == '__main__':
     print("🔗 Endpoints disponibles:")
     print("  - GET  /api/health")
     print("  - POST /api/generate-report")
+    print("  - POST /api/report-jobs")
+    print("  - GET  /api/report-jobs/<job_id>")
     print("  - GET  /api/download-report/<filename>")
-    print("  - GET  /api/list-reports")
+    print("  - GET  /api/export/<collection>?format=csv.gz|parquet|ndjson")
+    print("  - GET  /api/list-reports?shopId=&type=&limit=&cursor=")
+    print("  - GET  /api/metrics")
     print("  - GET  /api/test-connection")
     print("=" * 50)
     
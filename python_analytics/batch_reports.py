@@ -0,0 +1,122 @@
+import io
+import os
+import json
+import time
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from excel_generator import ExcelGenerator
+
+# Parallélisme du mode batch (workbooks: processus, uploads: threads)
+BATCH_WORKERS = int(os.environ.get('BATCH_REPORT_WORKERS', os.cpu_count() or 2))
+BATCH_UPLOAD_WORKERS = int(os.environ.get('BATCH_UPLOAD_WORKERS', 8))
+
+def partition_by_shop(data):
+    """Découpe les DataFrames extraits en un jeu de données par shop (une seule passe groupby par collection)"""
+    partitions = {}
+    for collection in ('operations', 'depots', 'clients', 'mouvements'):
+        df = data[collection]
+        if df.empty or 'shopId' not in df.columns:
+            continue
+        for shop_id, shop_df in df.groupby('shopId', observed=True, sort=True):
+            partitions.setdefault(str(shop_id), {})[collection] = shop_df.reset_index(drop=True)
+    
+    # Les collections absentes pour un shop sont des DataFrames vides du même schéma
+    for shop_data in partitions.values():
+        for collection in ('operations', 'depots', 'clients', 'mouvements'):
+            if collection not in shop_data:
+                shop_data[collection] = data[collection].iloc[0:0]
+    
+    return partitions
+
+def build_shop_workbook(task):
+    """Construit le workbook d'un shop (exécuté dans un processus du pool)
+    
+    in_memory: le classeur est renvoyé en octets (entrée 'data') au processus principal, qui l'uploade sans fichier
+    """
+    shop_id, shop_data, filename, include_raw_data, in_memory = task
+    started = time.perf_counter()
+    
+    excel_gen = ExcelGenerator()
+    output = io.BytesIO() if in_memory else None
+    created = excel_gen.create_sales_report(
+        shop_data['operations'], shop_data['depots'], shop_data['clients'], shop_data['mouvements'],
+        filename, include_raw_data=include_raw_data, output=output
+    )
+    
+    return {
+        'shopId': shop_id,
+        'filename': created,
+        'operations': len(shop_data['operations']),
+        'buildSeconds': round(time.perf_counter() - started, 3),
+        'error': None if created else "Échec de la génération du rapport Excel",
+        'data': output.getvalue() if created and in_memory else None
+    }
+
+def run_per_shop_batch(data, label, folder="shop_reports", include_raw_data=True, upload=True,
+                       workers=None, upload_workers=None, metadata=None):
+    """Un rapport par shop: workbooks construits en parallèle (processus), uploads concurrents (threads)
+    
+    data: résultat de DataExtractor.extract_all (extrait une seule fois pour tous les shops)
+    label: suffixe des fichiers (période du rapport)
+    metadata: type et période du rapport pour le catalogue (le shopId est ajouté pour chaque fichier)
+    Avec upload, les classeurs ne passent pas par le disque: ils sont construits et uploadés en mémoire.
+    Retourne le manifeste {shopId: entrée} avec fichier, URL de téléchargement et erreur éventuelle.
+    """
+    partitions = partition_by_shop(data)
+    if not partitions:
+        print("⚠️ Aucun shop dans les données extraites")
+        return {}
+    
+    workers = min(workers or BATCH_WORKERS, len(partitions))
+    upload_workers = min(upload_workers or BATCH_UPLOAD_WORKERS, len(partitions))
+    
+    tasks = [
+        (shop_id, shop_data, f"rapport_{shop_id}_{label}.xlsx", include_raw_data, upload)
+        for shop_id, shop_data in partitions.items()
+    ]
+    
+    print(f"🏭 {len(tasks)} rapports par shop sur {workers} processus")
+    started = time.perf_counter()
+    
+    manifest = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            ThreadPoolExecutor(max_workers=upload_workers) as uploader:
+        excel_gen = ExcelGenerator() if upload else None
+        uploads = {}
+        
+        # Chaque workbook terminé part à l'upload pendant que les suivants se construisent
+        builds = [pool.submit(build_shop_workbook, task) for task in tasks]
+        for future in as_completed(builds):
+            entry = future.result()
+            data = entry.pop('data')
+            entry['downloadUrl'] = None
+            manifest[entry['shopId']] = entry
+            if upload and entry['filename']:
+                uploads[entry['shopId']] = uploader.submit(
+                    excel_gen.upload_to_firebase, entry['filename'], folder,
+                    dict(metadata or {}, shopId=entry['shopId']), data
+                )
+        
+        for shop_id, future in uploads.items():
+            download_url = future.result()
+            manifest[shop_id]['downloadUrl'] = download_url
+            if not download_url:
+                manifest[shop_id]['error'] = "Échec de l'upload"
+    
+    failed = sum(1 for entry in manifest.values() if entry['error'])
+    print(f"✅ {len(manifest) - failed}/{len(manifest)} rapports par shop en {time.perf_counter() - started:.1f}s")
+    return manifest
+
+def write_manifest(manifest, label, start_date, end_date, path=None):
+    """Écrit le manifeste JSON du batch (une entrée par shop)"""
+    path = path or f"manifest_{label}.json"
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'generatedAt': datetime.now().isoformat(),
+            'startDate': start_date,
+            'endDate': end_date,
+            'reports': sorted(manifest.values(), key=lambda entry: entry['shopId'])
+        }, f, ensure_ascii=False, indent=2)
+    print(f"🧾 Manifeste écrit: {path}")
+    return path
@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+Benchmark de bout en bout (extraction → analyse → Excel) sur des données synthétiques, sans Firebase
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import threading
+import statistics
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from data_extractor import DataExtractor
+from data_analyzer import DataAnalyzer
+from aggregations import DatasetAggregates
+from excel_generator import ExcelGenerator, REPORT_FIELDS, EXCEL_MAX_ROWS, RAW_SHEET_CHUNK_SIZE
+from snapshot_store import SnapshotStore
+from schemas import apply_schema
+from rollups import ROLLUP_SPECS, compute_rollup
+
+# Dossier des résultats (un fichier JSON par exécution)
+BENCHMARK_DIR = os.environ.get('ANALYTICS_BENCHMARK_DIR', '/tmp/analytics_benchmark')
+
+# Types de rapport mesurés
+REPORT_TYPES = ('summary', 'full', 'streaming', 'rollup')
+
+# Valeurs des champs catégoriels, reprises de l'application
+OPERATION_TYPES = ['approvisionnement', 'vente_credit', 'echange', 'transaction', 'electronic']
+MOUVEMENT_TYPES = ['vente_credit', 'emprunt', 'pret', 'depot', 'retrait_admin', 'autre']
+DEPOT_TYPES = ['depot', 'retrait']
+DEVISES = ['CDF', 'USD']
+
+def generate_dataset(rows, shops=10, clients=None, days=365, seed=0, start_date='2024-01-01'):
+    """Génère opérations, dépôts, clients et mouvements avec les champs des documents Firestore
+    
+    rows: nombre de documents par collection datée; clients: par défaut rows / 50
+    Les dates et createdAt sont des chaînes, comme à la sortie de Firestore (le schéma les convertit).
+    """
+    rng = np.random.default_rng(seed)
+    clients = clients or max(1, rows // 50)
+    shop_ids = np.array([f"shop{index:03d}" for index in range(shops)])
+    client_ids = np.array([f"client{index:06d}" for index in range(clients)])
+    start = np.datetime64(start_date, 's')
+    
+    def timestamps(count):
+        # Horodatages triés répartis sur la période
+        offsets = np.sort(rng.integers(0, days * 86400, count))
+        created = start + offsets.astype('timedelta64[s]')
+        return (
+            np.datetime_as_string(created.astype('datetime64[D]')),
+            np.char.add(np.datetime_as_string(created, unit='s'), 'Z')
+        )
+    
+    def dated(prefix, count):
+        date, created = timestamps(count)
+        return {
+            'id': np.char.add(prefix, np.arange(count).astype(str)),
+            'date': date,
+            'createdAt': created,
+            'shopId': shop_ids[rng.integers(0, shops, count)]
+        }
+    
+    operations = pd.DataFrame({
+        **dated('op', rows),
+        'type': np.array(OPERATION_TYPES)[rng.integers(0, len(OPERATION_TYPES), rows)],
+        'devise': np.array(DEVISES)[rng.integers(0, len(DEVISES), rows)],
+        'total_general': rng.gamma(2.0, 150.0, rows).round(2)
+    })
+    
+    depots = pd.DataFrame({
+        **dated('dp', rows),
+        'clientId': client_ids[rng.integers(0, clients, rows)],
+        'type': np.array(DEPOT_TYPES)[rng.integers(0, len(DEPOT_TYPES), rows)],
+        'devise': np.array(DEVISES)[rng.integers(0, len(DEVISES), rows)],
+        'montant': rng.gamma(2.0, 50.0, rows).round(2)
+    })
+    
+    mouvements = pd.DataFrame({
+        **dated('mv', rows),
+        'type': np.array(MOUVEMENT_TYPES)[rng.integers(0, len(MOUVEMENT_TYPES), rows)],
+        'devise': np.array(DEVISES)[rng.integers(0, len(DEVISES), rows)],
+        'montant': rng.gamma(2.0, 40.0, rows).round(2)
+    })
+    
+    _, clients_created = timestamps(clients)
+    clients_df = pd.DataFrame({
+        'id': client_ids,
+        'nom': np.char.add('Client ', np.arange(clients).astype(str)),
+        'shopId': shop_ids[rng.integers(0, shops, clients)],
+        'createdAt': clients_created
+    })
+    
+    return {
+        'operations': operations,
+        'depots': depots,
+        'clients': clients_df,
+        'mouvements': mouvements
+    }
+
+class _OfflineQuery:
+    """Requête Firestore sans résultat: le snapshot local est déjà à jour"""
+    
+    def where(self, *args, **kwargs):
+        return self
+    
+    def select(self, *args, **kwargs):
+        return self
+    
+    def order_by(self, *args, **kwargs):
+        return self
+    
+    def limit(self, *args, **kwargs):
+        return self
+    
+    def start_after(self, *args, **kwargs):
+        return self
+    
+    def stream(self):
+        return iter(())
+
+class OfflineFirestore:
+    """Client Firestore minimal pour DataExtractor en mode snapshot, sans credentials"""
+    
+    def collection(self, name):
+        return _OfflineQuery()
+
+def seed_snapshot(dataset, snapshot_dir):
+    """Écrit le jeu synthétique dans un snapshot local, avec son watermark (aucune synchro à faire)"""
+    store = SnapshotStore(snapshot_dir)
+    for collection, df in dataset.items():
+        store.save(collection, df, df['createdAt'].max() if not df.empty else None)
+    return store
+
+def iter_snapshot_chunks(store, collection, chunk_size=RAW_SHEET_CHUNK_SIZE):
+    """Relit un snapshot par blocs (équivalent hors ligne de DataExtractor.iter_collection)"""
+    import pyarrow.parquet as pq
+    
+    parquet_file = pq.ParquetFile(store._data_path(collection))
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        chunk, _ = apply_schema(collection, batch.to_pandas())
+        yield chunk
+
+class _RssSampler:
+    """Échantillonne la mémoire résidente du processus pendant une étape (pic au-dessus du niveau de départ)"""
+    
+    STATM = '/proc/self/statm'
+    
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.available = os.path.exists(self.STATM)
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if self.available else 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.start_rss = self.peak_rss = 0
+    
+    def _rss(self):
+        with open(self.STATM) as f:
+            return int(f.read().split()[1]) * self.page_size
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self._rss())
+    
+    def __enter__(self):
+        if self.available:
+            self.start_rss = self.peak_rss = self._rss()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self.peak_rss = max(self.peak_rss, self._rss())
+    
+    @property
+    def peak_mb(self):
+        if not self.available:
+            return None
+        return round((self.peak_rss - self.start_rss) / 1024 / 1024, 1)
+
+def measure(results, stage, func, trace_memory=True):
+    """Exécute une étape en mesurant sa durée et son pic de mémoire résidente (Linux: /proc/self/statm)"""
+    sampler = _RssSampler() if trace_memory else None
+    started = time.perf_counter()
+    try:
+        if sampler:
+            with sampler:
+                value = func()
+        else:
+            value = func()
+        error = None
+    except Exception as e:
+        value, error = None, str(e)
+    seconds = time.perf_counter() - started
+    
+    results[stage] = {
+        'seconds': round(seconds, 4),
+        'peak_mb': sampler.peak_mb if sampler else None,
+        'error': error
+    }
+    status = f"❌ {error}" if error else "✅"
+    memory = f", pic +{results[stage]['peak_mb']} Mo" if results[stage]['peak_mb'] is not None else ""
+    print(f"  {status} {stage}: {seconds:.3f}s{memory}")
+    return value
+
+def run_analysis(data):
+    """Toutes les analyses de DataAnalyzer, avec les groupements partagés"""
+    analyzer = DataAnalyzer()
+    operations_df, depots_df = data['operations'], data['depots']
+    clients_df, mouvements_df = data['clients'], data['mouvements']
+    aggregates = DatasetAggregates(operations_df, depots_df, mouvements_df)
+    
+    analyzer.generate_summary_stats(operations_df, depots_df, clients_df, mouvements_df, aggregates)
+    for period in ('day', 'month'):
+        analyzer.analyze_sales_performance(operations_df, period, aggregates)
+    analyzer.analyze_stock_movements(mouvements_df, operations_df, aggregates)
+    analyzer.analyze_client_behavior(clients_df, depots_df, aggregates)
+    analyzer.calculate_benefits(operations_df, mouvements_df, aggregates)
+    analyzer.analyze_sales_trends(operations_df, aggregates=aggregates)
+    return aggregates
+
+def run_benchmark(rows, shops=10, report_types=REPORT_TYPES, seed=0, trace_memory=True, work_dir=None):
+    """Mesure chaque étape du pipeline pour une taille de jeu de données; retourne le dictionnaire des résultats"""
+    work_dir = work_dir or tempfile.mkdtemp(prefix='analytics_bench_')
+    snapshot_dir = os.path.join(work_dir, 'snapshot')
+    stages = {}
+    
+    print(f"\n📏 Benchmark: {rows} lignes par collection, {shops} shops")
+    
+    try:
+        dataset = measure(stages, 'generate', lambda: generate_dataset(rows, shops, seed=seed), trace_memory)
+        store = measure(stages, 'seed_snapshot', lambda: seed_snapshot(dataset, snapshot_dir), trace_memory)
+        del dataset
+        
+        extractor = DataExtractor(use_snapshot=True, snapshot_dir=snapshot_dir, db=OfflineFirestore())
+        generator = ExcelGenerator.__new__(ExcelGenerator)  # pas de bucket Storage hors ligne
+        
+        for report_type in report_types:
+            kind = 'full' if report_type == 'full' else 'summary'
+            prefix = f"{report_type}."
+            filename = os.path.join(work_dir, f"{report_type}.xlsx")
+            
+            data = measure(stages, prefix + 'extract', lambda: extractor.extract_all(fields=REPORT_FIELDS[kind]), trace_memory)
+            if data is None:
+                continue
+            
+            if report_type == 'rollup':
+                rollups = measure(stages, prefix + 'analyze', lambda: {
+                    collection: compute_rollup(collection, data[collection]) for collection in ROLLUP_SPECS
+                }, trace_memory)
+                measure(stages, prefix + 'excel', lambda: generator.create_rollup_report(
+                    rollups['operations'], rollups['depots'], rollups['mouvements'], filename
+                ), trace_memory)
+                continue
+            
+            aggregates = measure(stages, prefix + 'analyze', lambda: run_analysis(data), trace_memory)
+            
+            if report_type == 'full' and max(len(data['operations']), len(data['depots'])) >= EXCEL_MAX_ROWS:
+                print(f"  ⏭️ {report_type}.excel ignoré: au-delà de {EXCEL_MAX_ROWS} lignes (utiliser 'streaming')")
+                continue
+            
+            if report_type == 'streaming':
+                raw_chunks = {
+                    'operations': iter_snapshot_chunks(store, 'operations'),
+                    'depots': iter_snapshot_chunks(store, 'depots')
+                }
+                measure(stages, prefix + 'excel', lambda: generator.create_sales_report(
+                    data['operations'], data['depots'], data['clients'], data['mouvements'], filename,
+                    constant_memory=True, raw_chunks=raw_chunks, aggregates=aggregates
+                ), trace_memory)
+            else:
+                measure(stages, prefix + 'excel', lambda: generator.create_sales_report(
+                    data['operations'], data['depots'], data['clients'], data['mouvements'], filename,
+                    include_raw_data=report_type == 'full', aggregates=aggregates
+                ), trace_memory)
+            
+            if os.path.exists(filename):
+                stages[prefix + 'excel']['file_mb'] = round(os.path.getsize(filename) / 1024 / 1024, 2)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    return {'rows': rows, 'shops': shops, 'stages': stages}
+
+# Sonde de démarrage: import du serveur API puis première réponse de /api/health
+STARTUP_PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import api_server
+imported = time.perf_counter()
+response = api_server.app.test_client().get('/api/health')
+answered = time.perf_counter()
+sys.stdout.write('\\nSTARTUP ' + json.dumps({
+    'import': imported - started, 'health': answered - started, 'status': response.status_code
+}) + '\\n')
+"""
+
+# Modes de démarrage comparés (variables d'environnement du serveur)
+STARTUP_MODES = {
+    'fast': {'ANALYTICS_FAST_START': '1', 'ANALYTICS_FIREBASE_INIT': 'background'},
+    'eager': {'ANALYTICS_FAST_START': '0'}
+}
+
+def run_startup_benchmark(repeats=5):
+    """Temps jusqu'à la première réponse de /api/health, dans un nouveau processus par essai
+    
+    Mesure l'import du serveur et la réponse de health (dans le processus), et le temps total
+    vu de l'extérieur (démarrage de l'interpréteur compris), médiane sur `repeats` essais.
+    """
+    server_dir = os.path.dirname(os.path.abspath(__file__))
+    stages = {}
+    
+    print(f"\n🚀 Benchmark de démarrage: {repeats} essais par mode")
+    
+    for mode, mode_env in STARTUP_MODES.items():
+        samples = {'import': [], 'health': [], 'process': []}
+        with tempfile.TemporaryDirectory(prefix='analytics_startup_') as tmp_dir:
+            env = dict(os.environ, REPORT_JOBS_DB=os.path.join(tmp_dir, 'jobs.sqlite3'), **mode_env)
+            for _ in range(repeats):
+                started = time.perf_counter()
+                completed = subprocess.run(
+                    [sys.executable, '-c', STARTUP_PROBE], cwd=server_dir, env=env,
+                    capture_output=True, text=True, timeout=300
+                )
+                elapsed = time.perf_counter() - started
+                lines = [line for line in completed.stdout.splitlines() if line.startswith('STARTUP ')]
+                if completed.returncode != 0 or not lines:
+                    raise RuntimeError(f"Échec de la sonde de démarrage ({mode}): {completed.stderr[-500:]}")
+                probe = json.loads(lines[-1][len('STARTUP '):])
+                samples['import'].append(probe['import'])
+                samples['health'].append(probe['health'])
+                samples['process'].append(elapsed)
+        
+        for name, values in samples.items():
+            stage = f"startup.{mode}.{name}"
+            stages[stage] = {'seconds': round(statistics.median(values), 4), 'peak_mb': None, 'error': None}
+            print(f"  ✅ {stage}: {stages[stage]['seconds']:.3f}s (médiane)")
+    
+    return {'rows': 0, 'shops': 0, 'stages': stages}
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """Compare deux exécutions étape par étape; retourne la liste des régressions au-delà de la tolérance"""
+    baseline_runs = {(run['rows'], run['shops']): run for run in baseline.get('runs', [])}
+    regressions = []
+    
+    print(f"\n📊 Comparaison avec la référence ({baseline.get('label')}, {baseline.get('createdAt')}):")
+    for run in results['runs']:
+        reference = baseline_runs.get((run['rows'], run['shops']))
+        if reference is None:
+            continue
+        print(f"  {run['rows']} lignes, {run['shops']} shops:" if run['rows'] else "  démarrage:")
+        for stage, current in run['stages'].items():
+            previous = reference['stages'].get(stage)
+            if not previous or current['error'] or previous['error'] or not previous['seconds']:
+                continue
+            ratio = current['seconds'] / previous['seconds']
+            flag = "🔴" if ratio > 1 + tolerance else ("🟢" if ratio < 1 - tolerance else "⚪")
+            print(f"    {flag} {stage}: {previous['seconds']:.3f}s → {current['seconds']:.3f}s (x{ratio:.2f})")
+            if ratio > 1 + tolerance:
+                regressions.append((run['rows'], run['shops'], stage, ratio))
+    
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark hors ligne du pipeline de rapports Shop Ararat')
+    parser.add_argument('--rows', type=int, nargs='+',
+                       help='Nombre de lignes par collection (plusieurs tailles possibles, 10k à 10M; défaut: 10000 100000)')
+    parser.add_argument('--shops', type=int, default=10,
+                       help='Nombre de shops')
+    parser.add_argument('--reports', nargs='+', choices=REPORT_TYPES, default=list(REPORT_TYPES),
+                       help='Types de rapport mesurés')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Graine du générateur')
+    parser.add_argument('--no-memory', action='store_true',
+                       help='Ne pas mesurer la mémoire résidente')
+    parser.add_argument('--startup', action='store_true',
+                       help='Mesurer le démarrage du serveur API (seul, sauf si --rows est donné)')
+    parser.add_argument('--startup-repeats', type=int, default=5,
+                       help='Nombre de démarrages mesurés par mode')
+    parser.add_argument('--label', type=str,
+                       help='Nom de l\'exécution (fichier de résultats)')
+    parser.add_argument('--baseline', type=str,
+                       help='Fichier de résultats de référence à comparer')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                       help='Ralentissement toléré avant de signaler une régression (0.2 = +20%%)')
+    
+    args = parser.parse_args(argv)
+    
+    label = args.label or datetime.now().strftime("%Y%m%d_%H%M%S")
+    rows = args.rows or ([] if args.startup else [10000, 100000])
+    results = {
+        'label': label,
+        'createdAt': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'cpus': os.cpu_count(),
+        'runs': [
+            run_benchmark(row_count, args.shops, args.reports, args.seed, not args.no_memory)
+            for row_count in rows
+        ]
+    }
+    if args.startup:
+        results['runs'].append(run_startup_benchmark(args.startup_repeats))
+    
+    if not os.path.exists(BENCHMARK_DIR):
+        os.makedirs(BENCHMARK_DIR)
+    path = os.path.join(BENCHMARK_DIR, f"{label}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Résultats enregistrés: {path}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"⚠️ {len(regressions)} étape(s) plus lente(s) que la référence")
+            return 1
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
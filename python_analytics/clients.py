@@ -0,0 +1,152 @@
+import os
+import threading
+from config import get_firestore_client, get_storage_client
+from metrics import REGISTRY
+
+# Intervalle du keep-alive des clients ouverts (secondes, 0 = désactivé)
+CLIENT_KEEPALIVE_SECONDS = float(os.environ.get('ANALYTICS_CLIENT_KEEPALIVE', 240))
+
+# Erreurs de transport qui justifient une reconnexion (par nom de classe: google.api_core, grpc et requests
+# ne sont pas importés ici)
+TRANSIENT_ERRORS = {
+    'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError', 'GatewayTimeout', 'RetryError',
+    'TransportError', 'ConnectionError', 'ConnectionResetError', 'BrokenPipeError', 'TimeoutError',
+    'ChunkedEncodingError', 'RefreshError'
+}
+
+CLIENT_CONNECTIONS = REGISTRY.counter(
+    'analytics_client_connections', "Clients Firestore/Storage créés (première connexion et reconnexions)", ['client']
+)
+
+def is_transient_error(error):
+    """Vrai si l'erreur (ou sa cause) vient du transport et non de la requête elle-même"""
+    while error is not None:
+        if any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+def _ping_firestore(db):
+    return list(db.collection('shops').limit(1).stream())
+
+def _ping_storage(bucket):
+    return bucket.exists()
+
+class ClientRegistry:
+    """Un client Firestore et un bucket Storage par processus, partagés entre requêtes et threads
+    
+    Les clients sont créés au premier usage, remplacés après une erreur de transport et gardés
+    actifs par un ping périodique (start_keepalive).
+    """
+    
+    FACTORIES = {'firestore': get_firestore_client, 'storage': get_storage_client}
+    PINGS = {'firestore': _ping_firestore, 'storage': _ping_storage}
+    
+    def __init__(self, keepalive_seconds=CLIENT_KEEPALIVE_SECONDS):
+        self.keepalive_seconds = keepalive_seconds
+        self._clients = {}
+        # Nombre de connexions par client: au-delà de la première, on demande un client neuf
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keepalive_thread = None
+    
+    def get(self, kind):
+        """Client partagé ('firestore' ou 'storage'), créé au premier appel"""
+        client = self._clients.get(kind)
+        if client is not None:
+            return client
+        
+        with self._lock:
+            client = self._clients.get(kind)
+            if client is None:
+                client = self.FACTORIES[kind](fresh=self._connections.get(kind, 0) > 0)
+                self._clients[kind] = client
+                self._connections[kind] = self._connections.get(kind, 0) + 1
+                CLIENT_CONNECTIONS.inc(client=kind)
+            return client
+    
+    def firestore(self):
+        return self.get('firestore')
+    
+    def bucket(self):
+        return self.get('storage')
+    
+    def reconnect(self, kind, client=None):
+        """Abandonne le client courant: le prochain get() en crée un nouveau
+        
+        client: client en échec; ignoré s'il a déjà été remplacé (plusieurs threads en erreur en même temps)
+        """
+        with self._lock:
+            current = self._clients.get(kind)
+            if current is None or (client is not None and client is not current):
+                return False
+            del self._clients[kind]
+        print(f"🔌 Client {kind} réinitialisé, reconnexion au prochain accès")
+        return True
+    
+    def report_failure(self, kind, error, client=None):
+        """Signale une erreur: reconnexion si elle vient du transport. Retourne True si c'est le cas"""
+        if not is_transient_error(error):
+            return False
+        self.reconnect(kind, client)
+        return True
+    
+    def call(self, kind, func, retries=1):
+        """Exécute func(client), avec reconnexion et nouvel essai après une erreur de transport"""
+        for attempt in range(retries + 1):
+            client = self.get(kind)
+            try:
+                return func(client)
+            except Exception as e:
+                if attempt == retries or not self.report_failure(kind, e, client):
+                    raise
+    
+    def ping(self):
+        """Requête minimale sur chaque client ouvert (garde les connexions actives, détecte les coupures)"""
+        with self._lock:
+            kinds = list(self._clients)
+        for kind in kinds:
+            try:
+                self.call(kind, self.PINGS[kind])
+            except Exception as e:
+                print(f"⚠️ Keep-alive {kind} en échec: {e}")
+    
+    def start_keepalive(self, interval=None):
+        """Démarre le thread de keep-alive (sans effet s'il tourne déjà ou si l'intervalle vaut 0)"""
+        interval = self.keepalive_seconds if interval is None else interval
+        if interval <= 0 or (self._keepalive_thread and self._keepalive_thread.is_alive()):
+            return
+        self._stop.clear()
+        
+        def loop():
+            while not self._stop.wait(interval):
+                self.ping()
+        
+        self._keepalive_thread = threading.Thread(target=loop, name="client-keepalive", daemon=True)
+        self._keepalive_thread.start()
+    
+    def stop_keepalive(self):
+        self._stop.set()
+    
+    def status(self):
+        """État de chaque client: connexions ouvertes depuis le démarrage et client actif ou non"""
+        with self._lock:
+            return {
+                kind: {'connected': kind in self._clients, 'connections': self._connections.get(kind, 0)}
+                for kind in self.FACTORIES
+            }
+    
+    def _after_fork(self):
+        # Les canaux gRPC/HTTP ne survivent pas à un fork: le processus enfant ouvre les siens
+        self._clients = {}
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._keepalive_thread = None
+
+# Registre du processus
+CLIENTS = ClientRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=CLIENTS._after_fork)
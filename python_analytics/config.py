@@ -1,6 +1,17 @@
 import os
 import json
-from firebase_admin import credentials, initialize_app, storage, firestore
+import threading
+
+# Backend de données: 'firebase' (projet réel) ou 'local' (SQLite + dossier, voir local_backend.py)
+ANALYTICS_BACKEND = os.environ.get('ANALYTICS_BACKEND', 'firebase')
+
+def use_local_backend():
+    """Vrai si le pipeline tourne sur le backend local (sans credentials ni quota Firebase)"""
+    return ANALYTICS_BACKEND == 'local'
+
+# État de l'initialisation Firebase (firebase_admin n'est importé qu'au premier usage)
+_firebase_lock = threading.Lock()
+_firebase_state = {'ready': False, 'error': None}
 
 # Configuration Firebase - Utilise les variables d'environnement
 def get_firebase_config():
@@ -33,39 +44,93 @@ def load_firebase_config_from_file(file_path="firebase-credentials.json"):
 
 # Initialiser Firebase
 def initialize_firebase():
-    """Initialise la connexion Firebase"""
-    try:
-        # Récupérer la configuration
-        firebase_config = get_firebase_config()
-        if not firebase_config:
-            print("❌ Impossible de récupérer la configuration Firebase")
-            return False
+    """Initialise la connexion Firebase (une seule fois par processus, appels suivants sans effet)"""
+    if use_local_backend():
+        from local_backend import initialize_local_backend
+        return initialize_local_backend()
+    
+    with _firebase_lock:
+        if _firebase_state['ready']:
+            return True
+        
+        try:
+            from firebase_admin import credentials, initialize_app
             
-        cred = credentials.Certificate(firebase_config)
-        initialize_app(cred, {
-            'storageBucket': 'shop-ararat-projet.firebasestorage.app'  # Bucket corrigé
-        })
-        print("✅ Firebase initialisé avec succès")
-        return True
-    except Exception as e:
-        print(f"❌ Erreur d'initialisation Firebase: {e}")
-        print("💡 Vérifiez que vos credentials sont corrects")
-        return False
+            # Récupérer la configuration
+            firebase_config = get_firebase_config()
+            if not firebase_config:
+                print("❌ Impossible de récupérer la configuration Firebase")
+                print_setup_instructions()
+                _firebase_state['error'] = "Configuration Firebase introuvable"
+                return False
+            
+            cred = credentials.Certificate(firebase_config)
+            initialize_app(cred, {
+                'storageBucket': 'shop-ararat-projet.firebasestorage.app'  # Bucket corrigé
+            })
+            _firebase_state.update(ready=True, error=None)
+            print("✅ Firebase initialisé avec succès")
+            return True
+        except Exception as e:
+            _firebase_state['error'] = str(e)
+            print(f"❌ Erreur d'initialisation Firebase: {e}")
+            print("💡 Vérifiez que vos credentials sont corrects")
+            return False
+
+def firebase_status():
+    """'ready', 'failed' (dernière tentative en erreur) ou 'pending' (pas encore initialisé)"""
+    if use_local_backend() or _firebase_state['ready']:
+        return 'ready'
+    return 'failed' if _firebase_state['error'] else 'pending'
 
 # Obtenir les instances
-def get_firestore_client():
-    """Retourne le client Firestore"""
+def get_firestore_client(fresh=False):
+    """Retourne le client Firestore
+    
+    fresh: nouveau client (nouveau canal gRPC) au lieu de celui mis en cache par firebase_admin,
+    pour se reconnecter après une erreur de transport (voir clients.py)
+    """
+    if use_local_backend():
+        from local_backend import get_local_firestore
+        return get_local_firestore()
+    
+    # Initialisation paresseuse: premier accès sans initialize_firebase() préalable
+    initialize_firebase()
+    if fresh:
+        from firebase_admin import get_app
+        from google.cloud import firestore as cloud_firestore
+        app = get_app()
+        return cloud_firestore.Client(project=app.project_id, credentials=app.credential.get_credential())
+    
+    from firebase_admin import firestore
     return firestore.client()
 
-def get_storage_client():
-    """Retourne le bucket Storage - Version corrigée"""
+def get_storage_client(fresh=False):
+    """Retourne le bucket Storage - Version corrigée
+    
+    fresh: bucket porté par un nouveau client Storage (nouvelle session HTTP)
+    """
+    if use_local_backend():
+        from local_backend import get_local_bucket
+        return get_local_bucket()
+    
+    initialize_firebase()
+    if fresh:
+        from firebase_admin import get_app
+        from google.cloud import storage as cloud_storage
+        app = get_app()
+        client = cloud_storage.Client(project=app.project_id, credentials=app.credential.get_credential())
+        return client.bucket(app.options.get('storageBucket'))
+    
+    from firebase_admin import storage
     return storage.bucket()
 
-# Instructions pour l'utilisateur
-print("🔧 Configuration Firebase")
-print("=" * 40)
-print("Pour configurer Firebase :")
-print("1. Configurez la variable d'environnement FIREBASE_CONFIG avec votre JSON")
-print("2. Ou placez le fichier JSON dans ce dossier sous le nom 'firebase-credentials.json'")
-print("3. Relancez le script")
-print("=" * 40) 
\ No newline at end of file
+# Instructions pour l'utilisateur (affichées quand la configuration est introuvable)
+def print_setup_instructions():
+    print("🔧 Configuration Firebase")
+    print("=" * 40)
+    print("Pour configurer Firebase :")
+    print("1. Configurez la variable d'environnement FIREBASE_CONFIG avec votre JSON")
+    print("2. Ou placez le fichier JSON dans ce dossier sous le nom 'firebase-credentials.json'")
+    print("3. Relancez le script")
+    print("=" * 40) 
\ No newline at end of file
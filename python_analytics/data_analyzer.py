@@ -2,78 +2,116 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
+from aggregations import DatasetAggregates, AggregateState
+from timeseries import SalesTimeSeries, calendar_change
+from sketches import estimate_distinct, estimate_quantiles, period_key, HLL_PRECISION, QUANTILE_RELATIVE_ERROR
+from metrics import ANALYZER_SECONDS
 
 class DataAnalyzer:
     """Classe pour analyser les données extraites"""
     
-    def __init__(self):
-        pass
+    def __init__(self, state=None):
+        # État agrégé incrémental (AggregateState), alimenté par update_state et lu par refresh
+        self.state = state
     
-    def analyze_sales_performance(self, operations_df, period='month'):
+    def _aggregates(self, aggregates, operations_df=None, depots_df=None, mouvements_df=None):
+        """Groupements partagés: ceux fournis par l'appelant, sinon calculés pour ces données"""
+        if aggregates is not None:
+            return aggregates
+        return DatasetAggregates(operations_df, depots_df, mouvements_df)
+    
+    @staticmethod
+    def _row_count(df, aggregates, collection):
+        """Nombre de lignes: DataFrame fourni, sinon compteur des agrégats (DataFrame None avec un état agrégé)"""
+        if df is not None:
+            return len(df)
+        return aggregates.row_count(collection) if aggregates is not None else 0
+    
+    def update_state(self, operations_df=None, depots_df=None, clients_df=None, mouvements_df=None):
+        """Intègre de nouvelles lignes à l'état agrégé; seules ces lignes sont agrégées"""
+        self.state = (self.state or AggregateState()).update(operations_df, depots_df, clients_df, mouvements_df)
+        return self.state
+    
+    def refresh(self):
+        """Statistiques, comportement client et bénéfices recalculés depuis l'état agrégé (sans données brutes)"""
+        aggregates = (self.state or AggregateState()).aggregates()
+        return {
+            'summary': self.generate_summary_stats(None, None, None, None, aggregates),
+            'clients': self.analyze_client_behavior(None, None, aggregates),
+            'benefits': self.calculate_benefits(None, None, aggregates)
+        }
+    
+    @ANALYZER_SECONDS.time(method='analyze_sales_performance')
+    def analyze_sales_performance(self, operations_df, period='month', aggregates=None):
         """Analyse les performances de vente"""
         if operations_df.empty:
             return pd.DataFrame()
         
         try:
-            # Grouper par période
-            if period == 'day':
-                operations_df['period'] = operations_df['date'].dt.date
-            elif period == 'week':
-                operations_df['period'] = operations_df['date'].dt.to_period('W')
-            elif period == 'month':
-                operations_df['period'] = operations_df['date'].dt.to_period('M')
-            elif period == 'year':
-                operations_df['period'] = operations_df['date'].dt.to_period('Y')
+            # Grouper par période (dérivé des ventes par jour et shop)
+            grouped = self._aggregates(aggregates, operations_df=operations_df).operations_by_period(period)
             
             # Calculer les métriques
-            analysis = operations_df.groupby('period').agg({
-                'total_general': ['sum', 'mean', 'count'],
-                'shopId': 'nunique'
-            }).round(2)
+            analysis = grouped[['sum', 'mean', 'count', 'shops']].round(2)
             
             # Renommer les colonnes
             analysis.columns = ['total_ventes', 'moyenne_ventes', 'nombre_operations', 'nombre_shops']
             
-            # Calculer les variations
-            analysis['variation_ventes'] = analysis['total_ventes'].pct_change() * 100
+            # Calculer les variations (par rapport à la période calendaire précédente)
+            analysis['variation_ventes'] = calendar_change(analysis['total_ventes'])
             
             # Ajouter des métriques supplémentaires
             analysis['benefice_estime'] = analysis['total_ventes'] * 0.15  # 15% de marge estimée
             
             print(f"✅ Analyse des ventes par {period} terminée")
             return analysis
-            
+        
         except Exception as e:
             print(f"❌ Erreur analyse ventes: {e}")
             return pd.DataFrame()
     
-    def analyze_stock_movements(self, mouvements_df, operations_df):
+    @ANALYZER_SECONDS.time(method='analyze_sales_trends')
+    def analyze_sales_trends(self, operations_df, start_date=None, end_date=None, shop_id=None, aggregates=None):
+        """Tendances journalières par shop et au total ('all'): moyennes glissantes 7/30 jours,
+        cumuls du mois et de l'année, comparaison au même jour de l'année précédente
+        
+        start_date / end_date: jours affichés; les opérations antérieures (historique) servent aux calculs
+        """
+        if operations_df.empty:
+            return pd.DataFrame()
+        
+        try:
+            series = self._aggregates(aggregates, operations_df=operations_df).operations_timeseries()
+            trends = series.to_frame(start_date, end_date, shop_id, decimals=2)
+            
+            print(f"✅ Tendances des ventes calculées ({len(series.shops)} shops, {len(series.calendar)} jours)")
+            return trends
+        
+        except Exception as e:
+            print(f"❌ Erreur tendances ventes: {e}")
+            return pd.DataFrame()
+    
+    @ANALYZER_SECONDS.time(method='analyze_stock_movements')
+    def analyze_stock_movements(self, mouvements_df, operations_df, aggregates=None):
         """Analyse les mouvements de stock"""
         if mouvements_df.empty:
             return pd.DataFrame()
         
         try:
+            aggregates = self._aggregates(aggregates, operations_df=operations_df, mouvements_df=mouvements_df)
+            
             # Analyser les mouvements par type
-            mouvements_analysis = mouvements_df.groupby(['type', 'devise']).agg({
-                'montant': ['sum', 'count', 'mean']
-            }).round(2)
+            mouvements_analysis = aggregates.mouvements_by_type()[['sum', 'count', 'mean']].round(2)
             
             mouvements_analysis.columns = ['total_montant', 'nombre_mouvements', 'moyenne_montant']
             
             # Analyser par shop
-            mouvements_by_shop = mouvements_df.groupby('shopId').agg({
-                'montant': ['sum', 'count'],
-                'type': 'nunique'
-            }).round(2)
+            mouvements_by_shop = aggregates.mouvements_by_shop()[['sum', 'count', 'types']].round(2)
             
             mouvements_by_shop.columns = ['total_montant', 'nombre_mouvements', 'types_differents']
             
             # Analyser les tendances temporelles
-            mouvements_df['month'] = mouvements_df['date'].dt.to_period('M')
-            mouvements_trend = mouvements_df.groupby('month').agg({
-                'montant': 'sum',
-                'type': 'count'
-            }).round(2)
+            mouvements_trend = aggregates.mouvements_by_month()[['sum', 'count']].round(2)
             
             mouvements_trend.columns = ['total_montant_mensuel', 'nombre_mouvements_mensuel']
             
@@ -85,22 +123,26 @@ class DataAnalyzer:
             
             print("✅ Analyse des mouvements de stock terminée")
             return result
-            
+        
         except Exception as e:
             print(f"❌ Erreur analyse mouvements: {e}")
             return {}
     
-    def analyze_client_behavior(self, clients_df, depots_df):
-        """Analyse le comportement des clients"""
-        if clients_df.empty or depots_df.empty:
+    @ANALYZER_SECONDS.time(method='analyze_client_behavior')
+    def analyze_client_behavior(self, clients_df, depots_df, aggregates=None):
+        """Analyse le comportement des clients
+        
+        clients_df / depots_df à None: calcul depuis `aggregates` seul (état agrégé, voir refresh)
+        """
+        if not self._row_count(clients_df, aggregates, 'clients') or not self._row_count(depots_df, aggregates, 'depots'):
             return pd.DataFrame()
         
         try:
+            aggregates = self._aggregates(aggregates, depots_df=depots_df)
+            
             # Analyser les dépôts par client
-            client_analysis = depots_df.groupby('clientId').agg({
-                'montant': ['sum', 'count', 'mean'],
-                'date': ['min', 'max']
-            }).round(2)
+            client_analysis = aggregates.depots_by_client()[['sum', 'count', 'mean', 'first', 'last']].copy()
+            client_analysis[['sum', 'mean']] = client_analysis[['sum', 'mean']].round(2)
             
             client_analysis.columns = [
                 'total_depots', 'nombre_depots', 'moyenne_depot',
@@ -113,11 +155,7 @@ class DataAnalyzer:
             ).dt.days / client_analysis['nombre_depots']
             
             # Analyser par shop
-            client_by_shop = depots_df.groupby('shopId').agg({
-                'clientId': 'nunique',
-                'montant': ['sum', 'mean'],
-                'date': 'count'
-            }).round(2)
+            client_by_shop = aggregates.depots_by_shop()[['clients', 'sum', 'mean', 'count']].round(2)
             
             client_by_shop.columns = [
                 'nombre_clients_uniques', 'total_depots', 'moyenne_depot', 'nombre_transactions'
@@ -134,35 +172,38 @@ class DataAnalyzer:
             
             print("✅ Analyse du comportement client terminée")
             return result
-            
+        
         except Exception as e:
             print(f"❌ Erreur analyse clients: {e}")
             return {}
     
-    def calculate_benefits(self, operations_df, mouvements_df):
-        """Calcule les bénéfices"""
-        if operations_df.empty:
+    @ANALYZER_SECONDS.time(method='calculate_benefits')
+    def calculate_benefits(self, operations_df, mouvements_df, aggregates=None):
+        """Calcule les bénéfices
+        
+        operations_df / mouvements_df à None: calcul depuis `aggregates` seul (état agrégé, voir refresh)
+        """
+        if not self._row_count(operations_df, aggregates, 'operations'):
             return pd.DataFrame()
         
         try:
+            aggregates = self._aggregates(aggregates, operations_df=operations_df, mouvements_df=mouvements_df)
+            
             # Calculer les bénéfices par jour
-            daily_benefits = operations_df.groupby(operations_df['date'].dt.date).agg({
-                'total_general': 'sum'
-            }).round(2)
+            daily_benefits = aggregates.operations_by_period('day')[['sum']].round(2)
+            daily_benefits.index.name = 'date'
             
             daily_benefits.columns = ['total_ventes_jour']
             
             # Calculer les bénéfices (estimation 15% de marge)
             daily_benefits['benefice_estime'] = daily_benefits['total_ventes_jour'] * 0.15
             
-            # Calculer les variations
-            daily_benefits['variation_ventes'] = daily_benefits['total_ventes_jour'].pct_change() * 100
-            daily_benefits['variation_benefice'] = daily_benefits['benefice_estime'].pct_change() * 100
+            # Calculer les variations (par rapport à la veille)
+            daily_benefits['variation_ventes'] = calendar_change(daily_benefits['total_ventes_jour'])
+            daily_benefits['variation_benefice'] = calendar_change(daily_benefits['benefice_estime'])
             
             # Analyser par shop
-            shop_benefits = operations_df.groupby('shopId').agg({
-                'total_general': ['sum', 'mean', 'count']
-            }).round(2)
+            shop_benefits = aggregates.operations_by_shop()[['sum', 'mean', 'count']].round(2)
             
             shop_benefits.columns = ['total_ventes', 'moyenne_ventes', 'nombre_operations']
             shop_benefits['benefice_estime'] = shop_benefits['total_ventes'] * 0.15
@@ -174,48 +215,249 @@ class DataAnalyzer:
             
             print("✅ Calcul des bénéfices terminé")
             return result
-            
+        
         except Exception as e:
             print(f"❌ Erreur calcul bénéfices: {e}")
             return {}
     
-    def generate_summary_stats(self, operations_df, depots_df, clients_df, mouvements_df):
-        """Génère des statistiques récapitulatives"""
+    @ANALYZER_SECONDS.time(method='generate_summary_stats')
+    def generate_summary_stats(self, operations_df, depots_df, clients_df, mouvements_df, aggregates=None):
+        """Génère des statistiques récapitulatives
+        
+        DataFrames à None: calcul depuis `aggregates` seul (état agrégé, voir refresh)
+        """
         try:
+            aggregates = self._aggregates(aggregates, operations_df, depots_df, mouvements_df)
             summary = {}
             
             # Statistiques générales
-            summary['total_operations'] = len(operations_df)
-            summary['total_depots'] = len(depots_df)
-            summary['total_clients'] = len(clients_df)
-            summary['total_mouvements'] = len(mouvements_df)
+            summary['total_operations'] = self._row_count(operations_df, aggregates, 'operations')
+            summary['total_depots'] = self._row_count(depots_df, aggregates, 'depots')
+            summary['total_clients'] = self._row_count(clients_df, aggregates, 'clients')
+            summary['total_mouvements'] = self._row_count(mouvements_df, aggregates, 'mouvements')
             
             # Montants totaux
-            if not operations_df.empty:
-                summary['total_ventes'] = operations_df['total_general'].sum()
-                summary['moyenne_ventes'] = operations_df['total_general'].mean()
+            if summary['total_operations']:
+                totals = aggregates.operations_totals()
+                summary['total_ventes'] = totals['sum']
+                summary['moyenne_ventes'] = totals['mean']
                 summary['benefice_estime'] = summary['total_ventes'] * 0.15
             
-            if not depots_df.empty:
-                summary['total_depots_montant'] = depots_df['montant'].sum()
-                summary['moyenne_depot'] = depots_df['montant'].mean()
+            if summary['total_depots']:
+                depots_totals = aggregates.depots_totals()
+                summary['total_depots_montant'] = depots_totals['sum']
+                summary['moyenne_depot'] = depots_totals['mean']
             
-            if not mouvements_df.empty:
-                summary['total_mouvements_montant'] = mouvements_df['montant'].sum()
+            if summary['total_mouvements']:
+                summary['total_mouvements_montant'] = aggregates.mouvements_core()['sum'].sum()
             
             # Périodes
-            if not operations_df.empty:
-                summary['periode_debut'] = operations_df['date'].min()
-                summary['periode_fin'] = operations_df['date'].max()
+            if summary['total_operations']:
+                summary['periode_debut'] = totals['first']
+                summary['periode_fin'] = totals['last']
                 summary['nombre_jours'] = (summary['periode_fin'] - summary['periode_debut']).days
             
             # Shops
-            if not operations_df.empty:
-                summary['nombre_shops'] = operations_df['shopId'].nunique()
+            if summary['total_operations']:
+                summary['nombre_shops'] = totals['shops']
             
             print("✅ Statistiques récapitulatives générées")
             return summary
-            
+        
         except Exception as e:
             print(f"❌ Erreur génération statistiques: {e}")
-            return {} 
\ No newline at end of file
+            return {}
+    
+    @ANALYZER_SECONDS.time(method='calculate_benefits_from_rollups')
+    def calculate_benefits_from_rollups(self, operations_rollup):
+        """Calcule les bénéfices depuis les agrégats journaliers (sans relire les opérations)"""
+        if operations_rollup.empty:
+            return {}
+        
+        try:
+            daily_benefits = operations_rollup.groupby('day').agg({
+                'sum': 'sum'
+            }).round(2)
+            
+            daily_benefits.columns = ['total_ventes_jour']
+            daily_benefits.index = daily_benefits.index.date
+            daily_benefits['benefice_estime'] = daily_benefits['total_ventes_jour'] * 0.15
+            daily_benefits['variation_ventes'] = calendar_change(daily_benefits['total_ventes_jour'])
+            daily_benefits['variation_benefice'] = calendar_change(daily_benefits['benefice_estime'])
+            
+            shop_benefits = operations_rollup.groupby('shopId').agg({
+                'sum': 'sum',
+                'count': 'sum'
+            })
+            
+            shop_benefits.columns = ['total_ventes', 'nombre_operations']
+            shop_benefits['moyenne_ventes'] = shop_benefits['total_ventes'] / shop_benefits['nombre_operations']
+            shop_benefits = shop_benefits[['total_ventes', 'moyenne_ventes', 'nombre_operations']].round(2)
+            shop_benefits['benefice_estime'] = shop_benefits['total_ventes'] * 0.15
+            
+            print("✅ Calcul des bénéfices terminé (agrégats)")
+            return {
+                'daily_benefits': daily_benefits,
+                'shop_benefits': shop_benefits
+            }
+        
+        except Exception as e:
+            print(f"❌ Erreur calcul bénéfices (agrégats): {e}")
+            return {}
+    
+    @ANALYZER_SECONDS.time(method='analyze_sales_trends_from_rollups')
+    def analyze_sales_trends_from_rollups(self, operations_rollup, start_date=None, end_date=None, shop_id=None):
+        """Tendances journalières depuis les agrégats journaliers (voir analyze_sales_trends)"""
+        if operations_rollup.empty:
+            return pd.DataFrame()
+        
+        try:
+            trends = SalesTimeSeries(operations_rollup).to_frame(start_date, end_date, shop_id, decimals=2)
+            print("✅ Tendances des ventes calculées (agrégats)")
+            return trends
+        
+        except Exception as e:
+            print(f"❌ Erreur tendances ventes (agrégats): {e}")
+            return pd.DataFrame()
+    
+    @ANALYZER_SECONDS.time(method='analyze_stock_movements_from_rollups')
+    def analyze_stock_movements_from_rollups(self, mouvements_rollup):
+        """Analyse les mouvements de stock depuis les agrégats journaliers"""
+        if mouvements_rollup.empty:
+            return {}
+        
+        try:
+            by_type = mouvements_rollup.groupby(['type', 'devise']).agg({
+                'sum': 'sum',
+                'count': 'sum'
+            })
+            by_type.columns = ['total_montant', 'nombre_mouvements']
+            by_type['moyenne_montant'] = by_type['total_montant'] / by_type['nombre_mouvements']
+            by_type = by_type.round(2)
+            
+            by_shop = mouvements_rollup.groupby('shopId').agg({
+                'sum': 'sum',
+                'count': 'sum',
+                'type': 'nunique'
+            }).round(2)
+            by_shop.columns = ['total_montant', 'nombre_mouvements', 'types_differents']
+            
+            trend = mouvements_rollup.groupby(mouvements_rollup['day'].dt.to_period('M')).agg({
+                'sum': 'sum',
+                'count': 'sum'
+            }).round(2)
+            trend.index.name = 'month'
+            trend.columns = ['total_montant_mensuel', 'nombre_mouvements_mensuel']
+            
+            print("✅ Analyse des mouvements de stock terminée (agrégats)")
+            return {
+                'by_type': by_type,
+                'by_shop': by_shop,
+                'trend': trend
+            }
+        
+        except Exception as e:
+            print(f"❌ Erreur analyse mouvements (agrégats): {e}")
+            return {}
+    
+    @ANALYZER_SECONDS.time(method='generate_summary_stats_from_rollups')
+    def generate_summary_stats_from_rollups(self, operations_rollup, depots_rollup, mouvements_rollup):
+        """Génère les statistiques récapitulatives depuis les agrégats journaliers"""
+        try:
+            summary = {}
+            
+            summary['total_operations'] = int(operations_rollup['count'].sum()) if not operations_rollup.empty else 0
+            summary['total_depots'] = int(depots_rollup['count'].sum()) if not depots_rollup.empty else 0
+            summary['total_mouvements'] = int(mouvements_rollup['count'].sum()) if not mouvements_rollup.empty else 0
+            
+            if not operations_rollup.empty:
+                summary['total_ventes'] = operations_rollup['sum'].sum()
+                summary['moyenne_ventes'] = summary['total_ventes'] / summary['total_operations']
+                summary['benefice_estime'] = summary['total_ventes'] * 0.15
+                summary['periode_debut'] = operations_rollup['day'].min()
+                summary['periode_fin'] = operations_rollup['day'].max()
+                summary['nombre_jours'] = (summary['periode_fin'] - summary['periode_debut']).days
+                summary['nombre_shops'] = operations_rollup['shopId'].nunique()
+            
+            if not depots_rollup.empty:
+                summary['total_depots_montant'] = depots_rollup['sum'].sum()
+                summary['moyenne_depot'] = summary['total_depots_montant'] / summary['total_depots']
+            
+            if not mouvements_rollup.empty:
+                summary['total_mouvements_montant'] = mouvements_rollup['sum'].sum()
+            
+            print("✅ Statistiques récapitulatives générées (agrégats)")
+            return summary
+        
+        except Exception as e:
+            print(f"❌ Erreur génération statistiques (agrégats): {e}")
+            return {}
+    
+    @staticmethod
+    def sketch_error_bounds(precision=HLL_PRECISION, relative_error=QUANTILE_RELATIVE_ERROR):
+        """Erreurs des analyses approchées: erreur type relative des clients distincts, erreur relative des quantiles"""
+        return {
+            'clients_distincts': float(1.04 / np.sqrt(1 << precision)),
+            'quantiles': relative_error
+        }
+    
+    @ANALYZER_SECONDS.time(method='analyze_sales_performance_from_sketches')
+    def analyze_sales_performance_from_sketches(self, operations_quantiles, period='month'):
+        """Analyse approchée des ventes par période depuis les sketches journaliers (mémoire bornée)
+        
+        Nombre d'opérations et de shops exacts; ventes médiane, p90 et p99 à ±QUANTILE_RELATIVE_ERROR près
+        """
+        if operations_quantiles.empty:
+            return pd.DataFrame()
+        
+        try:
+            grouped = operations_quantiles.groupby(period_key(operations_quantiles, period))
+            analysis = pd.DataFrame({
+                'nombre_operations': grouped['count'].sum(),
+                'nombre_shops': grouped['shopId'].nunique()
+            })
+            quantiles = estimate_quantiles(operations_quantiles, by=(period,))
+            quantiles.columns = [f"vente_{column}" for column in quantiles.columns]
+            analysis = analysis.join(quantiles.round(2))
+            
+            print(f"✅ Analyse des ventes par {period} terminée (sketches)")
+            return analysis
+        
+        except Exception as e:
+            print(f"❌ Erreur analyse ventes (sketches): {e}")
+            return pd.DataFrame()
+    
+    @ANALYZER_SECONDS.time(method='analyze_client_behavior_from_sketches')
+    def analyze_client_behavior_from_sketches(self, depots_distinct, depots_quantiles, period='month'):
+        """Analyse approchée des clients depuis les sketches journaliers des dépôts (mémoire bornée)
+        
+        Clients distincts estimés par HyperLogLog (fusion des (shop, jour) de chaque groupe), montants des
+        dépôts résumés par quantiles; bornes d'erreur dans result['erreurs'] (voir sketch_error_bounds)
+        """
+        if depots_quantiles.empty:
+            return {}
+        
+        try:
+            result = {'erreurs': self.sketch_error_bounds()}
+            for name, by in [('by_period', (period,)), ('by_shop', ('shopId',))]:
+                keys = depots_quantiles['shopId'] if name == 'by_shop' else period_key(depots_quantiles, period)
+                analysis = pd.DataFrame({
+                    'clients_uniques_estimes': estimate_distinct(depots_distinct, by),
+                    'nombre_depots': depots_quantiles.groupby(keys, observed=True)['count'].sum()
+                })
+                quantiles = estimate_quantiles(depots_quantiles, by=by)
+                quantiles.columns = [f"depot_{column}" for column in quantiles.columns]
+                result[name] = analysis.join(quantiles.round(2))
+            
+            result['total'] = {
+                'clients_uniques_estimes': estimate_distinct(depots_distinct),
+                'nombre_depots': int(depots_quantiles['count'].sum()),
+                **{f"depot_{q}": round(value, 2) for q, value in estimate_quantiles(depots_quantiles).items()}
+            }
+            
+            print("✅ Analyse du comportement client terminée (sketches)")
+            return result
+        
+        except Exception as e:
+            print(f"❌ Erreur analyse clients (sketches): {e}")
+            return {}
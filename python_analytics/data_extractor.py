@@ -1,155 +1,333 @@
+import os
+import time
 import pandas as pd
 from datetime import datetime, timedelta
-from config import get_firestore_client
+from concurrent.futures import ThreadPoolExecutor
+from clients import CLIENTS
+from snapshot_store import SnapshotStore
+from schemas import apply_schema
+from metrics import FIRESTORE_STREAM_SECONDS, FIRESTORE_DOCUMENTS, DATAFRAME_BUILD_SECONDS
+
+# Nombre de documents lus par page Firestore (mémoire ≈ une page + les colonnes finales)
+PAGE_SIZE = int(os.environ.get('FIRESTORE_PAGE_SIZE', 1000))
 
 class DataExtractor:
     """Classe pour extraire les données depuis Firebase"""
     
-    def __init__(self):
-        self.db = get_firestore_client()
+    def __init__(self, use_snapshot=False, snapshot_dir=None, page_size=None, db=None):
+        # db: client Firestore à utiliser (par défaut le client partagé du processus, voir clients.py)
+        self.db = db or CLIENTS.firestore()
+        self.page_size = page_size or PAGE_SIZE
+        # Mode incrémental: les rapports sont servis depuis un snapshot Parquet local
+        self.use_snapshot = use_snapshot
+        self.snapshot_store = SnapshotStore(snapshot_dir) if use_snapshot else None
+        # Lignes rejetées par la validation de schéma, par collection
+        self.quarantine = {}
+    
+    def _apply_schema(self, collection, df):
+        """Applique le schéma de la collection (dtypes compacts) et met de côté les lignes invalides"""
+        with DATAFRAME_BUILD_SECONDS.time(collection=collection, step='schema'):
+            df, quarantine = apply_schema(collection, df)
+        if not quarantine.empty:
+            self.quarantine[collection] = quarantine
+        return df
+    
+    def _build_query(self, collection, start_date=None, end_date=None, shop_id=None, columns=None):
+        """Construit la requête Firestore filtrée (shop, plage de dates, projection)"""
+        query = self.db.collection(collection)
+        
+        if shop_id and shop_id != 'all':
+            query = query.where('shopId', '==', shop_id)
+        
+        if start_date:
+            query = query.where('date', '>=', start_date)
+        
+        if end_date:
+            query = query.where('date', '<=', end_date)
+        
+        # Le curseur de pagination a besoin du champ de tri dans la projection
+        if columns and (start_date or end_date) and 'date' not in columns:
+            columns = list(columns) + ['date']
+        
+        # Projection: ne transférer que les champs utilisés
+        return self._apply_projection(query, columns)
+    
+    @staticmethod
+    def _apply_projection(query, columns):
+        """Pousse la liste de colonnes vers Firestore sous forme de projection select()"""
+        if columns:
+            query = query.select([column for column in columns if column != 'id'])
+        return query
     
-    def get_operations_data(self, start_date=None, end_date=None, shop_id=None):
+    def iter_pages(self, query, order_field=None, page_size=None, collection=None):
+        """Lit une requête page par page (curseur start_after) et produit un DataFrame par page
+        
+        order_field: champ de la requête soumis à une inégalité, qui doit être le premier tri
+        collection: nom de la collection pour les métriques (temps de lecture, documents lus)
+        """
+        page_size = page_size or self.page_size
+        collection = collection or 'unknown'
+        
+        if order_field:
+            query = query.order_by(order_field)
+        query = query.order_by('__name__')
+        
+        stream_seconds = 0.0
+        build_seconds = 0.0
+        last_doc = None
+        try:
+            while True:
+                page_query = query.limit(page_size)
+                if last_doc is not None:
+                    page_query = page_query.start_after(last_doc)
+                
+                started = time.perf_counter()
+                try:
+                    docs = list(page_query.stream())
+                except Exception as e:
+                    # Erreur de transport: le client partagé sera recréé pour les lectures suivantes
+                    CLIENTS.report_failure('firestore', e, self.db)
+                    raise
+                stream_seconds += time.perf_counter() - started
+                FIRESTORE_DOCUMENTS.inc(len(docs), collection=collection)
+                if not docs:
+                    break
+                
+                started = time.perf_counter()
+                records = []
+                for doc in docs:
+                    data = doc.to_dict()
+                    data['id'] = doc.id
+                    records.append(data)
+                
+                # Chaque page devient immédiatement un bloc colonnaire
+                page = pd.DataFrame.from_records(records)
+                build_seconds += time.perf_counter() - started
+                yield page
+                
+                last_doc = docs[-1]
+                if len(docs) < page_size:
+                    break
+        finally:
+            FIRESTORE_STREAM_SECONDS.observe(stream_seconds, collection=collection)
+            DATAFRAME_BUILD_SECONDS.observe(build_seconds, collection=collection, step='records')
+    
+    def _read_dataframe(self, query, order_field=None, collection=None):
+        """Assemble les pages en un seul DataFrame avec une unique concaténation"""
+        chunks = list(self.iter_pages(query, order_field, collection=collection))
+        if not chunks:
+            return pd.DataFrame()
+        with DATAFRAME_BUILD_SECONDS.time(collection=collection or 'unknown', step='concat'):
+            return pd.concat(chunks, ignore_index=True)
+    
+    def iter_collection(self, collection, start_date=None, end_date=None, shop_id=None, columns=None):
+        """Itère sur une collection filtrée par blocs de page_size documents, convertis selon le schéma"""
+        query = self._build_query(collection, start_date, end_date, shop_id, columns)
+        order_field = 'date' if (start_date or end_date) else None
+        for page in self.iter_pages(query, order_field, collection=collection):
+            yield self._apply_schema(collection, page)
+    
+    def sync_collection(self, collection):
+        """Synchronise une collection dans le snapshot local (seuls les documents plus récents que le watermark sont lus)"""
+        watermark = self.snapshot_store.get_watermark(collection)
+        
+        query = self.db.collection(collection)
+        if watermark:
+            query = query.where('createdAt', '>', watermark)
+        
+        new_df = self._read_dataframe(query, 'createdAt' if watermark else None, collection)
+        
+        snapshot_df = self.snapshot_store.merge(collection, new_df)
+        print(f"🔄 {collection}: {len(new_df)} nouveaux documents, {len(snapshot_df)} dans le snapshot")
+        return snapshot_df
+    
+    def _get_snapshot_data(self, collection, start_date=None, end_date=None, shop_id=None, columns=None):
+        """Applique sur le snapshot les mêmes filtres que les requêtes Firestore"""
+        df = self.sync_collection(collection)
+        
+        if df.empty:
+            return df
+        
+        if shop_id and shop_id != 'all' and 'shopId' in df.columns:
+            df = df[df['shopId'] == shop_id]
+        
+        if start_date and 'date' in df.columns:
+            df = df[df['date'] >= start_date]
+        
+        if end_date and 'date' in df.columns:
+            df = df[df['date'] <= end_date]
+        
+        df = df.reset_index(drop=True)
+        
+        if columns:
+            df = df[[column for column in ['id'] + list(columns) if column in df.columns]]
+        
+        if not df.empty:
+            df = self._apply_schema(collection, df)
+            if 'date' in df.columns:
+                df = df.sort_values('date')
+        
+        return df
+    
+    def get_operations_data(self, start_date=None, end_date=None, shop_id=None, columns=None):
         """Extrait les données d'opérations"""
         try:
-            # Construire la requête
-            query = self.db.collection('operations')
-            
-            if shop_id and shop_id != 'all':
-                query = query.where('shopId', '==', shop_id)
-            
-            if start_date:
-                query = query.where('date', '>=', start_date)
-            
-            if end_date:
-                query = query.where('date', '<=', end_date)
-            
-            # Exécuter la requête
-            docs = query.stream()
+            if self.use_snapshot:
+                df = self._get_snapshot_data('operations', start_date, end_date, shop_id, columns)
+                print(f"✅ {len(df)} opérations extraites (snapshot)")
+                return df
             
-            # Convertir en DataFrame
-            operations_data = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                operations_data.append(data)
+            # Construire la requête
+            query = self._build_query('operations', start_date, end_date, shop_id, columns)
             
-            df = pd.DataFrame(operations_data)
+            # Exécuter la requête page par page
+            df = self._read_dataframe(query, 'date' if (start_date or end_date) else None, 'operations')
             
             if not df.empty:
-                # Convertir les dates
-                df['date'] = pd.to_datetime(df['date'])
-                df['createdAt'] = pd.to_datetime(df['createdAt'])
+                # Convertir selon le schéma (dates, montants, catégories)
+                df = self._apply_schema('operations', df)
                 
                 # Trier par date
                 df = df.sort_values('date')
             
             print(f"✅ {len(df)} opérations extraites")
             return df
-            
+        
         except Exception as e:
             print(f"❌ Erreur extraction opérations: {e}")
             return pd.DataFrame()
     
-    def get_depots_data(self, start_date=None, end_date=None, shop_id=None):
+    def get_depots_data(self, start_date=None, end_date=None, shop_id=None, columns=None):
         """Extrait les données de dépôts"""
         try:
-            query = self.db.collection('depots')
-            
-            if shop_id and shop_id != 'all':
-                query = query.where('shopId', '==', shop_id)
-            
-            if start_date:
-                query = query.where('date', '>=', start_date)
+            if self.use_snapshot:
+                df = self._get_snapshot_data('depots', start_date, end_date, shop_id, columns)
+                print(f"✅ {len(df)} dépôts extraits (snapshot)")
+                return df
             
-            if end_date:
-                query = query.where('date', '<=', end_date)
+            query = self._build_query('depots', start_date, end_date, shop_id, columns)
             
-            docs = query.stream()
-            
-            depots_data = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                depots_data.append(data)
-            
-            df = pd.DataFrame(depots_data)
+            df = self._read_dataframe(query, 'date' if (start_date or end_date) else None, 'depots')
             
             if not df.empty:
-                df['date'] = pd.to_datetime(df['date'])
-                df['createdAt'] = pd.to_datetime(df['createdAt'])
+                df = self._apply_schema('depots', df)
                 df = df.sort_values('date')
             
             print(f"✅ {len(df)} dépôts extraits")
             return df
-            
+        
         except Exception as e:
             print(f"❌ Erreur extraction dépôts: {e}")
             return pd.DataFrame()
     
-    def get_clients_data(self, shop_id=None):
+    def get_clients_data(self, shop_id=None, columns=None):
         """Extrait les données de clients"""
         try:
-            query = self.db.collection('clients')
-            
-            if shop_id and shop_id != 'all':
-                query = query.where('shopId', '==', shop_id)
+            if self.use_snapshot:
+                df = self._get_snapshot_data('clients', shop_id=shop_id, columns=columns)
+                print(f"✅ {len(df)} clients extraits (snapshot)")
+                return df
             
-            docs = query.stream()
+            query = self._build_query('clients', shop_id=shop_id, columns=columns)
             
-            clients_data = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                clients_data.append(data)
-            
-            df = pd.DataFrame(clients_data)
+            df = self._read_dataframe(query, collection='clients')
             
-            if not df.empty and 'createdAt' in df.columns:
-                df['createdAt'] = pd.to_datetime(df['createdAt'])
+            if not df.empty:
+                df = self._apply_schema('clients', df)
             
             print(f"✅ {len(df)} clients extraits")
             return df
-            
+        
         except Exception as e:
             print(f"❌ Erreur extraction clients: {e}")
             return pd.DataFrame()
     
-    def get_mouvements_data(self, start_date=None, end_date=None, shop_id=None):
+    def get_mouvements_data(self, start_date=None, end_date=None, shop_id=None, columns=None):
         """Extrait les données de mouvements"""
         try:
-            query = self.db.collection('mouvements')
-            
-            if shop_id and shop_id != 'all':
-                query = query.where('shopId', '==', shop_id)
+            if self.use_snapshot:
+                df = self._get_snapshot_data('mouvements', start_date, end_date, shop_id, columns)
+                print(f"✅ {len(df)} mouvements extraits (snapshot)")
+                return df
             
-            if start_date:
-                query = query.where('date', '>=', start_date)
+            query = self._build_query('mouvements', start_date, end_date, shop_id, columns)
             
-            if end_date:
-                query = query.where('date', '<=', end_date)
-            
-            docs = query.stream()
-            
-            mouvements_data = []
-            for doc in docs:
-                data = doc.to_dict()
-                data['id'] = doc.id
-                mouvements_data.append(data)
-            
-            df = pd.DataFrame(mouvements_data)
+            df = self._read_dataframe(query, 'date' if (start_date or end_date) else None, 'mouvements')
             
             if not df.empty:
-                df['date'] = pd.to_datetime(df['date'])
-                df['createdAt'] = pd.to_datetime(df['createdAt'])
+                df = self._apply_schema('mouvements', df)
                 df = df.sort_values('date')
             
             print(f"✅ {len(df)} mouvements extraits")
             return df
-            
+        
         except Exception as e:
             print(f"❌ Erreur extraction mouvements: {e}")
             return pd.DataFrame()
     
+    def extract_all(self, start_date=None, end_date=None, shop_id=None, max_workers=4, fields=None, ranges=None):
+        """Extrait opérations, dépôts, clients et mouvements en parallèle (durée ≈ la collection la plus lente)
+        
+        fields: dictionnaire {collection: liste de champs} (voir REPORT_FIELDS), None pour tous les champs
+        ranges: dictionnaire {collection: (début, fin)} remplaçant la plage commune pour certaines collections
+        """
+        fields = fields or {}
+        ranges = ranges or {}
+        
+        def date_range(collection):
+            return ranges.get(collection, (start_date, end_date))
+        
+        tasks = {
+            'operations': lambda: self.get_operations_data(*date_range('operations'), shop_id, fields.get('operations')),
+            'depots': lambda: self.get_depots_data(*date_range('depots'), shop_id, fields.get('depots')),
+            'clients': lambda: self.get_clients_data(shop_id, fields.get('clients')),
+            'mouvements': lambda: self.get_mouvements_data(*date_range('mouvements'), shop_id, fields.get('mouvements'))
+        }
+        
+        def timed(task):
+            started = time.perf_counter()
+            df = task()
+            return df, time.perf_counter() - started
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {name: executor.submit(timed, task) for name, task in tasks.items()}
+            results = {name: future.result() for name, future in futures.items()}
+        
+        result = {name: df for name, (df, _) in results.items()}
+        result['timings'] = {name: round(duration, 3) for name, (_, duration) in results.items()}
+        result['timings']['total'] = round(time.perf_counter() - started, 3)
+        
+        print(f"⏱️ Extraction parallèle terminée en {result['timings']['total']}s")
+        return result
+    
+    def _latest(self, collection, field):
+        """Valeur la plus récente d'un champ dans une collection (un document lu), None s'il est absent"""
+        query = self.db.collection(collection).order_by(field, direction='DESCENDING').limit(1)
+        docs = list(query.stream())
+        value = docs[0].get(field) if docs else None
+        return str(value) if value is not None else None
+    
+    def get_data_watermark(self, collections=('operations', 'depots', 'clients', 'mouvements')):
+        """État de chaque collection, pour invalider les caches: (dernier createdAt, nombre de documents, dernier updatedAt)
+        
+        Le nombre de documents (agrégation count, sans lire les documents) change avec les ajouts et les
+        suppressions, updatedAt avec les modifications qui le renseignent. Une modification qui ne touche pas
+        updatedAt n'est pas vue: l'API borne la réutilisation des rapports par REPORT_MAX_AGE.
+        None si Firestore ne répond pas: l'appelant ne réutilise alors aucun rapport déjà calculé.
+        """
+        try:
+            watermark = []
+            for collection in collections:
+                count = self.db.collection(collection).count(alias='documents').get()[0][0].value
+                watermark.append((self._latest(collection, 'createdAt'), int(count), self._latest(collection, 'updatedAt')))
+            return tuple(watermark)
+        
+        except Exception as e:
+            print(f"⚠️ Watermark des données indisponible: {e}")
+            CLIENTS.report_failure('firestore', e, self.db)
+            return None
+    
     def get_shops_data(self):
         """Extrait les données des shops"""
         try:
@@ -164,7 +342,7 @@ class DataExtractor:
             df = pd.DataFrame(shops_data)
             print(f"✅ {len(df)} shops extraits")
             return df
-            
+        
         except Exception as e:
             print(f"❌ Erreur extraction shops: {e}")
-            return pd.DataFrame() 
\ No newline at end of file
+            return pd.DataFrame()
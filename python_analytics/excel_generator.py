@@ -1,23 +1,154 @@
+import io
+import os
 import pandas as pd
 import xlsxwriter
 from datetime import datetime
-from config import get_storage_client
+from clients import CLIENTS
+from report_catalog import REPORT_CATALOG
+from aggregations import DatasetAggregates
+from rollups import with_missing_keys
+from metrics import EXCEL_SHEET_SECONDS, UPLOAD_SECONDS
+
+# Nombre maximal de lignes d'une feuille Excel (au-delà: onglets de continuation)
+EXCEL_MAX_ROWS = 1048576
+
+# Taille des blocs écrits en mode mémoire constante
+RAW_SHEET_CHUNK_SIZE = 50000
+
+# Type MIME des classeurs uploadés ou servis depuis un tampon
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Champs Firestore utilisés par chaque type de rapport (None = tous les champs, pour les onglets de données brutes)
+REPORT_FIELDS = {
+    'summary': {
+        'operations': ['date', 'createdAt', 'shopId', 'total_general'],
+        'depots': ['date', 'createdAt', 'shopId', 'clientId', 'montant', 'devise'],
+        'clients': ['createdAt', 'shopId'],
+        'mouvements': ['date', 'createdAt', 'shopId', 'type', 'devise', 'montant']
+    },
+    'full': None
+}
 
 class ExcelGenerator:
     """Classe pour générer des fichiers Excel avec analyses"""
     
-    def __init__(self):
-        self.storage_bucket = get_storage_client()
+    def __init__(self, bucket=None):
+        # bucket: bucket Storage à utiliser (par défaut le bucket partagé du processus, ouvert au premier upload)
+        self._bucket = bucket
+    
+    @property
+    def storage_bucket(self):
+        return self._bucket or CLIENTS.bucket()
+    
+    @staticmethod
+    def _excel_value(value):
+        """Convertit une valeur pandas/Firestore en valeur acceptée par xlsxwriter"""
+        if isinstance(value, (dict, list, tuple)):
+            return str(value)
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            if pd.isna(value):
+                return None
+        except (TypeError, ValueError):
+            pass
+        return value
+    
+    def _write_table(self, writer, df, sheet_name, header_format, constant_memory=False):
+        """Écrit un tableau de synthèse (ligne par ligne en mode mémoire constante, qui impose l'ordre des lignes)"""
+        with EXCEL_SHEET_SECONDS.time(sheet=sheet_name):
+            if not constant_memory:
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+                return
+            
+            worksheet = writer.book.add_worksheet(sheet_name)
+            worksheet.write_row(0, 0, [str(column) for column in df.columns], header_format)
+            for row_num, values in enumerate(df.itertuples(index=False), start=1):
+                worksheet.write_row(row_num, 0, [self._excel_value(value) for value in values])
+    
+    @staticmethod
+    def _iter_chunks(df, chunk_size=RAW_SHEET_CHUNK_SIZE):
+        """Découpe un DataFrame en tranches (vues, sans copie)"""
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+    
+    def _write_raw_sheet(self, workbook, sheet_name, chunks, header_format, max_rows=EXCEL_MAX_ROWS):
+        """Écrit des blocs de données brutes ligne par ligne, avec onglets de continuation au-delà de max_rows"""
+        columns = None
+        worksheet = None
+        sheet_index = 1
+        row_num = max_rows
+        total_rows = 0
+        
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            
+            if columns is None:
+                columns = [str(column) for column in chunk.columns]
+            elif list(chunk.columns) != columns:
+                # L'en-tête est déjà écrit: les colonnes apparues en cours de route sont ignorées
+                chunk = chunk.reindex(columns=columns)
+            
+            # Dates formatées comme dans les onglets de données brutes, colonne par colonne
+            column_values = []
+            for column in columns:
+                values = chunk[column]
+                if pd.api.types.is_datetime64_any_dtype(values):
+                    values = values.dt.strftime('%Y-%m-%d' if column == 'date' else '%Y-%m-%d %H:%M:%S')
+                column_values.append(values.tolist())
+            
+            for values in zip(*column_values):
+                if row_num >= max_rows:
+                    name = sheet_name if sheet_index == 1 else f"{sheet_name} ({sheet_index})"
+                    worksheet = workbook.add_worksheet(name)
+                    worksheet.write_row(0, 0, columns, header_format)
+                    sheet_index += 1
+                    row_num = 1
+                worksheet.write_row(row_num, 0, [self._excel_value(value) for value in values])
+                row_num += 1
+                total_rows += 1
+        
+        return total_rows
     
-    def create_sales_report(self, operations_df, depots_df, clients_df, mouvements_df, filename=None):
-        """Crée un rapport de ventes complet en Excel"""
+    @staticmethod
+    def _writer_target(filename, output, options):
+        """Destination du classeur: le fichier `filename`, ou le tampon `output` assemblé sans fichier temporaire"""
+        if output is None:
+            return filename, options
+        # in_memory remplace constant_memory (fichiers temporaires par onglet): on le garde dans ce cas
+        if not options.get('constant_memory'):
+            options = dict(options, in_memory=True)
+        return output, options
+    
+    def create_sales_report(self, operations_df, depots_df, clients_df, mouvements_df, filename=None, include_raw_data=True,
+                            constant_memory=False, raw_chunks=None, aggregates=None, output=None):
+        """Crée un rapport de ventes complet en Excel
+        
+        include_raw_data=False: onglets de synthèse uniquement
+        constant_memory=True: écriture xlsxwriter en mémoire constante, données brutes écrites bloc par bloc
+        raw_chunks: itérables de blocs {'operations': ..., 'depots': ...} à écrire à la place des DataFrames
+        (par exemple DataExtractor.iter_collection), pour ne jamais charger les données brutes en entier
+        aggregates: DatasetAggregates partagé avec DataAnalyzer (calculé ici s'il n'est pas fourni); un état agrégé
+        (AggregateState.aggregates()) permet un rapport de synthèse sans DataFrames (None, include_raw_data=False)
+        output: tampon binaire (io.BytesIO) qui reçoit le classeur à la place du fichier; filename reste le nom du rapport
+        """
         if filename is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"rapport_ventes_{timestamp}.xlsx"
         
+        raw_chunks = raw_chunks or {}
+        if aggregates is None:
+            aggregates = DatasetAggregates(operations_df, depots_df, mouvements_df)
+        rows = {collection: aggregates.row_count(collection) for collection in ('operations', 'depots', 'mouvements')}
+        options = {}
+        if constant_memory:
+            options = {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'}
+        target, options = self._writer_target(filename, output, options)
+        
         try:
             # Créer le fichier Excel
-            with pd.ExcelWriter(filename, engine='xlsxwriter') as writer:
+            with pd.ExcelWriter(target, engine='xlsxwriter', engine_kwargs={'options': options}) as writer:
                 workbook = writer.book
                 
                 # Formats
@@ -40,7 +171,8 @@ class ExcelGenerator:
                 })
                 
                 # Onglet 1: Résumé général
-                if not operations_df.empty:
+                if rows['operations']:
+                    totals = aggregates.operations_totals()
                     summary_data = {
                         'Métrique': [
                             'Total des ventes',
@@ -52,18 +184,18 @@ class ExcelGenerator:
                             'Période de fin'
                         ],
                         'Valeur': [
-                            operations_df['total_general'].sum(),
-                            len(operations_df),
-                            operations_df['total_general'].mean(),
-                            operations_df['total_general'].sum() * 0.15,
-                            operations_df['shopId'].nunique(),
-                            operations_df['date'].min().strftime('%Y-%m-%d'),
-                            operations_df['date'].max().strftime('%Y-%m-%d')
+                            totals['sum'],
+                            rows['operations'],
+                            totals['mean'],
+                            totals['sum'] * 0.15,
+                            totals['shops'],
+                            totals['first'].strftime('%Y-%m-%d'),
+                            totals['last'].strftime('%Y-%m-%d')
                         ]
                     }
                     
                     summary_df = pd.DataFrame(summary_data)
-                    summary_df.to_excel(writer, sheet_name='Résumé', index=False)
+                    self._write_table(writer, summary_df, 'Résumé', header_format, constant_memory)
                     
                     # Formater l'onglet Résumé
                     worksheet = writer.sheets['Résumé']
@@ -73,16 +205,13 @@ class ExcelGenerator:
                     worksheet.write(0, 1, 'Valeur', header_format)
                 
                 # Onglet 2: Ventes par jour
-                if not operations_df.empty:
-                    daily_sales = operations_df.groupby(operations_df['date'].dt.date).agg({
-                        'total_general': 'sum',
-                        'shopId': 'nunique'
-                    }).reset_index()
+                if rows['operations']:
+                    daily_sales = aggregates.operations_by_period('day')[['sum', 'shops']].reset_index()
                     
                     daily_sales.columns = ['Date', 'Total Ventes', 'Nombre Shops']
                     daily_sales['Bénéfice Estimé'] = daily_sales['Total Ventes'] * 0.15
                     
-                    daily_sales.to_excel(writer, sheet_name='Ventes par Jour', index=False)
+                    self._write_table(writer, daily_sales, 'Ventes par Jour', header_format, constant_memory)
                     
                     # Formater l'onglet Ventes par Jour
                     worksheet = writer.sheets['Ventes par Jour']
@@ -92,16 +221,14 @@ class ExcelGenerator:
                         worksheet.write(0, col_num, value, header_format)
                 
                 # Onglet 3: Ventes par shop
-                if not operations_df.empty:
-                    shop_sales = operations_df.groupby('shopId').agg({
-                        'total_general': ['sum', 'mean', 'count']
-                    }).round(2)
+                if rows['operations']:
+                    shop_sales = aggregates.operations_by_shop()[['sum', 'mean', 'count']].round(2)
                     
                     shop_sales.columns = ['Total Ventes', 'Moyenne Ventes', 'Nombre Opérations']
                     shop_sales['Bénéfice Estimé'] = shop_sales['Total Ventes'] * 0.15
                     shop_sales = shop_sales.reset_index()
                     
-                    shop_sales.to_excel(writer, sheet_name='Ventes par Shop', index=False)
+                    self._write_table(writer, shop_sales, 'Ventes par Shop', header_format, constant_memory)
                     
                     # Formater l'onglet Ventes par Shop
                     worksheet = writer.sheets['Ventes par Shop']
@@ -111,11 +238,9 @@ class ExcelGenerator:
                         worksheet.write(0, col_num, value, header_format)
                 
                 # Onglet 4: Dépôts clients
-                if not depots_df.empty:
-                    client_deposits = depots_df.groupby('clientId').agg({
-                        'montant': ['sum', 'count', 'mean'],
-                        'date': ['min', 'max']
-                    }).round(2)
+                if rows['depots']:
+                    client_deposits = aggregates.depots_by_client()[['sum', 'count', 'mean', 'first', 'last']].copy()
+                    client_deposits[['sum', 'mean']] = client_deposits[['sum', 'mean']].round(2)
                     
                     client_deposits.columns = [
                         'Total Dépôts', 'Nombre Dépôts', 'Moyenne Dépôt',
@@ -123,7 +248,7 @@ class ExcelGenerator:
                     ]
                     client_deposits = client_deposits.reset_index()
                     
-                    client_deposits.to_excel(writer, sheet_name='Dépôts Clients', index=False)
+                    self._write_table(writer, client_deposits, 'Dépôts Clients', header_format, constant_memory)
                     
                     # Formater l'onglet Dépôts Clients
                     worksheet = writer.sheets['Dépôts Clients']
@@ -134,15 +259,13 @@ class ExcelGenerator:
                         worksheet.write(0, col_num, value, header_format)
                 
                 # Onglet 5: Mouvements de stock
-                if not mouvements_df.empty:
-                    stock_movements = mouvements_df.groupby(['type', 'devise']).agg({
-                        'montant': ['sum', 'count', 'mean']
-                    }).round(2)
+                if rows['mouvements']:
+                    stock_movements = aggregates.mouvements_by_type()[['sum', 'count', 'mean']].round(2)
                     
                     stock_movements.columns = ['Total Montant', 'Nombre Mouvements', 'Moyenne Montant']
                     stock_movements = stock_movements.reset_index()
                     
-                    stock_movements.to_excel(writer, sheet_name='Mouvements Stock', index=False)
+                    self._write_table(writer, stock_movements, 'Mouvements Stock', header_format, constant_memory)
                     
                     # Formater l'onglet Mouvements Stock
                     worksheet = writer.sheets['Mouvements Stock']
@@ -151,30 +274,223 @@ class ExcelGenerator:
                     for col_num, value in enumerate(stock_movements.columns.values):
                         worksheet.write(0, col_num, value, header_format)
                 
+                # Onglets 6 et 7 en flux: blocs écrits ligne par ligne, sans copie des DataFrames
+                streaming_raw = include_raw_data and (constant_memory or bool(raw_chunks))
+                if streaming_raw:
+                    for key, source_df, sheet_name in [
+                        ('operations', operations_df, 'Données Opérations'),
+                        ('depots', depots_df, 'Données Dépôts')
+                    ]:
+                        chunks = raw_chunks.get(key)
+                        if chunks is None:
+                            chunks = self._iter_chunks(source_df)
+                        with EXCEL_SHEET_SECONDS.time(sheet=sheet_name):
+                            written = self._write_raw_sheet(workbook, sheet_name, chunks, header_format)
+                        print(f"📝 {written} lignes écrites dans '{sheet_name}'")
+                
                 # Onglet 6: Données brutes - Opérations
-                if not operations_df.empty:
+                if include_raw_data and not streaming_raw and not operations_df.empty:
                     operations_export = operations_df.copy()
                     operations_export['date'] = operations_export['date'].dt.strftime('%Y-%m-%d')
                     operations_export['createdAt'] = operations_export['createdAt'].dt.strftime('%Y-%m-%d %H:%M:%S')
                     
-                    operations_export.to_excel(writer, sheet_name='Données Opérations', index=False)
+                    self._write_table(writer, operations_export, 'Données Opérations', header_format)
                 
                 # Onglet 7: Données brutes - Dépôts
-                if not depots_df.empty:
+                if include_raw_data and not streaming_raw and not depots_df.empty:
                     depots_export = depots_df.copy()
                     depots_export['date'] = depots_export['date'].dt.strftime('%Y-%m-%d')
                     depots_export['createdAt'] = depots_export['createdAt'].dt.strftime('%Y-%m-%d %H:%M:%S')
                     
-                    depots_export.to_excel(writer, sheet_name='Données Dépôts', index=False)
+                    self._write_table(writer, depots_export, 'Données Dépôts', header_format)
             
             print(f"✅ Rapport Excel créé: {filename}")
             return filename
-            
+        
         except Exception as e:
             print(f"❌ Erreur création rapport Excel: {e}")
             return None
     
-    def create_monthly_report(self, operations_df, depots_df, clients_df, mouvements_df, month_year, filename=None):
+    def create_rollup_report(self, operations_rollup, depots_rollup, mouvements_rollup, filename=None, output=None,
+                             sketch_analyses=None):
+        """Crée un rapport de synthèse depuis les agrégats journaliers (sans données brutes)
+        
+        Clés manquantes (shop, client, type, devise) ignorées comme dans create_sales_report: mêmes onglets, mêmes lignes.
+        sketch_analyses: analyses approchées {'ventes': ..., 'clients': ..., 'erreurs': ...} (DataAnalyzer.*_from_sketches
+        et sketch_error_bounds), ajoutées en onglets avec leurs bornes d'erreur
+        """
+        operations_rollup, depots_rollup, mouvements_rollup = (
+            with_missing_keys(rollup) for rollup in (operations_rollup, depots_rollup, mouvements_rollup)
+        )
+        if filename is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"rapport_agrege_{timestamp}.xlsx"
+        target, options = self._writer_target(filename, output, {})
+        
+        try:
+            with pd.ExcelWriter(target, engine='xlsxwriter', engine_kwargs={'options': options}) as writer:
+                workbook = writer.book
+                
+                header_format = workbook.add_format({
+                    'bold': True,
+                    'text_wrap': True,
+                    'valign': 'top',
+                    'fg_color': '#D7E4BC',
+                    'border': 1
+                })
+                
+                number_format = workbook.add_format({
+                    'num_format': '#,##0.00',
+                    'border': 1
+                })
+                
+                # Onglet 1: Résumé général
+                if not operations_rollup.empty:
+                    total_ventes = operations_rollup['sum'].sum()
+                    nombre_operations = int(operations_rollup['count'].sum())
+                    summary_df = pd.DataFrame({
+                        'Métrique': [
+                            'Total des ventes',
+                            'Nombre d\'opérations',
+                            'Moyenne des ventes',
+                            'Bénéfice estimé (15%)',
+                            'Nombre de shops',
+                            'Période de début',
+                            'Période de fin'
+                        ],
+                        'Valeur': [
+                            total_ventes,
+                            nombre_operations,
+                            total_ventes / nombre_operations,
+                            total_ventes * 0.15,
+                            operations_rollup['shopId'].nunique(),
+                            operations_rollup['day'].min().strftime('%Y-%m-%d'),
+                            operations_rollup['day'].max().strftime('%Y-%m-%d')
+                        ]
+                    })
+                    self._write_table(writer, summary_df, 'Résumé', header_format)
+                    
+                    worksheet = writer.sheets['Résumé']
+                    worksheet.set_column('A:A', 25)
+                    worksheet.set_column('B:B', 20, number_format)
+                    worksheet.write(0, 0, 'Métrique', header_format)
+                    worksheet.write(0, 1, 'Valeur', header_format)
+                
+                # Onglet 2: Ventes par jour
+                if not operations_rollup.empty:
+                    daily_sales = operations_rollup.groupby('day').agg({
+                        'sum': 'sum',
+                        'shopId': 'nunique'
+                    }).reset_index()
+                    
+                    daily_sales.columns = ['Date', 'Total Ventes', 'Nombre Shops']
+                    daily_sales['Date'] = daily_sales['Date'].dt.date
+                    daily_sales['Bénéfice Estimé'] = daily_sales['Total Ventes'] * 0.15
+                    
+                    self._write_table(writer, daily_sales, 'Ventes par Jour', header_format)
+                    
+                    worksheet = writer.sheets['Ventes par Jour']
+                    worksheet.set_column('A:A', 15)
+                    worksheet.set_column('B:D', 20, number_format)
+                    for col_num, value in enumerate(daily_sales.columns.values):
+                        worksheet.write(0, col_num, value, header_format)
+                
+                # Onglet 3: Ventes par shop
+                if not operations_rollup.empty:
+                    shop_sales = operations_rollup.groupby('shopId').agg({
+                        'sum': 'sum',
+                        'count': 'sum'
+                    })
+                    
+                    shop_sales.columns = ['Total Ventes', 'Nombre Opérations']
+                    shop_sales['Moyenne Ventes'] = shop_sales['Total Ventes'] / shop_sales['Nombre Opérations']
+                    shop_sales = shop_sales[['Total Ventes', 'Moyenne Ventes', 'Nombre Opérations']].round(2)
+                    shop_sales['Bénéfice Estimé'] = shop_sales['Total Ventes'] * 0.15
+                    shop_sales = shop_sales.reset_index()
+                    
+                    self._write_table(writer, shop_sales, 'Ventes par Shop', header_format)
+                    
+                    worksheet = writer.sheets['Ventes par Shop']
+                    worksheet.set_column('A:A', 20)
+                    worksheet.set_column('B:E', 20, number_format)
+                    for col_num, value in enumerate(shop_sales.columns.values):
+                        worksheet.write(0, col_num, value, header_format)
+                
+                # Onglet 4: Dépôts par client (premier/dernier dépôt = premier/dernier jour agrégé)
+                if not depots_rollup.empty:
+                    client_deposits = depots_rollup.groupby('clientId').agg({
+                        'sum': 'sum',
+                        'count': 'sum',
+                        'day': ['min', 'max']
+                    })
+                    
+                    client_deposits.columns = ['Total Dépôts', 'Nombre Dépôts', 'Premier Dépôt', 'Dernier Dépôt']
+                    client_deposits['Moyenne Dépôt'] = client_deposits['Total Dépôts'] / client_deposits['Nombre Dépôts']
+                    client_deposits[['Total Dépôts', 'Moyenne Dépôt']] = client_deposits[['Total Dépôts', 'Moyenne Dépôt']].round(2)
+                    client_deposits = client_deposits[
+                        ['Total Dépôts', 'Nombre Dépôts', 'Moyenne Dépôt', 'Premier Dépôt', 'Dernier Dépôt']
+                    ].reset_index()
+                    
+                    self._write_table(writer, client_deposits, 'Dépôts Clients', header_format)
+                    
+                    worksheet = writer.sheets['Dépôts Clients']
+                    worksheet.set_column('A:A', 20)
+                    worksheet.set_column('B:D', 20, number_format)
+                    worksheet.set_column('E:F', 15)
+                    for col_num, value in enumerate(client_deposits.columns.values):
+                        worksheet.write(0, col_num, value, header_format)
+                
+                # Onglet 5: Mouvements de stock
+                if not mouvements_rollup.empty:
+                    stock_movements = mouvements_rollup.groupby(['type', 'devise']).agg({
+                        'sum': 'sum',
+                        'count': 'sum'
+                    })
+                    
+                    stock_movements.columns = ['Total Montant', 'Nombre Mouvements']
+                    stock_movements['Moyenne Montant'] = stock_movements['Total Montant'] / stock_movements['Nombre Mouvements']
+                    stock_movements = stock_movements.round(2).reset_index()
+                    
+                    self._write_table(writer, stock_movements, 'Mouvements Stock', header_format)
+                    
+                    worksheet = writer.sheets['Mouvements Stock']
+                    worksheet.set_column('A:B', 15)
+                    worksheet.set_column('C:E', 20, number_format)
+                    for col_num, value in enumerate(stock_movements.columns.values):
+                        worksheet.write(0, col_num, value, header_format)
+                
+                # Onglets 6 et 7: analyses approchées (sketches), bornes d'erreur sous le tableau
+                sketch_analyses = sketch_analyses or {}
+                errors = sketch_analyses.get('erreurs')
+                for sheet_name, table in [
+                    ('Quantiles Ventes', sketch_analyses.get('ventes')),
+                    ('Clients Estimés', (sketch_analyses.get('clients') or {}).get('by_period'))
+                ]:
+                    if table is None or table.empty:
+                        continue
+                    table = table.reset_index()
+                    table[table.columns[0]] = table[table.columns[0]].astype(str)
+                    
+                    self._write_table(writer, table, sheet_name, header_format)
+                    
+                    worksheet = writer.sheets[sheet_name]
+                    worksheet.set_column('A:A', 15)
+                    worksheet.set_column(1, len(table.columns) - 1, 20, number_format)
+                    if errors:
+                        worksheet.write(len(table) + 2, 0, (
+                            f"Estimations: quantiles à ±{errors['quantiles']:.1%}, "
+                            f"clients distincts à ±{errors['clients_distincts']:.1%} (erreur type)"
+                        ))
+            
+            print(f"✅ Rapport agrégé créé: {filename}")
+            return filename
+        
+        except Exception as e:
+            print(f"❌ Erreur création rapport agrégé: {e}")
+            return None
+    
+    def create_monthly_report(self, operations_df, depots_df, clients_df, mouvements_df, month_year, filename=None, include_raw_data=True,
+                              output=None):
         """Crée un rapport mensuel spécifique"""
         if filename is None:
             filename = f"rapport_mensuel_{month_year}.xlsx"
@@ -201,29 +517,53 @@ class ExcelGenerator:
             
             # Créer le rapport
             return self.create_sales_report(
-                operations_month, depots_month, clients_df, mouvements_month, filename
+                operations_month, depots_month, clients_df, mouvements_month, filename,
+                include_raw_data=include_raw_data, output=output
             )
-            
+        
         except Exception as e:
             print(f"❌ Erreur création rapport mensuel: {e}")
             return None
     
-    def upload_to_firebase(self, filename, folder="reports"):
-        """Upload le fichier Excel vers Firebase Storage"""
+    def upload_to_firebase(self, filename, folder="reports", metadata=None, data=None):
+        """Upload le fichier Excel vers Firebase Storage
+        
+        filename: chemin du fichier (le blob prend son nom de base), ou nom du rapport si data est fourni
+        metadata: shopId, reportType, startDate, endDate du rapport, enregistrés dans le catalogue (report_catalog.py)
+        data: contenu du classeur (bytes ou tampon) envoyé directement, sans passer par le disque
+        """
+        bucket = None
         try:
-            blob_name = f"{folder}/{filename}"
-            blob = self.storage_bucket.blob(blob_name)
+            blob_name = f"{folder}/{os.path.basename(filename)}"
+            bucket = self.storage_bucket
+            blob = bucket.blob(blob_name)
             
-            blob.upload_from_filename(filename)
+            with UPLOAD_SECONDS.time(folder=folder):
+                if data is None:
+                    blob.upload_from_filename(filename, content_type=XLSX_MIMETYPE)
+                else:
+                    # Au-delà de 8 Mo, la bibliothèque Storage passe en upload résumable par blocs
+                    buffer = io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+                    buffer.seek(0, io.SEEK_END)
+                    size = buffer.tell()
+                    buffer.seek(0)
+                    blob.upload_from_file(buffer, content_type=XLSX_MIMETYPE, size=size)
             
             # Rendre le fichier public
             blob.make_public()
             
             download_url = blob.public_url
             
+            # Entrée du catalogue (/api/list-reports): un échec n'annule pas l'upload
+            try:
+                REPORT_CATALOG.record(blob, folder, os.path.basename(filename), metadata)
+            except Exception as e:
+                print(f"⚠️ Rapport non ajouté au catalogue: {e}")
+            
             print(f"✅ Fichier uploadé vers Firebase: {download_url}")
             return download_url
-            
+        
         except Exception as e:
+            CLIENTS.report_failure('storage', e, bucket)
             print(f"❌ Erreur upload Firebase: {e}")
             return None 
\ No newline at end of file
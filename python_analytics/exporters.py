@@ -0,0 +1,158 @@
+import zlib
+from datetime import datetime
+import pandas as pd
+from snapshot_store import normalize_for_parquet
+
+# Collections exportables et formats disponibles (extension, type MIME)
+EXPORT_COLLECTIONS = ('operations', 'depots', 'mouvements', 'clients')
+
+EXPORT_FORMATS = {
+    'csv.gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet',
+    'ndjson': 'application/x-ndjson'
+}
+
+def _align(chunk, columns, dropped):
+    """Bloc remis sur les colonnes du premier bloc (ordre compris); signale une fois les colonnes ignorées"""
+    extra = [column for column in chunk.columns if column not in columns and column not in dropped]
+    if extra:
+        dropped.update(extra)
+        print(f"⚠️ Export: colonnes absentes du premier bloc ignorées: {', '.join(map(str, extra))}")
+    return chunk.reindex(columns=columns)
+
+def iter_csv_gz(chunks):
+    """CSV compressé gzip, produit bloc par bloc (en-tête et ordre des colonnes fixés par le premier bloc)"""
+    compressor = zlib.compressobj(wbits=31)  # 31 = conteneur gzip
+    columns = None
+    dropped = set()
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        header = columns is None
+        if header:
+            columns = list(chunk.columns)
+        else:
+            chunk = _align(chunk, columns, dropped)
+        data = compressor.compress(chunk.to_csv(index=False, header=header).encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def iter_ndjson(chunks):
+    """Un objet JSON par ligne, dates au format ISO 8601"""
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        yield chunk.to_json(orient='records', lines=True, date_format='iso', force_ascii=False).encode('utf-8')
+
+class _BufferSink:
+    """Flux d'écriture minimal dont on vide le contenu après chaque groupe de lignes Parquet"""
+    
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+    
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def _parquet_schema(chunk):
+    """Schéma d'écriture déduit du premier bloc, élargi pour accepter les blocs suivants
+    
+    Colonne vide -> texte, catégories -> texte (l'encodage dictionnaire est fait par Parquet), entiers -> float64
+    (une page suivante avec une valeur manquante les convertit en float).
+    """
+    import pyarrow as pa
+    
+    fields = []
+    for field in pa.Schema.from_pandas(chunk, preserve_index=False):
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_dictionary(field.type):
+            field = field.with_type(field.type.value_type)
+        elif pa.types.is_integer(field.type):
+            field = field.with_type(pa.float64())
+        fields.append(field)
+    return pa.schema(fields)
+
+def _parquet_column(values, field):
+    """Colonne d'un bloc convertie au type du schéma d'écriture (valeurs non convertibles -> nulles, signalées)"""
+    import pyarrow as pa
+    
+    try:
+        return pa.array(values, from_pandas=True).cast(field.type, safe=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        pass
+    
+    present = values.notna()
+    if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+        converted = values.astype(object).where(~present, values.astype(str))
+    elif pa.types.is_timestamp(field.type):
+        converted = pd.to_datetime(values, format='ISO8601', utc=field.type.tz is not None, errors='coerce')
+    elif pa.types.is_floating(field.type) or pa.types.is_integer(field.type):
+        converted = pd.to_numeric(values, errors='coerce')
+    else:
+        converted = values.where(values.map(lambda value: isinstance(value, bool)), None)
+    
+    lost = int((present & converted.isna()).sum())
+    if lost:
+        print(f"⚠️ Export: {lost} valeurs de '{field.name}' non convertibles en {field.type}, exportées vides")
+    return pa.array(converted, from_pandas=True).cast(field.type, safe=False)
+
+def iter_parquet(chunks):
+    """Parquet écrit en flux: un groupe de lignes par bloc, chaque bloc converti au schéma du premier"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    sink = _BufferSink()
+    writer = None
+    schema = None
+    dropped = set()
+    
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        
+        chunk = normalize_for_parquet(chunk)
+        
+        if writer is None:
+            schema = _parquet_schema(chunk)
+            writer = pq.ParquetWriter(sink, schema)
+        else:
+            chunk = _align(chunk, schema.names, dropped)
+        
+        columns = [_parquet_column(chunk[field.name], field) for field in schema]
+        writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+    
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
+
+def iter_export(chunks, export_format):
+    """Sérialise un itérable de blocs DataFrame dans le format demandé"""
+    if export_format == 'csv.gz':
+        return iter_csv_gz(chunks)
+    if export_format == 'parquet':
+        return iter_parquet(chunks)
+    if export_format == 'ndjson':
+        return iter_ndjson(chunks)
+    raise ValueError(f"Format d'export inconnu: {export_format} (formats: {', '.join(EXPORT_FORMATS)})")
+
+def export_filename(collection, export_format):
+    """Nom de fichier d'un export, horodaté comme les rapports"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"export_{collection}_{timestamp}.{export_format}"
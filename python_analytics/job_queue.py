@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import uuid
+import queue
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Persistance des jobs de rapport et limites du pool
+JOBS_DB = os.environ.get('REPORT_JOBS_DB', '/tmp/report_jobs.sqlite3')
+JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', 2))
+JOB_QUEUE_LIMIT = int(os.environ.get('REPORT_JOB_QUEUE_LIMIT', 20))
+
+# Heartbeat des jobs en cours (secondes) et délai sans heartbeat au-delà duquel un job est considéré abandonné
+JOB_HEARTBEAT_SECONDS = float(os.environ.get('REPORT_JOB_HEARTBEAT', 10))
+JOB_STALE_SECONDS = float(os.environ.get('REPORT_JOB_STALE', 60))
+
+# Durée de conservation des jobs terminés ou en échec (secondes, 0 pour les conserver indéfiniment)
+JOB_RETENTION_SECONDS = float(os.environ.get('REPORT_JOB_RETENTION', 86400))
+
+# Intervalle de scrutation de la base par les workers inactifs (jobs soumis par un autre processus)
+JOB_POLL_SECONDS = float(os.environ.get('REPORT_JOB_POLL', 2))
+
+# Colonnes ajoutées aux bases créées avant le suivi des propriétaires
+JOB_OWNER_COLUMNS = {'owner': 'TEXT', 'heartbeat': 'REAL'}
+
+class QueueFullError(Exception):
+    """La file des jobs a atteint sa limite (back-pressure)"""
+
+class JobQueue:
+    """File de jobs de rapport: pool de workers borné, état persisté en SQLite (survit à un redémarrage)
+    
+    La base peut être partagée par plusieurs processus (workers gunicorn): un job est réservé dans SQLite
+    par un seul propriétaire, qui entretient un heartbeat tant qu'il l'exécute. Les workers prennent les jobs
+    en attente dans la base, quel que soit le processus qui les a soumis; seuls les jobs dont le propriétaire
+    ne donne plus de heartbeat sont remis en file.
+    """
+    
+    def __init__(self, handler, db_path=None, workers=None, max_pending=None):
+        self.handler = handler
+        self.db_path = db_path or JOBS_DB
+        self.workers = workers or JOB_WORKERS
+        self.max_pending = max_pending or JOB_QUEUE_LIMIT
+        # Propriétaire des jobs réservés par cette file (machine, processus, instance)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Réveil des workers locaux à la soumission (sinon scrutation de la base)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._init_db()
+    
+    @contextmanager
+    def _connect(self):
+        """Connexion à la base des jobs du bloc: transaction validée (annulée sur erreur), puis connexion fermée"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)')
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in JOB_OWNER_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+    
+    def start(self):
+        """Relance les jobs abandonnés puis démarre les workers et le heartbeat"""
+        if self._threads:
+            return
+        
+        requeued = self.requeue_stale()
+        self.prune()
+        
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"report-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        
+        thread = threading.Thread(target=self._heartbeat, name="report-jobs-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        
+        print(f"🧵 {self.workers} workers de rapports démarrés ({requeued} jobs repris)")
+    
+    def requeue_stale(self):
+        """Remet en file les jobs 'running' dont le propriétaire n'a plus donné de heartbeat (processus arrêté)"""
+        with self._connect() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, heartbeat = NULL, started_at = NULL "
+                "WHERE status = 'running' AND (heartbeat IS NULL OR heartbeat < ?)",
+                (time.time() - JOB_STALE_SECONDS,)
+            ).rowcount
+    
+    def prune(self, older_than=None):
+        """Supprime les jobs terminés ou en échec depuis plus de older_than secondes (JOB_RETENTION_SECONDS par défaut)"""
+        older_than = JOB_RETENTION_SECONDS if older_than is None else older_than
+        if older_than <= 0:
+            return 0
+        
+        cutoff = (datetime.now() - timedelta(seconds=older_than)).isoformat()
+        with self._connect() as conn:
+            removed = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (cutoff,)
+            ).rowcount
+        if removed:
+            print(f"🧹 {removed} jobs terminés supprimés (plus de {older_than:.0f} s)")
+        return removed
+    
+    def submit(self, params):
+        """Enregistre un job et le met en file; lève QueueFullError si la file est pleine"""
+        with self._lock:
+            with self._connect() as conn:
+                pending = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if pending >= self.max_pending:
+                    raise QueueFullError(f"{pending} jobs en attente (limite {self.max_pending})")
+                
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    "INSERT INTO jobs (id, status, params, created_at) VALUES (?, 'queued', ?, ?)",
+                    (job_id, json.dumps(params), datetime.now().isoformat())
+                )
+        
+        self._queue.put(None)
+        return job_id
+    
+    def get(self, job_id):
+        """Retourne l'état d'un job (None s'il n'existe pas)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, params, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+    
+    def list(self, limit=50):
+        """Liste les jobs les plus récents"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, status, params, result, error, created_at, started_at, finished_at FROM jobs "
+                "ORDER BY created_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+    
+    def stats(self):
+        """Nombre de jobs par statut"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+    
+    @staticmethod
+    def _row_to_job(row):
+        job_id, status, params, result, error, created_at, started_at, finished_at = row
+        return {
+            'jobId': job_id,
+            'status': status,
+            'params': json.loads(params),
+            'result': json.loads(result) if result else None,
+            'error': error,
+            'createdAt': created_at,
+            'startedAt': started_at,
+            'finishedAt': finished_at
+        }
+    
+    def _worker(self):
+        while True:
+            try:
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                print(f"⚠️ Réservation de job impossible: {e}")
+                claimed = None
+            
+            if claimed is None:
+                # Rien en attente: réveil par une soumission locale, sinon nouvelle scrutation de la base
+                try:
+                    self._queue.get(timeout=JOB_POLL_SECONDS)
+                except queue.Empty:
+                    pass
+                continue
+            
+            self._run(*claimed)
+    
+    def _claim(self):
+        """Réserve le plus ancien job en attente pour ce propriétaire: (id, paramètres) ou None"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, params FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, started_at = ? WHERE id = ?",
+                (self.owner, time.time(), datetime.now().isoformat(), row[0])
+            )
+        return row[0], json.loads(row[1])
+    
+    def _heartbeat(self):
+        """Signale les jobs en cours de ce propriétaire, reprend ceux des propriétaires disparus et purge les jobs terminés"""
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND owner = ?",
+                        (time.time(), self.owner)
+                    )
+                if self.requeue_stale():
+                    self._queue.put(None)
+                self.prune()
+            except sqlite3.Error as e:
+                print(f"⚠️ Heartbeat des jobs en échec: {e}")
+    
+    def _run(self, job_id, params):
+        try:
+            result = self.handler(params)
+            status, result_json, error = 'done', json.dumps(result, default=str), None
+        except Exception as e:
+            print(f"❌ Erreur job {job_id}: {e}")
+            status, result_json, error = 'failed', None, str(e)
+        
+        with self._connect() as conn:
+            # Sans effet si le job a été repris par un autre propriétaire entre-temps
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND owner = ?",
+                (status, result_json, error, datetime.now().isoformat(), job_id, self.owner)
+            )
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Backend local (SQLite + dossier) remplaçant Firestore et Firebase Storage, pour le profilage et les tests de charge
+"""
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Dossier du backend local: base SQLite des documents et fichiers du bucket
+LOCAL_BACKEND_DIR = os.environ.get('ANALYTICS_LOCAL_DIR', '/tmp/analytics_local')
+
+# Champs indexés (index d'expression SQLite) pour les filtres et tris utilisés par DataExtractor
+LOCAL_INDEXED_FIELDS = ('date', 'shopId', 'createdAt')
+
+# Opérateurs Firestore supportés
+QUERY_OPERATORS = {'==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+def _field_expression(field):
+    """Expression SQL d'un champ de document ('__name__' = identifiant du document)"""
+    if field == '__name__':
+        return 'id'
+    return f"json_extract(data, '$.\"{field}\"')"
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class LocalDocument:
+    """Document lu depuis le backend local (même interface que DocumentSnapshot)"""
+    
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+    
+    @property
+    def exists(self):
+        return self._data is not None
+    
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+    
+    def get(self, field):
+        return self._data.get(field) if self._data is not None else None
+
+class LocalDocumentReference:
+    """Référence de document: lecture, écriture, suppression"""
+    
+    def __init__(self, store, collection, doc_id):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+    
+    def set(self, data):
+        self._store.write(self._collection, [(self.id, data)])
+    
+    def get(self):
+        with self._store.connect() as conn:
+            row = conn.execute(
+                "SELECT data FROM documents WHERE collection = ? AND id = ?", (self._collection, self.id)
+            ).fetchone()
+        return LocalDocument(self.id, json.loads(row[0]) if row else None)
+    
+    def delete(self):
+        with self._store.connect() as conn:
+            conn.execute("DELETE FROM documents WHERE collection = ? AND id = ?", (self._collection, self.id))
+
+class LocalQuery:
+    """Requête sur une collection: where / select / order_by / limit / start_after / stream"""
+    
+    def __init__(self, store, collection, filters=(), fields=None, orders=(), limit_count=None, cursor=None):
+        self._store = store
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._fields = fields
+        self._orders = tuple(orders)
+        self._limit = limit_count
+        self._cursor = cursor
+    
+    def _copy(self, **changes):
+        state = {
+            'filters': self._filters,
+            'fields': self._fields,
+            'orders': self._orders,
+            'limit_count': self._limit,
+            'cursor': self._cursor
+        }
+        state.update(changes)
+        return LocalQuery(self._store, self._collection, **state)
+    
+    def where(self, field, op, value):
+        if op not in QUERY_OPERATORS:
+            raise ValueError(f"Opérateur non supporté par le backend local: {op}")
+        return self._copy(filters=self._filters + ((field, op, value),))
+    
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+    
+    def order_by(self, field, direction='ASCENDING'):
+        return self._copy(orders=self._orders + ((field, direction),))
+    
+    def limit(self, count):
+        return self._copy(limit_count=count)
+    
+    def start_after(self, document):
+        return self._copy(cursor=document)
+    
+    def count(self, alias=None):
+        return LocalAggregationQuery(self, alias)
+    
+    def _sql(self):
+        clauses = ["collection = ?"]
+        params = [self._collection]
+        
+        for field, op, value in self._filters:
+            clauses.append(f"{_field_expression(field)} {QUERY_OPERATORS[op]} ?")
+            params.append(value)
+        
+        # Comme Firestore: un champ trié doit exister dans le document
+        for field, _ in self._orders:
+            if field != '__name__':
+                clauses.append(f"{_field_expression(field)} IS NOT NULL")
+        
+        # Curseur: (f1, f2, ...) strictement après les valeurs du document, selon le sens de chaque tri
+        if self._cursor is not None and self._orders:
+            alternatives = []
+            for index, (field, direction) in enumerate(self._orders):
+                terms = []
+                for previous, _ in self._orders[:index]:
+                    terms.append(f"{_field_expression(previous)} = ?")
+                    params.append(self._cursor_value(previous))
+                terms.append(f"{_field_expression(field)} {'<' if direction == 'DESCENDING' else '>'} ?")
+                params.append(self._cursor_value(field))
+                alternatives.append("(" + " AND ".join(terms) + ")")
+            clauses.append("(" + " OR ".join(alternatives) + ")")
+        
+        sql = "SELECT id, data FROM documents WHERE " + " AND ".join(clauses)
+        if self._orders:
+            sql += " ORDER BY " + ", ".join(
+                f"{_field_expression(field)} {'DESC' if direction == 'DESCENDING' else 'ASC'}"
+                for field, direction in self._orders
+            )
+        if self._limit:
+            sql += " LIMIT ?"
+            params.append(self._limit)
+        return sql, params
+    
+    def _cursor_value(self, field):
+        if field == '__name__':
+            return self._cursor.id
+        return self._cursor.get(field)
+    
+    def stream(self):
+        sql, params = self._sql()
+        with self._store.connect() as conn:
+            for doc_id, data in conn.execute(sql, params):
+                data = json.loads(data)
+                if self._fields is not None:
+                    data = {field: data[field] for field in self._fields if field in data}
+                yield LocalDocument(doc_id, data)
+    
+    def get(self):
+        return list(self.stream())
+
+class LocalAggregationResult:
+    """Résultat d'agrégation (même interface que AggregationResult: alias, value)"""
+    
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+class LocalAggregationQuery:
+    """Comptage des documents d'une requête, sans les lire (query.count())"""
+    
+    def __init__(self, query, alias=None):
+        self._query = query
+        self._alias = alias or 'count'
+    
+    def get(self):
+        sql, params = self._query._sql()
+        with self._query._store.connect() as conn:
+            count = conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+        return [[LocalAggregationResult(self._alias, count)]]
+
+class LocalCollection(LocalQuery):
+    """Collection du backend local (requête sans filtre + références de documents)"""
+    
+    def __init__(self, store, collection):
+        super().__init__(store, collection)
+    
+    def document(self, doc_id):
+        return LocalDocumentReference(self._store, self._collection, doc_id)
+    
+    def add(self, data):
+        import uuid
+        doc_id = uuid.uuid4().hex[:20]
+        self._store.write(self._collection, [(doc_id, data)])
+        return None, LocalDocumentReference(self._store, self._collection, doc_id)
+
+class LocalFirestore:
+    """Stand-in de Firestore sur SQLite (un document = une ligne JSON, champs filtrés indexés)"""
+    
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(LOCAL_BACKEND_DIR, 'firestore.sqlite3')
+        directory = os.path.dirname(self.db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._init_db()
+    
+    @contextmanager
+    def connect(self):
+        """Connexion SQLite du bloc: transaction validée (annulée sur erreur), puis connexion fermée"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def _init_db(self):
+        with self.connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS documents (
+                    collection TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (collection, id)
+                )
+            ''')
+            for field in LOCAL_INDEXED_FIELDS:
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS documents_{field} "
+                    f"ON documents (collection, {_field_expression(field)}, id)"
+                )
+    
+    def collection(self, name):
+        return LocalCollection(self, name)
+    
+    def write(self, collection, documents):
+        """Écrit (ou remplace) des documents [(id, données)] en une transaction"""
+        with self.connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO documents (collection, id, data) VALUES (?, ?, ?)",
+                ((collection, str(doc_id), json.dumps(data, default=_json_default, ensure_ascii=False))
+                 for doc_id, data in documents)
+            )
+    
+    def import_dataframe(self, collection, df, id_column='id'):
+        """Importe un DataFrame (une ligne = un document, colonne id_column = identifiant)"""
+        records = df.to_dict('records')
+        self.write(collection, (
+            (record.pop(id_column), {key: value for key, value in record.items() if value is not None and value == value})
+            for record in records
+        ))
+        return len(records)
+    
+    def count(self, collection):
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM documents WHERE collection = ?", (collection,)).fetchone()[0]
+
+class LocalBlob:
+    """Fichier du bucket local (même interface que google.cloud.storage.Blob pour nos usages)"""
+    
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+    
+    def _prepare(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+    
+    def upload_from_filename(self, filename, content_type=None):
+        self._prepare()
+        tmp_path = self.path + '.tmp'
+        shutil.copyfile(filename, tmp_path)
+        os.replace(tmp_path, self.path)
+    
+    def upload_from_file(self, file_obj, content_type=None, rewind=False, size=None):
+        if rewind:
+            file_obj.seek(0)
+        self._prepare()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(file_obj, f)
+        os.replace(tmp_path, self.path)
+    
+    def upload_from_string(self, data, content_type=None):
+        self._prepare()
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+    
+    def download_to_filename(self, filename):
+        shutil.copyfile(self.path, filename)
+    
+    def download_as_bytes(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+    
+    def exists(self):
+        return os.path.exists(self.path)
+    
+    def delete(self):
+        os.remove(self.path)
+    
+    def make_public(self):
+        pass
+    
+    def reload(self):
+        pass
+    
+    @property
+    def size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else None
+    
+    @property
+    def time_created(self):
+        if not os.path.exists(self.path):
+            return None
+        return datetime.fromtimestamp(os.path.getmtime(self.path), tz=timezone.utc)
+    
+    @property
+    def public_url(self):
+        return f"file://{os.path.abspath(self.path)}"
+    
+    def generate_signed_url(self, **kwargs):
+        return self.public_url
+
+class LocalBucket:
+    """Stand-in de Firebase Storage: un dossier du système de fichiers"""
+    
+    def __init__(self, root=None):
+        self.root = root or os.path.join(LOCAL_BACKEND_DIR, 'bucket')
+        self.name = 'local'
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+    
+    def exists(self):
+        return os.path.isdir(self.root)
+    
+    def blob(self, name):
+        return LocalBlob(self, name)
+    
+    def get_blob(self, name):
+        blob = LocalBlob(self, name)
+        return blob if blob.exists() else None
+    
+    def list_blobs(self, prefix=''):
+        blobs = []
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                if filename.endswith('.tmp'):
+                    continue
+                name = os.path.relpath(os.path.join(directory, filename), self.root).replace(os.sep, '/')
+                if name.startswith(prefix):
+                    blobs.append(LocalBlob(self, name))
+        return sorted(blobs, key=lambda blob: blob.name)
+
+_lock = threading.Lock()
+_firestore = None
+_bucket = None
+
+def get_local_firestore():
+    """Instance partagée du Firestore local"""
+    global _firestore
+    with _lock:
+        if _firestore is None:
+            _firestore = LocalFirestore()
+        return _firestore
+
+def get_local_bucket():
+    """Instance partagée du bucket local"""
+    global _bucket
+    with _lock:
+        if _bucket is None:
+            _bucket = LocalBucket()
+        return _bucket
+
+def initialize_local_backend():
+    """Prépare la base et le bucket locaux (aucun credential nécessaire)"""
+    get_local_firestore()
+    get_local_bucket()
+    print(f"✅ Backend local initialisé ({LOCAL_BACKEND_DIR})")
+    return True
+
+def seed(rows, shops, seed_value=0):
+    """Remplit le Firestore local avec le jeu de données synthétique du benchmark"""
+    from benchmark import generate_dataset
+    
+    db = get_local_firestore()
+    dataset = generate_dataset(rows, shops, seed=seed_value)
+    for collection, df in dataset.items():
+        count = db.import_dataframe(collection, df)
+        print(f"✅ {collection}: {count} documents importés")
+    
+    shop_ids = sorted(dataset['operations']['shopId'].unique())
+    db.write('shops', ((shop_id, {'name': shop_id}) for shop_id in shop_ids))
+    print(f"✅ shops: {len(shop_ids)} documents importés")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backend local (SQLite + dossier) Shop Ararat')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    seed_parser = subparsers.add_parser('seed', help='Remplir la base locale avec des données synthétiques')
+    seed_parser.add_argument('--rows', type=int, default=100000,
+                             help='Nombre de documents par collection datée')
+    seed_parser.add_argument('--shops', type=int, default=10,
+                             help='Nombre de shops')
+    seed_parser.add_argument('--seed', type=int, default=0,
+                             help='Graine du générateur')
+    
+    subparsers.add_parser('stats', help='Nombre de documents par collection')
+    subparsers.add_parser('reset', help='Supprimer la base et le bucket locaux')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'seed':
+        seed(args.rows, args.shops, args.seed)
+    elif args.command == 'stats':
+        db = get_local_firestore()
+        with db.connect() as conn:
+            for collection, count in conn.execute(
+                "SELECT collection, COUNT(*) FROM documents GROUP BY collection ORDER BY collection"
+            ):
+                print(f"  {collection}: {count}")
+    elif args.command == 'reset':
+        shutil.rmtree(LOCAL_BACKEND_DIR, ignore_errors=True)
+        print(f"🗑️ Backend local supprimé ({LOCAL_BACKEND_DIR})")
+    
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
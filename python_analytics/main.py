@@ -3,6 +3,7 @@
 Script principal pour l'analyse et l'export des données Shop Ararat
 """
 
+import os
 import sys
 import argparse
 from datetime import datetime, timedelta
@@ -12,7 +13,20 @@ from dateutil.relativedelta import relativedelta
 from config import initialize_firebase
 from data_extractor import DataExtractor
 from data_analyzer import DataAnalyzer
-from excel_generator import ExcelGenerator
+from aggregations import DatasetAggregates
+from excel_generator import ExcelGenerator, REPORT_FIELDS
+from rollups import RollupStore, ROLLUP_SPECS
+from sketches import SketchStore, SKETCH_SPECS
+from report_planner import plan_report
+from exporters import EXPORT_COLLECTIONS, EXPORT_FORMATS, iter_export, export_filename
+from batch_reports import run_per_shop_batch, write_manifest
+
+# Rapport mensuel automatique avec les données brutes (ANALYTICS_MONTHLY_RAW_DATA=0: onglets de synthèse
+# calculés depuis les agrégats journaliers, sans relire les documents du mois)
+MONTHLY_RAW_DATA = os.environ.get('ANALYTICS_MONTHLY_RAW_DATA', '1') == '1'
+
+# Analyses à historique calculées par l'analyse en ligne de commande (voir report_planner.ANALYSIS_HISTORY)
+CLI_ANALYSES = ('variation_ventes', 'tendances_ventes')
 
 def main():
     """Fonction principale"""
@@ -33,6 +47,14 @@ def main():
                        help='Mois/Année pour rapport mensuel (YYYY-MM)')
     parser.add_argument('--all-data', action='store_true',
                        help='Extraire toutes les données sans filtre de date')
+    parser.add_argument('--snapshot', action='store_true',
+                       help='Synchronisation incrémentale dans un snapshot local (Parquet)')
+    parser.add_argument('--summary-only', action='store_true',
+                       help='Onglets de synthèse uniquement (ne lit que les champs nécessaires)')
+    parser.add_argument('--streaming', action='store_true',
+                       help='Données brutes écrites en flux (mémoire constante, pour --all-data)')
+    parser.add_argument('--rollups', action='store_true',
+                       help='Analyses et rapport de synthèse depuis les agrégats journaliers (sans données brutes)')
     
     args = parser.parse_args()
     
@@ -45,53 +67,47 @@ def main():
         sys.exit(1)
     
     # Initialiser les classes
-    extractor = DataExtractor()
+    extractor = DataExtractor(use_snapshot=args.snapshot)
     analyzer = DataAnalyzer()
     excel_gen = ExcelGenerator()
     
-    # Définir les dates
+    # Définir les dates (plan de requêtes: la lecture des opérations est élargie pour les analyses à historique)
     if args.all_data:
         # Extraire toutes les données sans filtre de date
-        start_date = None
-        end_date = None
+        plan = plan_report('custom', shop_id=args.shop, analyses=CLI_ANALYSES)
         print("📅 Extraction de TOUTES les données (sans filtre de date)")
     elif args.start_date and args.end_date:
-        start_date = args.start_date
-        end_date = args.end_date
+        plan = plan_report('custom', start_date=args.start_date, end_date=args.end_date, shop_id=args.shop,
+                           analyses=CLI_ANALYSES)
     elif args.month_year:
-        start_date = f"{args.month_year}-01"
-        end_date = (datetime.strptime(start_date, "%Y-%m-%d") + relativedelta(months=1, days=-1)).strftime("%Y-%m-%d")
+        plan = plan_report('monthly', month_year=args.month_year, shop_id=args.shop, analyses=CLI_ANALYSES)
     else:
         # Par défaut: dernier mois
-        end_date = datetime.now().strftime("%Y-%m-%d")
-        start_date = (datetime.now() - relativedelta(months=1)).strftime("%Y-%m-%d")
+        plan = plan_report('custom', start_date=(datetime.now() - relativedelta(months=1)).strftime("%Y-%m-%d"),
+                           end_date=datetime.now().strftime("%Y-%m-%d"), shop_id=args.shop, analyses=CLI_ANALYSES)
+    start_date, end_date = plan.start_date, plan.end_date
     
     print(f"📅 Période d'analyse: {start_date} à {end_date}")
     print(f"🏪 Shop: {args.shop}")
     print(f"📊 Période: {args.period}")
     
+    if args.rollups:
+        run_rollup_analysis(extractor, analyzer, excel_gen, plan, args)
+        return
+    
     # Extraire les données
     print("\n📥 Extraction des données...")
-    
-    operations_df = extractor.get_operations_data(
-        start_date=start_date, 
-        end_date=end_date, 
-        shop_id=args.shop
-    )
-    
-    depots_df = extractor.get_depots_data(
-        start_date=start_date, 
-        end_date=end_date, 
-        shop_id=args.shop
-    )
-    
-    clients_df = extractor.get_clients_data(shop_id=args.shop)
-    
-    mouvements_df = extractor.get_mouvements_data(
-        start_date=start_date, 
-        end_date=end_date, 
-        shop_id=args.shop
-    )
+    print(plan.describe())
+    
+    # En mode flux, seules les colonnes de synthèse sont chargées: les données brutes sont relues page par page
+    report_kind = 'summary' if (args.summary_only or args.streaming) else 'full'
+    history = plan.extract(extractor, fields=REPORT_FIELDS[report_kind])
+    # Rapport et statistiques sur la seule période; l'historique ne sert qu'aux variations et tendances
+    data = plan.in_period(history)
+    operations_df = data['operations']
+    depots_df = data['depots']
+    clients_df = data['clients']
+    mouvements_df = data['mouvements']
     
     shops_df = extractor.get_shops_data()
     
@@ -118,9 +134,14 @@ def main():
     # Analyser les données
     print("\n📈 Analyse des données...")
     
+    # Groupements calculés une fois, partagés par l'analyse et le rapport Excel
+    aggregates = DatasetAggregates(operations_df, depots_df, mouvements_df)
+    history_operations = history['operations']
+    history_aggregates = DatasetAggregates(history_operations, None, None) if plan.history else aggregates
+    
     # Statistiques récapitulatives
     summary_stats = analyzer.generate_summary_stats(
-        operations_df, depots_df, clients_df, mouvements_df
+        operations_df, depots_df, clients_df, mouvements_df, aggregates
     )
     
     if summary_stats:
@@ -130,14 +151,21 @@ def main():
     
     # Analyser les performances de vente
     if not operations_df.empty:
-        sales_analysis = analyzer.analyze_sales_performance(operations_df, args.period)
+        sales_analysis = analyzer.analyze_sales_performance(history_operations, args.period, history_aggregates)
         if not sales_analysis.empty:
             print(f"\n💰 Analyse des ventes par {args.period}:")
             print(sales_analysis.tail())
+        
+        sales_trends = analyzer.analyze_sales_trends(
+            history_operations, start_date, end_date, shop_id='all', aggregates=history_aggregates
+        )
+        if not sales_trends.empty:
+            print(f"\n📈 Tendances des ventes (tous shops):")
+            print(sales_trends[['date', 'moyenne_7j', 'moyenne_30j', 'cumul_mois', 'cumul_annee', 'variation_cumul_annee_n1']].tail())
     
     # Analyser les mouvements de stock
     if not mouvements_df.empty:
-        stock_analysis = analyzer.analyze_stock_movements(mouvements_df, operations_df)
+        stock_analysis = analyzer.analyze_stock_movements(mouvements_df, operations_df, aggregates)
         if stock_analysis:
             print(f"\n📦 Analyse des mouvements de stock:")
             if 'by_type' in stock_analysis and not stock_analysis['by_type'].empty:
@@ -145,7 +173,7 @@ def main():
     
     # Analyser le comportement client
     if not clients_df.empty and not depots_df.empty:
-        client_analysis = analyzer.analyze_client_behavior(clients_df, depots_df)
+        client_analysis = analyzer.analyze_client_behavior(clients_df, depots_df, aggregates)
         if client_analysis:
             print(f"\n👥 Analyse du comportement client:")
             if 'top_clients' in client_analysis and not client_analysis['top_clients'].empty:
@@ -154,7 +182,7 @@ def main():
     
     # Calculer les bénéfices
     if not operations_df.empty:
-        benefits_analysis = analyzer.calculate_benefits(operations_df, mouvements_df)
+        benefits_analysis = analyzer.calculate_benefits(operations_df, mouvements_df, aggregates)
         if benefits_analysis:
             print(f"\n💵 Analyse des bénéfices:")
             if 'shop_benefits' in benefits_analysis and not benefits_analysis['shop_benefits'].empty:
@@ -163,14 +191,25 @@ def main():
     # Générer le rapport Excel
     print("\n📄 Génération du rapport Excel...")
     
-    if args.month_year:
+    if args.streaming and not args.summary_only:
+        raw_chunks = {
+            'operations': extractor.iter_collection('operations', start_date, end_date, args.shop),
+            'depots': extractor.iter_collection('depots', start_date, end_date, args.shop)
+        }
+        filename = excel_gen.create_sales_report(
+            operations_df, depots_df, clients_df, mouvements_df,
+            f"rapport_mensuel_{args.month_year}.xlsx" if args.month_year else None,
+            constant_memory=True, raw_chunks=raw_chunks, aggregates=aggregates
+        )
+    elif args.month_year:
         filename = excel_gen.create_monthly_report(
             operations_df, depots_df, clients_df, mouvements_df, 
-            args.month_year
+            args.month_year, include_raw_data=not args.summary_only
         )
     else:
         filename = excel_gen.create_sales_report(
-            operations_df, depots_df, clients_df, mouvements_df
+            operations_df, depots_df, clients_df, mouvements_df,
+            include_raw_data=not args.summary_only, aggregates=aggregates
         )
     
     if filename:
@@ -179,7 +218,12 @@ def main():
         # Upload vers Firebase si demandé
         if args.upload:
             print("\n☁️ Upload vers Firebase Storage...")
-            download_url = excel_gen.upload_to_firebase(filename)
+            download_url = excel_gen.upload_to_firebase(filename, metadata={
+                'shopId': args.shop,
+                'reportType': 'monthly' if args.month_year else 'custom',
+                'startDate': start_date,
+                'endDate': end_date
+            })
             if download_url:
                 print(f"✅ Fichier disponible à: {download_url}")
             else:
@@ -187,10 +231,75 @@ def main():
         
         print(f"\n🎉 Analyse terminée avec succès!")
         print(f"📁 Fichier local: {filename}")
-        
+    
     else:
         print("❌ Échec de la génération du rapport Excel")
 
+def run_rollup_analysis(extractor, analyzer, excel_gen, plan, args):
+    """Analyses et rapport de synthèse depuis les agrégats journaliers (seuls les nouveaux documents sont lus)"""
+    start_date, end_date = plan.start_date, plan.end_date
+    print("\n📥 Mise à jour des agrégats journaliers...")
+    rollup_store = RollupStore()
+    rollups = rollup_store.sync_all(extractor, start_date, end_date, args.shop)
+    operations_rollup = rollups['operations']
+    depots_rollup = rollups['depots']
+    mouvements_rollup = rollups['mouvements']
+    
+    if operations_rollup.empty and depots_rollup.empty and mouvements_rollup.empty:
+        print("\n⚠️ Aucune donnée trouvée pour la période spécifiée")
+        return
+    
+    print("\n📈 Analyse des agrégats...")
+    
+    summary_stats = analyzer.generate_summary_stats_from_rollups(operations_rollup, depots_rollup, mouvements_rollup)
+    if summary_stats:
+        print("\n📊 Statistiques récapitulatives:")
+        for key, value in summary_stats.items():
+            print(f"  {key}: {value}")
+    
+    if not operations_rollup.empty:
+        # Historique du plan (année précédente) lu dans les agrégats déjà synchronisés
+        history_rollup = rollup_store.get_rollup('operations', *plan.query_range('operations'), args.shop)
+        sales_trends = analyzer.analyze_sales_trends_from_rollups(history_rollup, start_date, end_date, shop_id='all')
+        if not sales_trends.empty:
+            print(f"\n📈 Tendances des ventes (tous shops):")
+            print(sales_trends[['date', 'moyenne_7j', 'moyenne_30j', 'cumul_mois', 'cumul_annee', 'variation_cumul_annee_n1']].tail())
+    
+    if not mouvements_rollup.empty:
+        stock_analysis = analyzer.analyze_stock_movements_from_rollups(mouvements_rollup)
+        if stock_analysis and not stock_analysis['by_type'].empty:
+            print(f"\n📦 Analyse des mouvements de stock:")
+            print(stock_analysis['by_type'])
+    
+    if not operations_rollup.empty:
+        benefits_analysis = analyzer.calculate_benefits_from_rollups(operations_rollup)
+        if benefits_analysis and not benefits_analysis['shop_benefits'].empty:
+            print(f"\n💵 Analyse des bénéfices:")
+            print(benefits_analysis['shop_benefits'])
+    
+    print("\n📄 Génération du rapport Excel...")
+    filename = excel_gen.create_rollup_report(
+        operations_rollup, depots_rollup, mouvements_rollup,
+        f"rapport_mensuel_{args.month_year}.xlsx" if args.month_year else None
+    )
+    if not filename:
+        print("❌ Échec de la génération du rapport Excel")
+        return
+    
+    print(f"✅ Rapport Excel créé: {filename}")
+    if args.upload:
+        print("\n☁️ Upload vers Firebase Storage...")
+        download_url = excel_gen.upload_to_firebase(filename, metadata={
+            'shopId': args.shop,
+            'reportType': 'monthly' if args.month_year else 'custom',
+            'startDate': start_date,
+            'endDate': end_date
+        })
+        if download_url:
+            print(f"✅ Fichier disponible à: {download_url}")
+        else:
+            print("❌ Échec de l'upload")
+
 def run_daily_report():
     """Génère un rapport quotidien automatique"""
     print("📅 Génération du rapport quotidien...")
@@ -204,26 +313,16 @@ def run_daily_report():
     analyzer = DataAnalyzer()
     excel_gen = ExcelGenerator()
     
-    # Date d'hier
+    # Journée d'hier (complète), sans analyse à historique
     yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    plan = plan_report('daily', start_date=yesterday)
+    print(plan.describe())
     
-    # Extraire les données d'hier
-    operations_df = extractor.get_operations_data(
-        start_date=yesterday, 
-        end_date=yesterday
-    )
-    
-    depots_df = extractor.get_depots_data(
-        start_date=yesterday, 
-        end_date=yesterday
-    )
-    
-    clients_df = extractor.get_clients_data()
-    
-    mouvements_df = extractor.get_mouvements_data(
-        start_date=yesterday, 
-        end_date=yesterday
-    )
+    data = plan.extract(extractor)
+    operations_df = data['operations']
+    depots_df = data['depots']
+    clients_df = data['clients']
+    mouvements_df = data['mouvements']
     
     # Générer le rapport
     filename = excel_gen.create_sales_report(
@@ -233,7 +332,9 @@ def run_daily_report():
     
     if filename:
         # Upload automatique
-        download_url = excel_gen.upload_to_firebase(filename, "daily_reports")
+        download_url = excel_gen.upload_to_firebase(filename, "daily_reports", {
+            'reportType': 'daily', 'startDate': yesterday, 'endDate': yesterday
+        })
         print(f"✅ Rapport quotidien généré et uploadé: {download_url}")
 
 def run_monthly_report():
@@ -249,25 +350,166 @@ def run_monthly_report():
     analyzer = DataAnalyzer()
     excel_gen = ExcelGenerator()
     
-    # Mois précédent
-    last_month = (datetime.now() - relativedelta(months=1)).strftime("%Y-%m")
-    
-    # Extraire toutes les données (pas de filtre de date pour avoir le contexte)
-    operations_df = extractor.get_operations_data()
-    depots_df = extractor.get_depots_data()
-    clients_df = extractor.get_clients_data()
-    mouvements_df = extractor.get_mouvements_data()
+    # Mois précédent: seuls ses documents sont lus (plage de dates poussée dans les requêtes, aucune analyse à historique)
+    plan = plan_report('monthly', month_year=(datetime.now() - relativedelta(months=1)).strftime("%Y-%m"))
+    print(plan.describe())
     
-    # Générer le rapport mensuel
-    filename = excel_gen.create_monthly_report(
-        operations_df, depots_df, clients_df, mouvements_df, last_month
-    )
+    if MONTHLY_RAW_DATA:
+        data = plan.extract(extractor)
+        operations_df = data['operations']
+        depots_df = data['depots']
+        clients_df = data['clients']
+        mouvements_df = data['mouvements']
+        
+        # Générer le rapport mensuel
+        filename = excel_gen.create_monthly_report(
+            operations_df, depots_df, clients_df, mouvements_df, plan.month_year
+        )
+    else:
+        # Onglets de synthèse depuis les agrégats journaliers (mêmes onglets que create_monthly_report sans données brutes)
+        rollups = RollupStore().sync_all(extractor, plan.start_date, plan.end_date)
+        summary_stats = analyzer.generate_summary_stats_from_rollups(
+            rollups['operations'], rollups['depots'], rollups['mouvements']
+        )
+        for key, value in summary_stats.items():
+            print(f"  {key}: {value}")
+        filename = excel_gen.create_rollup_report(
+            rollups['operations'], rollups['depots'], rollups['mouvements'],
+            f"rapport_mensuel_{plan.month_year}.xlsx"
+        )
     
     if filename:
         # Upload automatique
-        download_url = excel_gen.upload_to_firebase(filename, "monthly_reports")
+        download_url = excel_gen.upload_to_firebase(filename, "monthly_reports", {
+            'reportType': 'monthly', 'startDate': plan.start_date, 'endDate': plan.end_date
+        })
         print(f"✅ Rapport mensuel généré et uploadé: {download_url}")
 
+def run_rollup_sync():
+    """Met à jour les agrégats et sketches journaliers (shop, jour) avec les nouveaux documents"""
+    print("🔄 Mise à jour des agrégats journaliers...")
+    
+    # Initialiser Firebase
+    if not initialize_firebase():
+        return
+    
+    extractor = DataExtractor()
+    rollup_store = RollupStore()
+    
+    for collection in ROLLUP_SPECS:
+        rollup_store.sync(extractor, collection)
+    
+    # Sketches journaliers (clients distincts, quantiles des montants) pour les analyses longue période
+    sketch_store = SketchStore()
+    for collection in SKETCH_SPECS:
+        sketch_store.sync(extractor, collection)
+    
+    print("✅ Agrégats journaliers à jour")
+
+def run_export(argv):
+    """Exporte une collection en csv.gz, parquet ou ndjson, page par page"""
+    parser = argparse.ArgumentParser(description='Export des données brutes Shop Ararat')
+    parser.add_argument('--collection', choices=EXPORT_COLLECTIONS, default='operations',
+                       help='Collection à exporter')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv.gz',
+                       help='Format du fichier exporté')
+    parser.add_argument('--shop', type=str, default='all',
+                       help='ID du shop (ou "all" pour tous)')
+    parser.add_argument('--start-date', type=str,
+                       help='Date de début (YYYY-MM-DD)')
+    parser.add_argument('--end-date', type=str,
+                       help='Date de fin (YYYY-MM-DD)')
+    parser.add_argument('--output', type=str,
+                       help='Fichier de sortie')
+    
+    args = parser.parse_args(argv)
+    
+    # Initialiser Firebase
+    if not initialize_firebase():
+        return
+    
+    extractor = DataExtractor()
+    output = args.output or export_filename(args.collection, args.format)
+    
+    if args.collection == 'clients':
+        chunks = extractor.iter_collection(args.collection, shop_id=args.shop)
+    else:
+        chunks = extractor.iter_collection(args.collection, args.start_date, args.end_date, args.shop)
+    
+    size = 0
+    with open(output, 'wb') as f:
+        for data in iter_export(chunks, args.format):
+            f.write(data)
+            size += len(data)
+    
+    print(f"✅ Export {args.collection} ({args.format}) écrit: {output} ({size} bytes)")
+
+def run_batch(argv):
+    """Rapports par shop: une seule extraction, workbooks en parallèle, uploads concurrents, manifeste des URLs"""
+    parser = argparse.ArgumentParser(description='Rapports par shop Shop Ararat')
+    parser.add_argument('--per-shop', action='store_true',
+                       help='Un rapport par shop (sinon un seul rapport pour tous les shops)')
+    parser.add_argument('--start-date', type=str,
+                       help='Date de début (YYYY-MM-DD, par défaut hier)')
+    parser.add_argument('--end-date', type=str,
+                       help='Date de fin (YYYY-MM-DD, par défaut la date de début)')
+    parser.add_argument('--month-year', type=str,
+                       help='Mois/Année (YYYY-MM) à la place des dates')
+    parser.add_argument('--workers', type=int,
+                       help='Nombre de processus de génération')
+    parser.add_argument('--upload-workers', type=int,
+                       help='Nombre d\'uploads simultanés')
+    parser.add_argument('--summary-only', action='store_true',
+                       help='Onglets de synthèse uniquement')
+    parser.add_argument('--no-upload', action='store_true',
+                       help='Ne pas uploader les rapports')
+    parser.add_argument('--manifest', type=str,
+                       help='Fichier JSON du manifeste')
+    
+    args = parser.parse_args(argv)
+    
+    # Initialiser Firebase
+    if not initialize_firebase():
+        return None
+    
+    if args.month_year:
+        plan = plan_report('monthly', month_year=args.month_year)
+        label = args.month_year
+    else:
+        start_date = args.start_date or (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+        plan = plan_report('custom', start_date=start_date, end_date=args.end_date or start_date)
+        label = start_date if plan.start_date == plan.end_date else f"{plan.start_date}_{plan.end_date}"
+    start_date, end_date = plan.start_date, plan.end_date
+    
+    print(f"📦 Batch {'par shop' if args.per_shop else 'global'}: {start_date} à {end_date}")
+    
+    # Une seule extraction pour tous les shops
+    extractor = DataExtractor()
+    data = plan.extract(extractor, fields=REPORT_FIELDS['summary' if args.summary_only else 'full'])
+    
+    if args.per_shop:
+        manifest = run_per_shop_batch(
+            data, label,
+            include_raw_data=not args.summary_only,
+            upload=not args.no_upload,
+            workers=args.workers,
+            upload_workers=args.upload_workers,
+            metadata={'reportType': 'batch', 'startDate': start_date, 'endDate': end_date}
+        )
+    else:
+        excel_gen = ExcelGenerator()
+        filename = excel_gen.create_sales_report(
+            data['operations'], data['depots'], data['clients'], data['mouvements'],
+            f"rapport_{label}.xlsx", include_raw_data=not args.summary_only
+        )
+        metadata = {'reportType': 'batch', 'startDate': start_date, 'endDate': end_date}
+        download_url = excel_gen.upload_to_firebase(filename, metadata=metadata) if filename and not args.no_upload else None
+        manifest = {'all': {'shopId': 'all', 'filename': filename, 'downloadUrl': download_url,
+                            'error': None if filename else "Échec de la génération du rapport Excel"}}
+    
+    write_manifest(manifest, label, start_date, end_date, args.manifest)
+    return manifest
+
 if __name__ == "__main__":
     # Vérifier les arguments pour les rapports automatiques
     if len(sys.argv) > 1:
@@ -275,6 +517,12 @@ if __name__ == "__main__":
             run_daily_report()
         elif sys.argv[1] == "monthly":
             run_monthly_report()
+        elif sys.argv[1] == "rollups":
+            run_rollup_sync()
+        elif sys.argv[1] == "export":
+            run_export(sys.argv[2:])
+        elif sys.argv[1] == "batch":
+            run_batch(sys.argv[2:])
         else:
             main()
     else:
@@ -0,0 +1,195 @@
+import time
+import threading
+from contextlib import ContextDecorator
+
+# Bornes des histogrammes (secondes, octets)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (10_000, 100_000, 1_000_000, 5_000_000, 10_000_000, 50_000_000, 100_000_000, 500_000_000)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Compteur Prometheus (valeur croissante par combinaison de labels)"""
+    
+    type_name = 'counter'
+    
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+    
+    def collect(self):
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}_total{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+class Histogram:
+    """Histogramme Prometheus (compte cumulé par borne, somme et nombre d'observations)"""
+    
+    type_name = 'histogram'
+    
+    def __init__(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][index] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+    
+    def time(self, **labels):
+        """Chronomètre un bloc ou une fonction: with metric.time(stage='...'): / @metric.time(...)"""
+        return _Timer(self, labels)
+    
+    def snapshot(self, **labels):
+        """Nombre d'observations et somme d'une série"""
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return (series['count'], series['sum']) if series else (0, 0.0)
+    
+    def collect(self):
+        with self._lock:
+            series_items = [(key, dict(series, counts=list(series['counts']))) for key, series in self._series.items()]
+        
+        lines = []
+        for key, series in sorted(series_items):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series['counts']):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, [('le', _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+class _Timer(ContextDecorator):
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def _recreate_cm(self):
+        # Un chronomètre par appel: la fonction décorée peut s'exécuter dans plusieurs threads
+        return _Timer(self.histogram, self.labels)
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+class MetricsRegistry:
+    """Ensemble des métriques du processus, exposées au format texte Prometheus"""
+    
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+    
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+    
+    def histogram(self, name, documentation, labels=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+    
+    def render(self):
+        """Toutes les métriques au format d'exposition texte Prometheus (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+# Extraction
+FIRESTORE_STREAM_SECONDS = REGISTRY.histogram(
+    'analytics_firestore_stream_seconds', "Temps passé à lire les documents Firestore, par lecture de collection", ['collection']
+)
+FIRESTORE_DOCUMENTS = REGISTRY.counter(
+    'analytics_firestore_documents', "Documents Firestore lus", ['collection']
+)
+DATAFRAME_BUILD_SECONDS = REGISTRY.histogram(
+    'analytics_dataframe_build_seconds', "Construction des DataFrames par étape (records, concat, schema)", ['collection', 'step']
+)
+
+# Analyse et rapport
+ANALYZER_SECONDS = REGISTRY.histogram(
+    'analytics_analyzer_seconds', "Durée des méthodes de DataAnalyzer", ['method']
+)
+EXCEL_SHEET_SECONDS = REGISTRY.histogram(
+    'analytics_excel_sheet_seconds', "Écriture de chaque onglet Excel", ['sheet']
+)
+REPORT_SECONDS = REGISTRY.histogram(
+    'analytics_report_seconds', "Durée de génération d'un rapport (extraction → upload)", ['report_type']
+)
+REPORT_FILE_BYTES = REGISTRY.histogram(
+    'analytics_report_file_bytes', "Taille des fichiers de rapport", ['report_type'], buckets=SIZE_BUCKETS
+)
+REPORTS = REGISTRY.counter(
+    'analytics_reports', "Rapports demandés, par résultat (generated, cached, failed)", ['report_type', 'status']
+)
+
+# Upload
+UPLOAD_SECONDS = REGISTRY.histogram(
+    'analytics_upload_seconds', "Durée des uploads vers Storage", ['folder']
+)
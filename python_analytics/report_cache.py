@@ -0,0 +1,97 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Durée de vie et taille du cache des rapports générés
+REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', 900))
+REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', 64))
+
+class _InFlight:
+    """Calcul en cours partagé par toutes les requêtes identiques"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class ReportCache:
+    """Cache LRU avec TTL des rapports générés, avec dédoublonnage (single-flight) des calculs concurrents"""
+    
+    def __init__(self, max_entries=None, ttl_seconds=None):
+        self.max_entries = max_entries or REPORT_CACHE_SIZE
+        self.ttl_seconds = REPORT_CACHE_TTL if ttl_seconds is None else ttl_seconds
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Retourne le résultat en cache (None si absent ou expiré)"""
+        with self._lock:
+            return self._get_locked(key)
+    
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if time.monotonic() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return result
+    
+    def put(self, key, result):
+        """Ajoute un résultat et évince les entrées les moins récemment utilisées"""
+        with self._lock:
+            self._put_locked(key, result)
+    
+    def _put_locked(self, key, result):
+        if self.ttl_seconds <= 0:
+            return
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def get_or_compute(self, key, compute):
+        """Retourne (résultat, depuis_le_cache)
+        
+        Une seule requête calcule un rapport donné: les requêtes identiques arrivées
+        pendant le calcul attendent son résultat au lieu de relancer le pipeline.
+        """
+        with self._lock:
+            result = self._get_locked(key)
+            if result is not None:
+                return result, True
+            
+            in_flight = self._in_flight.get(key)
+            leader = in_flight is None
+            if leader:
+                in_flight = _InFlight()
+                self._in_flight[key] = in_flight
+        
+        if not leader:
+            in_flight.done.wait()
+            if in_flight.error is not None:
+                raise in_flight.error
+            return in_flight.result, True
+        
+        try:
+            in_flight.result = compute()
+            with self._lock:
+                self._put_locked(key, in_flight.result)
+            return in_flight.result, False
+        except Exception as e:
+            # Les erreurs ne sont pas mises en cache, mais sont transmises aux requêtes en attente
+            in_flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            in_flight.done.set()
+    
+    def clear(self):
+        """Vide le cache"""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Catalogue des rapports uploadés (un document Firestore par fichier), pour lister sans parcourir le bucket
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime, timezone
+from clients import CLIENTS
+
+# Collection Firestore du catalogue
+REPORT_CATALOG_COLLECTION = os.environ.get('ANALYTICS_REPORT_CATALOG', 'report_catalog')
+
+# Validité des URLs signées et marge avant expiration sous laquelle une URL en cache est régénérée (secondes)
+SIGNED_URL_SECONDS = int(os.environ.get('SIGNED_URL_SECONDS', 3600))
+SIGNED_URL_MARGIN_SECONDS = int(os.environ.get('SIGNED_URL_MARGIN_SECONDS', 300))
+
+# Taille de page de /api/list-reports (défaut et maximum)
+CATALOG_PAGE_SIZE = 50
+CATALOG_MAX_PAGE_SIZE = 200
+
+# Noms de fichiers de l'API (rapport_<type>_<AAAAMMJJ>_<HHMMSS>[_<clé>].xlsx), pour retrouver le type des anciens rapports
+API_REPORT_NAME = re.compile(r'^rapport_([a-z]+)_\d{8}_\d{6}(?:_[0-9a-f]{8})?\.xlsx$')
+
+def catalog_id(blob_name):
+    """Identifiant du document catalogue d'un fichier (Firestore interdit '/' dans un identifiant)"""
+    return blob_name.replace('/', '__')
+
+class SignedUrlCache:
+    """URLs signées par fichier, réutilisées jusqu'à `margin` secondes de leur expiration"""
+    
+    def __init__(self, ttl=SIGNED_URL_SECONDS, margin=SIGNED_URL_MARGIN_SECONDS, max_entries=10000):
+        self.ttl = ttl
+        self.margin = min(margin, ttl // 2)
+        self.max_entries = max_entries
+        self._urls = {}
+        self._lock = threading.Lock()
+    
+    def get(self, bucket, blob_name):
+        now = time.time()
+        with self._lock:
+            entry = self._urls.get(blob_name)
+            if entry and entry[1] - self.margin > now:
+                return entry[0]
+        
+        # Signature locale (clé du compte de service), sans appel réseau
+        url = bucket.blob(blob_name).generate_signed_url(version="v4", expiration=self.ttl, method="GET")
+        
+        with self._lock:
+            if blob_name not in self._urls and len(self._urls) >= self.max_entries:
+                self._urls = {name: entry for name, entry in self._urls.items() if entry[1] - self.margin > now}
+                while len(self._urls) >= self.max_entries:
+                    del self._urls[next(iter(self._urls))]
+            self._urls[blob_name] = (url, now + self.ttl)
+        return url
+    
+    def invalidate(self, blob_name):
+        with self._lock:
+            self._urls.pop(blob_name, None)
+
+class ReportCatalog:
+    """Index des rapports: shop, type, période, taille et date de création de chaque fichier uploadé
+    
+    Les entrées sont écrites par ExcelGenerator.upload_to_firebase et lues page par page
+    (createdAt décroissant, curseur = identifiant du dernier document de la page).
+    """
+    
+    def __init__(self, db=None, collection=REPORT_CATALOG_COLLECTION, signed_urls=None):
+        # db: client Firestore (par défaut le client partagé du processus)
+        self._db = db
+        self.collection = collection
+        self.signed_urls = signed_urls or SignedUrlCache()
+    
+    @property
+    def db(self):
+        return self._db or CLIENTS.firestore()
+    
+    def record(self, blob, folder, filename, metadata=None, created_at=None):
+        """Ajoute (ou remplace) l'entrée d'un fichier uploadé"""
+        metadata = metadata or {}
+        entry = {
+            'name': blob.name,
+            'filename': filename,
+            'folder': folder,
+            'shopId': metadata.get('shopId') or 'all',
+            'reportType': metadata.get('reportType'),
+            'startDate': metadata.get('startDate'),
+            'endDate': metadata.get('endDate'),
+            'size': blob.size,
+            'createdAt': (created_at or datetime.now(timezone.utc)).isoformat()
+        }
+        self.db.collection(self.collection).document(catalog_id(blob.name)).set(entry)
+        self.signed_urls.invalidate(blob.name)
+        return entry
+    
+    def list(self, folder='reports', shop_id=None, report_type=None, limit=CATALOG_PAGE_SIZE, cursor=None):
+        """Une page d'entrées, des plus récentes aux plus anciennes: (entrées, curseur de la page suivante)"""
+        limit = max(1, min(limit, CATALOG_MAX_PAGE_SIZE))
+        collection = self.db.collection(self.collection)
+        
+        query = collection.where('folder', '==', folder)
+        if shop_id and shop_id != 'all':
+            query = query.where('shopId', '==', shop_id)
+        if report_type:
+            query = query.where('reportType', '==', report_type)
+        query = query.order_by('createdAt', direction='DESCENDING').order_by('__name__', direction='DESCENDING')
+        
+        if cursor:
+            last_doc = collection.document(cursor).get()
+            if not last_doc.exists:
+                raise ValueError(f"Curseur inconnu: {cursor}")
+            query = query.start_after(last_doc)
+        
+        # Un document de plus que la page: indique s'il reste des entrées
+        docs = list(query.limit(limit + 1).stream())
+        next_cursor = docs[limit - 1].id if len(docs) > limit else None
+        return [dict(doc.to_dict(), id=doc.id) for doc in docs[:limit]], next_cursor
+    
+    def download_url(self, bucket, entry):
+        """URL signée du fichier (en cache jusqu'à peu avant son expiration)"""
+        return self.signed_urls.get(bucket, entry['name'])
+    
+    def backfill(self, bucket, folder='reports'):
+        """Indexe les fichiers du bucket absents du catalogue (rapports uploadés avant le catalogue)"""
+        collection = self.db.collection(self.collection)
+        added = 0
+        for blob in bucket.list_blobs(prefix=f'{folder}/'):
+            if not blob.name.endswith('.xlsx'):
+                continue
+            if collection.document(catalog_id(blob.name)).get().exists:
+                continue
+            filename = blob.name.split('/')[-1]
+            match = API_REPORT_NAME.match(filename)
+            self.record(
+                blob, folder, filename, {'reportType': match.group(1) if match else None},
+                created_at=blob.time_created
+            )
+            added += 1
+        print(f"📚 {added} rapports ajoutés au catalogue ({folder}/)")
+        return added
+
+# Catalogue du processus
+REPORT_CATALOG = ReportCatalog()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Catalogue des rapports uploadés')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    backfill_parser = subparsers.add_parser('backfill', help='Indexer les rapports déjà présents dans le bucket')
+    backfill_parser.add_argument('--folder', type=str, default='reports', help='Dossier du bucket')
+    
+    list_parser = subparsers.add_parser('list', help='Afficher les rapports les plus récents')
+    list_parser.add_argument('--folder', type=str, default='reports', help='Dossier du bucket')
+    list_parser.add_argument('--shop-id', type=str, help='Filtrer par shop')
+    list_parser.add_argument('--type', type=str, help='Filtrer par type de rapport')
+    list_parser.add_argument('--limit', type=int, default=CATALOG_PAGE_SIZE, help='Nombre de rapports')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'backfill':
+        REPORT_CATALOG.backfill(CLIENTS.bucket(), args.folder)
+    elif args.command == 'list':
+        entries, _ = REPORT_CATALOG.list(args.folder, args.shop_id, args.type, args.limit)
+        for entry in entries:
+            print(f"{entry['createdAt']}  {entry['shopId']:<12} {entry['reportType'] or '-':<10} {entry['filename']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
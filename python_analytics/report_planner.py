@@ -0,0 +1,104 @@
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+import pandas as pd
+
+# Historique supplémentaire requis par certaines analyses: {analyse: (collection, mois avant la période)}
+ANALYSIS_HISTORY = {
+    'variation_ventes': ('operations', 1),  # variation des ventes d'un mois sur l'autre
+    'tendances_ventes': ('operations', 13)  # même période l'année précédente (cumul annuel et fenêtre de 30 jours)
+}
+
+# Collections filtrées par date (les clients ne sont filtrés que par shop)
+DATED_COLLECTIONS = ('operations', 'depots', 'mouvements')
+
+class ReportPlan:
+    """Prédicats Firestore d'un rapport: période du rapport, plage lue par collection et shop"""
+    
+    def __init__(self, report_type, start_date, end_date, shop_id='all', history=None):
+        self.report_type = report_type
+        self.start_date = start_date
+        self.end_date = end_date
+        self.shop_id = shop_id or 'all'
+        self.history = history or {}
+    
+    @property
+    def month_year(self):
+        """Mois du rapport (YYYY-MM) pour un rapport mensuel"""
+        return self.start_date[:7] if self.start_date else None
+    
+    def query_range(self, collection):
+        """Plage de dates lue pour une collection (élargie si une analyse a besoin d'historique)"""
+        if collection not in DATED_COLLECTIONS:
+            return None, None
+        
+        start_date = self.start_date
+        months = self.history.get(collection, 0)
+        if start_date and months:
+            start_date = (datetime.strptime(start_date, "%Y-%m-%d") - relativedelta(months=months)).strftime("%Y-%m-%d")
+        return start_date, self.end_date
+    
+    def extract(self, extractor, fields=None):
+        """Extrait les données du plan: chaque collection avec ses propres prédicats (date, shop)"""
+        ranges = {collection: self.query_range(collection) for collection in self.history}
+        return extractor.extract_all(self.start_date, self.end_date, self.shop_id, fields=fields, ranges=ranges)
+    
+    def in_period(self, data):
+        """Données extraites restreintes à la période du rapport (sans l'historique lu pour les analyses)"""
+        result = dict(data)
+        for collection in self.history:
+            df = data.get(collection)
+            if df is None or df.empty or 'date' not in df.columns:
+                continue
+            mask = pd.Series(True, index=df.index)
+            if self.start_date:
+                mask &= df['date'] >= pd.Timestamp(self.start_date)
+            if self.end_date:
+                mask &= df['date'] < pd.Timestamp(self.end_date) + pd.Timedelta(days=1)
+            result[collection] = df[mask]
+        return result
+    
+    def describe(self):
+        """Résumé lisible des prédicats, pour les logs"""
+        lines = [f"📐 Plan {self.report_type}: {self.start_date} → {self.end_date}, shop {self.shop_id}"]
+        for collection, months in self.history.items():
+            start_date, end_date = self.query_range(collection)
+            lines.append(f"  - {collection}: historique de {months} mois ({start_date} → {end_date})")
+        return "\n".join(lines)
+
+def month_range(month_year):
+    """Premier et dernier jour d'un mois YYYY-MM"""
+    start = datetime.strptime(f"{month_year}-01", "%Y-%m-%d")
+    end = start + relativedelta(months=1, days=-1)
+    return start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+def plan_report(report_type, month_year=None, start_date=None, end_date=None, shop_id='all', analyses=()):
+    """Résout un type de rapport en prédicats Firestore (plage de dates + shop), pour l'API comme pour le CLI
+    
+    daily: start_date (par défaut aujourd'hui); monthly: le mois month_year s'il est donné, sinon de start_date
+    (par défaut le 1er du mois en cours) à end_date (par défaut aujourd'hui); yearly: l'année en cours jusqu'à
+    aujourd'hui; custom: les dates fournies (None = pas de filtre).
+    analyses: analyses effectivement calculées sur les données extraites; la plage n'est élargie que pour
+    celles qui ont besoin d'historique (voir ANALYSIS_HISTORY).
+    """
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    
+    if report_type == 'daily':
+        day = start_date or today
+        start_date, end_date = day, day
+    elif report_type == 'monthly':
+        if month_year:
+            start_date, end_date = month_range(month_year)
+        else:
+            start_date = start_date or now.replace(day=1).strftime("%Y-%m-%d")
+            end_date = end_date or today
+    elif report_type == 'yearly':
+        start_date, end_date = f"{now.year}-01-01", today
+    
+    history = {}
+    for analysis in analyses:
+        if analysis in ANALYSIS_HISTORY:
+            collection, months = ANALYSIS_HISTORY[analysis]
+            history[collection] = max(history.get(collection, 0), months)
+    
+    return ReportPlan(report_type, start_date, end_date, shop_id, history)
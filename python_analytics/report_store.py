@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou inter-processus, le cache du processus dédoublonne seul
+    fcntl = None
+
+# Dossier du store des rapports (fichiers par contenu + index SQLite partagé entre les workers du serveur)
+REPORT_STORE_DIR = os.environ.get('REPORT_STORE_DIR', '/tmp/generated_reports')
+
+# Budget disque du store (Mo): au-delà, les rapports les moins récemment servis sont supprimés
+REPORT_STORE_MB = int(os.environ.get('REPORT_STORE_MB', 512))
+
+# Âge au-delà duquel un fichier temporaire orphelin (processus interrompu pendant l'écriture) est supprimé
+TEMP_FILE_MAX_AGE = 3600
+
+def report_key(*inputs):
+    """Clé d'un rapport: empreinte SHA-256 de ses paramètres résolus (type, shop, période, watermark...)"""
+    payload = json.dumps(inputs, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ReportStore:
+    """Store local des rapports adressé par clé, borné en taille (éviction LRU), partagé entre processus
+    
+    Chaque rapport est écrit une seule fois (fichier temporaire puis os.replace) sous objects/<clé>.xlsx.
+    L'index SQLite (nom, taille, dernier accès, URL Storage) est commun à tous les workers: un rapport
+    rendu par l'un est servi par les autres, et lock(clé) empêche deux rendus simultanés du même rapport.
+    """
+    
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or REPORT_STORE_DIR
+        self.max_bytes = (REPORT_STORE_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.locks_dir = os.path.join(self.root, 'locks')
+        self.db_path = os.path.join(self.root, 'index.sqlite3')
+        for directory in (self.objects_dir, self.locks_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        self._init_db()
+        self._remove_stale_temp_files()
+    
+    @contextmanager
+    def _connect(self):
+        """Connexion à l'index du bloc: transaction validée (annulée sur erreur), puis connexion fermée"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS reports (
+                    key TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL UNIQUE,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    download_url TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS reports_last_access ON reports (last_access)')
+    
+    def _remove_stale_temp_files(self):
+        now = time.time()
+        for name in os.listdir(self.objects_dir):
+            path = os.path.join(self.objects_dir, name)
+            if name.startswith('.tmp-') and now - os.path.getmtime(path) > TEMP_FILE_MAX_AGE:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    
+    def path(self, key):
+        return os.path.join(self.objects_dir, f"{key}.xlsx")
+    
+    def temp_path(self):
+        """Chemin temporaire dans le store (même système de fichiers: put(source_path=...) est un simple renommage)"""
+        return os.path.join(self.objects_dir, f".tmp-{uuid.uuid4().hex}.xlsx")
+    
+    @staticmethod
+    def _entry(row):
+        key, filename, size, created_at, last_access, download_url = row
+        return {
+            'key': key,
+            'filename': filename,
+            'size': size,
+            'createdAt': created_at,
+            'lastAccess': last_access,
+            'downloadUrl': download_url
+        }
+    
+    def _lookup(self, column, value):
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT key, filename, size, created_at, last_access, download_url FROM reports WHERE {column} = ?",
+                (value,)
+            ).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(self.path(row[0])):
+                # Fichier supprimé hors du store: l'entrée n'est plus valide
+                conn.execute("DELETE FROM reports WHERE key = ?", (row[0],))
+                return None
+            conn.execute("UPDATE reports SET last_access = ? WHERE key = ?", (time.time(), row[0]))
+        entry = self._entry(row)
+        entry['path'] = self.path(entry['key'])
+        return entry
+    
+    def get(self, key):
+        """Entrée du rapport (avec 'path') ou None; compte comme un accès pour l'éviction"""
+        return self._lookup('key', key)
+    
+    def find(self, filename):
+        """Entrée d'un rapport par son nom de fichier (pour /api/download-report)"""
+        return self._lookup('filename', filename)
+    
+    def put(self, key, filename, data=None, source_path=None):
+        """Enregistre un rapport: octets `data` ou fichier `source_path` déplacé dans le store (écriture atomique)"""
+        path = self.path(key)
+        if data is not None:
+            tmp_path = self.temp_path()
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        else:
+            os.replace(source_path, path)
+        
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (key, filename, size, created_at, last_access, download_url) "
+                "VALUES (?, ?, ?, ?, ?, NULL)",
+                (key, filename, os.path.getsize(path), now, now)
+            )
+        self.evict(keep=key)
+        return self.get(key)
+    
+    def set_download_url(self, key, download_url):
+        """URL Storage du rapport, une fois l'upload terminé"""
+        with self._connect() as conn:
+            conn.execute("UPDATE reports SET download_url = ? WHERE key = ?", (download_url, key))
+    
+    def evict(self, keep=None):
+        """Supprime les rapports les moins récemment servis tant que le store dépasse son budget"""
+        removed = []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM reports").fetchone()[0]
+            if total > self.max_bytes:
+                for key, size in conn.execute(
+                    "SELECT key, size FROM reports WHERE key != ? ORDER BY last_access", (keep or '',)
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM reports WHERE key = ?", (key,))
+                    removed.append(key)
+                    total -= size
+        
+        # Fichiers supprimés après la transaction: un téléchargement déjà ouvert se termine normalement
+        for key in removed:
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+            self._remove_lock_file(key)
+        if removed:
+            print(f"🧹 {len(removed)} rapports évincés du store ({total / 1024 / 1024:.1f} Mo conservés)")
+        return len(removed)
+    
+    def _lock_path(self, key):
+        return os.path.join(self.locks_dir, f"{key}.lock")
+    
+    def _remove_lock_file(self, key):
+        """Supprime le fichier de verrou d'une entrée évincée, seulement s'il n'est tenu par personne
+        
+        Le verrou est pris (sans attendre) avant la suppression: un rendu en cours garde son fichier.
+        """
+        lock_path = self._lock_path(key)
+        try:
+            with open(lock_path, 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(lock_path)
+        except OSError:
+            pass
+    
+    @contextmanager
+    def lock(self, key):
+        """Verrou exclusif sur une clé, entre threads et entre processus (rendu unique d'un rapport)
+        
+        flock porte sur le fichier ouvert: deux ouvertures, même dans un seul processus, s'excluent.
+        Si evict a supprimé le fichier pendant l'attente, le verrou obtenu porte sur un fichier orphelin:
+        le fichier présent dans locks/ est alors rouvert et verrouillé à son tour.
+        """
+        lock_path = self._lock_path(key)
+        while True:
+            lock_file = open(lock_path, 'a')
+            if fcntl is None:
+                break
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                opened, current = os.fstat(lock_file.fileno()), os.stat(lock_path)
+                if (opened.st_dev, opened.st_ino) == (current.st_dev, current.st_ino):
+                    break
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+        
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+    
+    def stats(self):
+        with self._connect() as conn:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM reports").fetchone()
+        return {'reports': count, 'bytes': total, 'maxBytes': self.max_bytes}
@@ -0,0 +1,139 @@
+import os
+import pandas as pd
+from snapshot_store import SnapshotStore
+from schemas import apply_schema
+
+# Dossier des agrégats journaliers matérialisés
+ROLLUP_DIR = os.environ.get('ANALYTICS_ROLLUP_DIR', '/tmp/analytics_rollups')
+
+# Montant agrégé et dimensions supplémentaires par collection (clé de base: shopId + day)
+ROLLUP_SPECS = {
+    'operations': {'amount': 'total_general', 'dimensions': ['type', 'devise']},
+    'depots': {'amount': 'montant', 'dimensions': ['devise', 'clientId']},
+    'mouvements': {'amount': 'montant', 'dimensions': ['type', 'devise']}
+}
+
+ROLLUP_METRICS = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+def rollup_keys(collection):
+    """Colonnes clés d'un agrégat journalier"""
+    return ['shopId', 'day'] + ROLLUP_SPECS[collection]['dimensions']
+
+def rollup_fields(collection):
+    """Champs Firestore nécessaires pour construire les agrégats d'une collection"""
+    spec = ROLLUP_SPECS[collection]
+    return ['shopId', 'date', 'createdAt', spec['amount']] + spec['dimensions']
+
+def as_key(values):
+    """Colonne clé en texte, valeurs manquantes remplacées par une chaîne vide"""
+    return values.astype(object).where(values.notna(), '').astype(str)
+
+def with_missing_keys(rollup):
+    """Agrégats dont les clés vides (valeurs manquantes, voir as_key) redeviennent NaN, comme dans les données brutes:
+    les groupements les ignorent et nunique ne les compte pas"""
+    keys = [column for column in rollup.columns if column not in ROLLUP_METRICS and column != 'day']
+    if rollup.empty or not keys:
+        return rollup
+    rollup = rollup.copy()
+    for key in keys:
+        rollup[key] = rollup[key].where(rollup[key] != '')
+    return rollup
+
+def compute_rollup(collection, df):
+    """Agrège des lignes (déjà passées par le schéma) par (shop, jour, dimensions)"""
+    spec = ROLLUP_SPECS[collection]
+    keys = rollup_keys(collection)
+    
+    if df.empty or 'date' not in df.columns or spec['amount'] not in df.columns:
+        return pd.DataFrame(columns=keys + list(ROLLUP_METRICS))
+    
+    frame = pd.DataFrame({
+        'shopId': as_key(df['shopId']) if 'shopId' in df.columns else '',
+        'day': df['date'].dt.normalize(),
+        'amount': df[spec['amount']]
+    }, index=df.index)
+    for dimension in spec['dimensions']:
+        frame[dimension] = as_key(df[dimension]) if dimension in df.columns else ''
+    
+    rollup = frame.groupby(keys, observed=True, dropna=False)['amount'].agg(['sum', 'count', 'min', 'max'])
+    return rollup.reset_index()
+
+def merge_rollups(collection, *rollups):
+    """Combine des agrégats partiels (sommes et comptes additionnés, min/max conservés)"""
+    rollups = [rollup for rollup in rollups if rollup is not None and not rollup.empty]
+    if not rollups:
+        return pd.DataFrame(columns=rollup_keys(collection) + list(ROLLUP_METRICS))
+    if len(rollups) == 1:
+        return rollups[0]
+    
+    combined = pd.concat(rollups, ignore_index=True)
+    merged = combined.groupby(rollup_keys(collection), dropna=False).agg(ROLLUP_METRICS)
+    return merged.reset_index()
+
+class RollupStore(SnapshotStore):
+    """Agrégats journaliers par shop, matérialisés en Parquet et mis à jour par watermark sur createdAt"""
+    
+    def __init__(self, base_dir=None):
+        super().__init__(base_dir or ROLLUP_DIR)
+    
+    def sync(self, extractor, collection):
+        """Intègre aux agrégats les documents créés depuis le dernier watermark (lecture paginée)
+        
+        Une synchro à la fois par collection (verrou inter-processus); agrégats et watermark sont lus et
+        écrits dans le même fichier: une synchro interrompue ou concurrente n'ajoute jamais deux fois un document.
+        """
+        with self.lock(collection):
+            return self._sync(extractor, collection)
+    
+    def _sync(self, extractor, collection):
+        rollup, watermark = self.load_with_watermark(collection)
+        
+        # Agrégats construits avec d'anciennes dimensions: reconstruits depuis le début
+        missing = [key for key in rollup_keys(collection) if key not in rollup.columns]
+        rebuild = not rollup.empty and bool(missing)
+        if rebuild:
+            print(f"⚠️ Agrégats {collection} sans {', '.join(missing)}: reconstruction complète")
+            rollup, watermark = merge_rollups(collection), None
+        
+        query = extractor.db.collection(collection).select(rollup_fields(collection))
+        if watermark:
+            query = query.where('createdAt', '>', watermark)
+        
+        new_documents = 0
+        for page in extractor.iter_pages(query, 'createdAt' if watermark else None, collection=collection):
+            watermark = self.advance_watermark(watermark, page)
+            page, _ = apply_schema(collection, page)
+            rollup = merge_rollups(collection, rollup, compute_rollup(collection, page))
+            new_documents += len(page)
+        
+        # Après une reconstruction, l'ancien fichier est remplacé même si la collection est vide
+        if new_documents or rebuild:
+            self.save(collection, rollup, watermark)
+        
+        print(f"🔄 Agrégats {collection}: {new_documents} nouveaux documents, {len(rollup)} lignes (shop, jour)")
+        return rollup
+    
+    def sync_all(self, extractor, start_date=None, end_date=None, shop_id=None):
+        """Synchronise les agrégats de toutes les collections et les retourne filtrés: {collection: agrégats}"""
+        rollups = {}
+        for collection in ROLLUP_SPECS:
+            self.sync(extractor, collection)
+            rollups[collection] = self.get_rollup(collection, start_date, end_date, shop_id)
+        return rollups
+    
+    def get_rollup(self, collection, start_date=None, end_date=None, shop_id=None):
+        """Retourne les agrégats journaliers filtrés par période et shop (clés manquantes en NaN)"""
+        rollup = self.load(collection)
+        if rollup.empty:
+            return rollup
+        
+        if shop_id and shop_id != 'all':
+            rollup = rollup[rollup['shopId'] == shop_id]
+        
+        if start_date:
+            rollup = rollup[rollup['day'] >= pd.to_datetime(start_date)]
+        
+        if end_date:
+            rollup = rollup[rollup['day'] <= pd.to_datetime(end_date)]
+        
+        return with_missing_keys(rollup.reset_index(drop=True))
@@ -0,0 +1,92 @@
+import pandas as pd
+
+# Registre des schémas par collection Firestore
+# - categories: clés répétées (stockées en category, les groupby travaillent sur les codes)
+# - amounts: montants convertis en float64
+# - dates: colonnes jour au format connu (chemin rapide), naïves
+# - timestamps: horodatages ISO 8601 ou Firestore, en UTC
+# - required: champs sans lesquels une ligne part en quarantaine
+COLLECTION_SCHEMAS = {
+    'operations': {
+        'categories': ['shopId'],
+        'amounts': ['total_general'],
+        'dates': {'date': '%Y-%m-%d'},
+        'timestamps': ['createdAt'],
+        'required': ['date', 'total_general']
+    },
+    'depots': {
+        'categories': ['shopId', 'clientId', 'devise'],
+        'amounts': ['montant'],
+        'dates': {'date': '%Y-%m-%d'},
+        'timestamps': ['createdAt'],
+        'required': ['date', 'montant']
+    },
+    'clients': {
+        'categories': ['shopId'],
+        'amounts': [],
+        'dates': {},
+        'timestamps': ['createdAt'],
+        'required': []
+    },
+    'mouvements': {
+        'categories': ['shopId', 'type', 'devise'],
+        'amounts': ['montant'],
+        'dates': {'date': '%Y-%m-%d'},
+        'timestamps': ['createdAt'],
+        'required': ['date', 'montant']
+    }
+}
+
+def parse_dates(values, date_format):
+    """Parse une colonne jour avec le format connu, puis un parsing générique sur les seules lignes restantes"""
+    parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+    fallback = parsed.isna() & values.notna()
+    if fallback.any():
+        retry = pd.to_datetime(values[fallback], format='mixed', utc=True, errors='coerce')
+        parsed[fallback] = retry.dt.tz_localize(None)
+    return parsed
+
+def parse_timestamps(values):
+    """Parse des horodatages ISO 8601 (chaînes ou timestamps Firestore) en datetime64 UTC"""
+    return pd.to_datetime(values, format='ISO8601', utc=True, errors='coerce')
+
+def apply_schema(collection, df):
+    """Convertit un DataFrame extrait selon le schéma de sa collection
+    
+    Retourne (données valides, lignes en quarantaine)
+    """
+    schema = COLLECTION_SCHEMAS.get(collection)
+    if schema is None or df.empty:
+        return df, df.iloc[0:0]
+    
+    df = df.copy()
+    invalid = pd.Series(False, index=df.index)
+    
+    for column in schema['amounts']:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    
+    for column, date_format in schema['dates'].items():
+        if column in df.columns:
+            df[column] = parse_dates(df[column], date_format)
+    
+    for column in schema['timestamps']:
+        if column in df.columns:
+            df[column] = parse_timestamps(df[column])
+    
+    for column in schema['required']:
+        if column in df.columns:
+            invalid |= df[column].isna()
+    
+    quarantine = df[invalid]
+    if not quarantine.empty:
+        df = df[~invalid].copy()
+    
+    for column in schema['categories']:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    
+    if not quarantine.empty:
+        print(f"⚠️ {len(quarantine)} lignes de {collection} mises en quarantaine (champs invalides)")
+    
+    return df, quarantine
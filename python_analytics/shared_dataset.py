@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Jeu de données partagé entre les workers de l'API: collections extraites une fois par un processus chargeur,
+écrites en Arrow IPC et projetées en mémoire (mmap) par chaque worker; seuls les codes des colonnes catégorielles
+(et les entiers avec valeurs manquantes) sont copiés dans chaque worker
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import threading
+from datetime import datetime
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+from snapshot_store import normalize_for_parquet
+
+# Dossier du jeu de données partagé (/dev/shm: mémoire partagée, sinon fichiers projetés depuis /tmp)
+SHARED_DATASET_DIR = os.environ.get(
+    'ANALYTICS_SHARED_DATASET_DIR',
+    '/dev/shm/analytics_dataset' if os.path.isdir('/dev/shm') else '/tmp/analytics_dataset'
+)
+
+# Collections publiées et nombre de versions conservées (les workers encore attachés à l'ancienne la gardent lisible)
+SHARED_COLLECTIONS = ('operations', 'depots', 'clients', 'mouvements')
+SHARED_VERSIONS_KEPT = 2
+
+# Fichier désignant la version courante (remplacé atomiquement à chaque publication)
+CURRENT_FILE = 'current.json'
+
+def _to_arrow(df):
+    """DataFrame → table Arrow (colonnes objet hétérogènes normalisées comme pour les snapshots Parquet)"""
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return pa.Table.from_pandas(normalize_for_parquet(df), preserve_index=False)
+
+def publish(data, watermark=None, root=None):
+    """Écrit une nouvelle version du jeu de données et la désigne comme courante
+    
+    data: {collection: DataFrame} (résultat de DataExtractor.extract_all)
+    watermark: watermark des collections au moment de l'extraction (clé de cache des rapports)
+    """
+    root = root or SHARED_DATASET_DIR
+    if not os.path.exists(root):
+        os.makedirs(root)
+    
+    version = datetime.now().strftime("v%Y%m%dT%H%M%S%f")
+    tmp_dir = os.path.join(root, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+    
+    rows = {}
+    for collection in SHARED_COLLECTIONS:
+        df = data.get(collection, pd.DataFrame())
+        if 'date' in df.columns and not df['date'].is_monotonic_increasing:
+            df = df.sort_values('date', kind='stable')
+        table = _to_arrow(df)
+        # Format IPC non compressé: les buffers du fichier sont directement ceux des colonnes
+        with ipc.new_file(os.path.join(tmp_dir, f"{collection}.arrow"), table.schema) as writer:
+            writer.write_table(table)
+        rows[collection] = len(df)
+    
+    manifest = {
+        'version': version,
+        'createdAt': datetime.now().isoformat(),
+        'watermark': list(watermark) if watermark is not None else None,
+        'rows': rows
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+    
+    # Version complète avant d'être visible: renommage du dossier, puis du pointeur
+    os.replace(tmp_dir, os.path.join(root, version))
+    current_tmp = os.path.join(root, f".{CURRENT_FILE}.tmp")
+    with open(current_tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(current_tmp, os.path.join(root, CURRENT_FILE))
+    
+    # Anciennes versions: supprimées du répertoire, les projections déjà ouvertes restent valides
+    versions = sorted(name for name in os.listdir(root) if name.startswith('v'))
+    for old in versions[:-SHARED_VERSIONS_KEPT]:
+        shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    
+    print(f"📦 Jeu de données partagé publié: {version} ({', '.join(f'{k}={v}' for k, v in rows.items())})")
+    return manifest
+
+class SharedDataset:
+    """Vue d'un worker sur le jeu de données partagé: DataFrames adossés aux fichiers projetés en mémoire
+    
+    Même interface d'extraction que DataExtractor (extract_all), pour DataAnalyzer et ExcelGenerator.
+    Colonnes numériques sans valeur manquante, dates (avec ou sans fuseau) et textes (dtype str adossé à
+    Arrow de pandas 3) pointent directement sur les pages partagées. Les colonnes catégorielles recopient
+    leurs codes (1 à 4 octets par ligne), les entiers avec valeurs manquantes sont convertis en float (copie);
+    avec pandas < 3 les textes deviennent des objets Python, copiés par chaque worker.
+    Une plage de dates (collections triées par date) est une tranche sans copie.
+    """
+    
+    def __init__(self, root=None):
+        self.root = root or SHARED_DATASET_DIR
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._frames = {}
+    
+    def current(self):
+        """Manifeste de la version courante (None si aucun chargeur n'a encore publié)"""
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def available(self):
+        return self.current() is not None
+    
+    def watermark(self):
+        manifest = self.current()
+        if manifest is None or manifest['watermark'] is None:
+            return None
+        # Listes JSON remises en tuples (clé de cache hachable)
+        return tuple(tuple(part) if isinstance(part, list) else part for part in manifest['watermark'])
+    
+    def frames(self):
+        """DataFrames de la version courante (projection refaite seulement quand le chargeur publie)"""
+        manifest = self.current()
+        if manifest is None:
+            raise RuntimeError(f"Aucun jeu de données partagé dans {self.root} (lancer shared_dataset.py load)")
+        
+        with self._lock:
+            if self._manifest is None or self._manifest['version'] != manifest['version']:
+                version_dir = os.path.join(self.root, manifest['version'])
+                frames = {}
+                for collection in SHARED_COLLECTIONS:
+                    source = pa.memory_map(os.path.join(version_dir, f"{collection}.arrow"))
+                    table = ipc.open_file(source).read_all()
+                    # split_blocks: une colonne = un bloc, sans consolidation (copie limitée aux codes catégoriels)
+                    frames[collection] = table.to_pandas(split_blocks=True)
+                self._frames = frames
+                self._manifest = manifest
+                print(f"🔗 Jeu de données partagé attaché: {manifest['version']}")
+            return self._frames
+    
+    @staticmethod
+    def _select(df, start_date=None, end_date=None, shop_id=None, columns=None):
+        if df.empty:
+            return df
+        if (start_date or end_date) and 'date' in df.columns:
+            # Collections triées par date à la publication: la plage est une tranche contiguë (fin de journée incluse)
+            dates = df['date']
+            start = dates.searchsorted(pd.Timestamp(start_date), side='left') if start_date else 0
+            end = dates.searchsorted(pd.Timestamp(end_date) + pd.Timedelta(days=1), side='left') if end_date else len(df)
+            df = df.iloc[start:end]
+        if shop_id and shop_id != 'all' and 'shopId' in df.columns:
+            df = df[df['shopId'] == shop_id]
+        if columns:
+            df = df[[column for column in df.columns if column in columns or column == 'id']]
+        return df
+    
+    def extract_all(self, start_date=None, end_date=None, shop_id=None, max_workers=None, fields=None, ranges=None):
+        """Même résultat que DataExtractor.extract_all, lu dans le jeu de données partagé"""
+        fields = fields or {}
+        ranges = ranges or {}
+        started = time.perf_counter()
+        frames = self.frames()
+        
+        result = {'timings': {}}
+        for collection in SHARED_COLLECTIONS:
+            collection_started = time.perf_counter()
+            if collection == 'clients':
+                collection_start, collection_end = None, None
+            else:
+                collection_start, collection_end = ranges.get(collection, (start_date, end_date))
+            result[collection] = self._select(
+                frames[collection], collection_start, collection_end, shop_id, fields.get(collection)
+            )
+            result['timings'][collection] = round(time.perf_counter() - collection_started, 3)
+        result['timings']['total'] = round(time.perf_counter() - started, 3)
+        
+        print(f"⏱️ Lecture du jeu de données partagé en {result['timings']['total']}s ({self._manifest['version']})")
+        return result
+
+def load(interval=0, root=None):
+    """Processus chargeur: extrait toutes les collections et publie; avec interval, republie quand les données changent"""
+    from config import initialize_firebase
+    from data_extractor import DataExtractor
+    
+    if not initialize_firebase():
+        return 1
+    
+    extractor = DataExtractor()
+    published = None
+    while True:
+        watermark = extractor.get_data_watermark()
+        if watermark is None:
+            # Firestore indisponible: la version publiée reste servie, nouvel essai au prochain intervalle
+            if not interval:
+                return 1
+        elif watermark != published:
+            data = extractor.extract_all()
+            publish(data, watermark, root)
+            published = watermark
+        if not interval:
+            return 0
+        time.sleep(interval)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Jeu de données partagé entre les workers de l\'API')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    load_parser = subparsers.add_parser('load', help='Extraire les collections et publier le jeu de données')
+    load_parser.add_argument('--interval', type=int, default=0,
+                             help='Vérifier le watermark toutes les N secondes et republier si les données ont changé')
+    load_parser.add_argument('--dir', type=str, help='Dossier du jeu de données')
+    
+    stats_parser = subparsers.add_parser('stats', help='Afficher la version courante')
+    stats_parser.add_argument('--dir', type=str, help='Dossier du jeu de données')
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'load':
+        return load(args.interval, args.dir)
+    
+    manifest = SharedDataset(args.dir).current()
+    if manifest is None:
+        print("⚠️ Aucun jeu de données publié")
+        return 1
+    print(json.dumps(manifest, indent=2, ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+import os
+import numpy as np
+import pandas as pd
+from rollups import as_key
+from snapshot_store import SnapshotStore
+from schemas import apply_schema
+
+# Dossier des sketches journaliers matérialisés (un sous-dossier par paramétrage, voir SketchStore)
+SKETCH_DIR = os.environ.get('ANALYTICS_SKETCH_DIR', '/tmp/analytics_sketches')
+
+# Précision des compteurs HyperLogLog: 2^p registres par (shop, jour) au plus.
+# Erreur type relative 1.04 / sqrt(2^p): p=12 → ±1.6% (±3.3% dans 95% des cas), quelle que soit la plage fusionnée
+HLL_PRECISION = int(os.environ.get('ANALYTICS_HLL_PRECISION', 12))
+
+# Erreur relative garantie des quantiles (buckets logarithmiques, DDSketch): tout quantile estimé est à ±α
+# de la valeur exacte du même rang, pour une plage quelconque
+QUANTILE_RELATIVE_ERROR = float(os.environ.get('ANALYTICS_QUANTILE_ERROR', 0.01))
+
+# Montant résumé par un sketch de quantiles et colonnes comptées par HyperLogLog, par collection
+SKETCH_SPECS = {
+    'operations': {'amount': 'total_general', 'distinct': []},
+    'depots': {'amount': 'montant', 'distinct': ['clientId']}
+}
+
+# Clés de chaque table de sketches (un état par shop et par jour)
+SKETCH_KEYS = {
+    'distinct': ['shopId', 'day', 'column', 'register'],
+    'quantiles': ['shopId', 'day', 'sign', 'bucket']
+}
+
+# Colonne mesurée et fusion de chaque table: registres par maximum, buckets par somme
+SKETCH_METRICS = {'distinct': ('rank', 'max'), 'quantiles': ('count', 'sum')}
+
+def sketch_fields(collection):
+    """Champs Firestore nécessaires pour construire les sketches d'une collection"""
+    spec = SKETCH_SPECS[collection]
+    return ['shopId', 'date', 'createdAt', spec['amount']] + spec['distinct']
+
+def empty_sketch(kind):
+    return pd.DataFrame(columns=SKETCH_KEYS[kind] + [SKETCH_METRICS[kind][0]])
+
+def _bit_length(values):
+    """Nombre de bits significatifs de chaque entier non signé 64 bits (0 pour 0)"""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        length += shift * high
+        values = np.where(high, values >> np.uint64(shift), values)
+    return length + (values > 0)
+
+def hll_registers(values, precision=HLL_PRECISION):
+    """(registre, rang) HyperLogLog de chaque valeur: p premiers bits du hachage 64 bits, puis position du premier 1"""
+    hashes = pd.util.hash_array(as_key(values).to_numpy(dtype=object))
+    register = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - precision)) - 1)
+    rank = (64 - precision) - _bit_length(rest) + 1
+    return register, rank.astype(np.int8)
+
+def quantile_buckets(amounts, relative_error=QUANTILE_RELATIVE_ERROR):
+    """(signe, bucket) de chaque montant: bucket b couvre ]γ^(b-1), γ^b] avec γ = (1+α)/(1-α)"""
+    gamma = (1 + relative_error) / (1 - relative_error)
+    magnitude = np.abs(amounts)
+    sign = np.sign(amounts).astype(np.int8)
+    with np.errstate(divide='ignore'):
+        bucket = np.ceil(np.log(np.where(magnitude > 0, magnitude, 1)) / np.log(gamma)).astype(np.int64)
+    return sign, np.where(sign == 0, 0, bucket)
+
+def compute_sketches(collection, df, precision=HLL_PRECISION, relative_error=QUANTILE_RELATIVE_ERROR):
+    """Sketches par (shop, jour) de lignes déjà passées par le schéma: {'distinct': ..., 'quantiles': ...}"""
+    spec = SKETCH_SPECS[collection]
+    sketches = {kind: empty_sketch(kind) for kind in SKETCH_KEYS}
+    if df.empty or 'date' not in df.columns or spec['amount'] not in df.columns:
+        return sketches
+    
+    shop = as_key(df['shopId']) if 'shopId' in df.columns else pd.Series('', index=df.index)
+    day = df['date'].dt.normalize()
+    
+    amounts = df[spec['amount']]
+    valid = amounts.notna() & day.notna()
+    sign, bucket = quantile_buckets(amounts[valid].to_numpy(dtype=float), relative_error)
+    frame = pd.DataFrame({'shopId': shop[valid], 'day': day[valid], 'sign': sign, 'bucket': bucket})
+    sketches['quantiles'] = frame.groupby(SKETCH_KEYS['quantiles'], observed=True).size().rename('count').reset_index()
+    
+    parts = []
+    for column in spec['distinct']:
+        if column not in df.columns:
+            continue
+        present = df[column].notna() & day.notna()
+        register, rank = hll_registers(df.loc[present, column], precision)
+        parts.append(pd.DataFrame({
+            'shopId': shop[present], 'day': day[present], 'column': column, 'register': register, 'rank': rank
+        }))
+    if parts:
+        frame = pd.concat(parts, ignore_index=True)
+        sketches['distinct'] = frame.groupby(SKETCH_KEYS['distinct'], observed=True)['rank'].max().reset_index()
+    return sketches
+
+def merge_sketches(kind, *sketches):
+    """Combine des sketches partiels (registres au maximum, buckets additionnés): associatif et commutatif"""
+    sketches = [sketch for sketch in sketches if sketch is not None and not sketch.empty]
+    if not sketches:
+        return empty_sketch(kind)
+    if len(sketches) == 1:
+        return sketches[0]
+    
+    metric, how = SKETCH_METRICS[kind]
+    combined = pd.concat(sketches, ignore_index=True)
+    return combined.groupby(SKETCH_KEYS[kind], observed=True)[metric].agg(how).reset_index()
+
+# Périodes de regroupement des sketches (dérivées du jour)
+PERIOD_FREQUENCIES = {'day': 'D', 'week': 'W', 'month': 'M', 'year': 'Y'}
+
+def period_key(sketch, period):
+    """Période ('day', 'week', 'month', 'year') de chaque ligne d'une table de sketches"""
+    return sketch['day'].dt.to_period(PERIOD_FREQUENCIES[period]).rename('period')
+
+def _groups(sketch, by):
+    """Clés de regroupement (colonnes de la table, ou période dérivée du jour) et noms des colonnes après reset_index"""
+    keys = [period_key(sketch, key) if key in PERIOD_FREQUENCIES else key for key in by]
+    return keys, [key.name if isinstance(key, pd.Series) else key for key in keys]
+
+def estimate_distinct(sketch, by=(), column='clientId', precision=HLL_PRECISION):
+    """Nombre estimé de valeurs distinctes de `column` par groupe (ou au total si by est vide)
+    
+    Les (shop, jour) d'un groupe sont fusionnés registre par registre avant l'estimation: une valeur vue
+    plusieurs jours ou dans plusieurs shops n'est comptée qu'une fois. Coût proportionnel au nombre de
+    registres non nuls, borné par 2^p par (shop, jour).
+    """
+    m = 1 << precision
+    alpha = 0.7213 / (1 + 1.079 / m)
+    sketch = sketch[sketch['column'] == column]
+    
+    keys, group_columns = _groups(sketch, by)
+    registers = sketch.groupby(keys + ['register'], observed=True)['rank'].max().reset_index()
+    registers['inverse'] = np.exp2(-registers['rank'].astype(float))
+    if group_columns:
+        grouped = registers.groupby(group_columns, observed=True)
+        filled, inverse = grouped['register'].count(), grouped['inverse'].sum()
+    else:
+        filled, inverse = pd.Series([len(registers)]), pd.Series([registers['inverse'].sum()])
+    
+    # Registres vides: 2^0 chacun dans la moyenne harmonique; petite cardinalité: comptage linéaire
+    zeros = m - filled
+    raw = alpha * m * m / (inverse + zeros)
+    with np.errstate(divide='ignore'):
+        linear = m * np.log(m / zeros.where(zeros > 0, 1))
+    estimate = raw.where((raw > 2.5 * m) | (zeros == 0), linear).round()
+    return estimate if group_columns else float(estimate.iloc[0])
+
+def estimate_quantiles(sketch, quantiles=(0.5, 0.9, 0.99), by=(), relative_error=QUANTILE_RELATIVE_ERROR):
+    """Quantiles estimés des montants par groupe (DataFrame, une colonne par quantile), erreur relative ≤ α"""
+    gamma = (1 + relative_error) / (1 - relative_error)
+    keys, group_columns = _groups(sketch, by)
+    buckets = sketch.groupby(keys + ['sign', 'bucket'], observed=True)['count'].sum().reset_index()
+    if buckets.empty:
+        return pd.DataFrame() if group_columns else {}
+    # Représentant du bucket ]γ^(b-1), γ^b]: 2γ^b / (γ+1), à ±α de toute valeur du bucket
+    buckets['value'] = buckets['sign'] * 2 * np.power(gamma, buckets['bucket'].astype(float)) / (gamma + 1)
+    
+    if not group_columns:
+        buckets['_all'] = 0
+        group_columns = ['_all']
+    buckets = buckets.sort_values(group_columns + ['value'], kind='stable')
+    grouped = buckets.groupby(group_columns, observed=True, sort=False)
+    cumulative = grouped['count'].cumsum()
+    total = grouped['count'].transform('sum')
+    
+    result = {}
+    for q in quantiles:
+        # Premier bucket dont le nombre cumulé dépasse le rang q × (n - 1)
+        reached = buckets[cumulative > q * (total - 1)]
+        result[f"p{round(q * 100):g}"] = reached.groupby(group_columns, observed=True)['value'].first()
+    result = pd.DataFrame(result)
+    if group_columns == ['_all']:
+        return result.iloc[0].to_dict()
+    return result
+
+class SketchStore(SnapshotStore):
+    """Sketches journaliers par shop (HyperLogLog des clients, quantiles des montants), en Parquet
+    
+    Mis à jour par watermark sur createdAt comme les agrégats journaliers. Les registres et buckets dépendent
+    de la précision et de l'erreur relative: chaque paramétrage a son propre dossier (resynchronisé en entier).
+    """
+    
+    def __init__(self, base_dir=None, precision=HLL_PRECISION, relative_error=QUANTILE_RELATIVE_ERROR):
+        self.precision = precision
+        self.relative_error = relative_error
+        super().__init__(os.path.join(base_dir or SKETCH_DIR, f"p{precision}_e{relative_error:g}"))
+    
+    def sync(self, extractor, collection):
+        """Intègre aux sketches les documents créés depuis le dernier watermark (lecture paginée)
+        
+        Une synchro à la fois par collection (verrou inter-processus). Chaque table est écrite avec son
+        watermark dans un seul fichier; la synchro repart du watermark des quantiles (sommés, donc à ne
+        jamais refusionner), écrits en dernier: après une interruption entre les deux écritures, seuls les
+        registres HyperLogLog (fusionnés par maximum, sans effet s'ils sont refusionnés) revoient ces documents.
+        """
+        with self.lock(collection):
+            return self._sync(extractor, collection)
+    
+    def _sync(self, extractor, collection):
+        sketches = {'distinct': self.load(f"{collection}_distinct")}
+        sketches['quantiles'], watermark = self.load_with_watermark(f"{collection}_quantiles")
+        
+        query = extractor.db.collection(collection).select(sketch_fields(collection))
+        if watermark:
+            query = query.where('createdAt', '>', watermark)
+        
+        new_documents = 0
+        for page in extractor.iter_pages(query, 'createdAt' if watermark else None, collection=collection):
+            watermark = self.advance_watermark(watermark, page)
+            page, _ = apply_schema(collection, page)
+            page_sketches = compute_sketches(collection, page, self.precision, self.relative_error)
+            for kind in SKETCH_KEYS:
+                sketches[kind] = merge_sketches(kind, sketches[kind], page_sketches[kind])
+            new_documents += len(page)
+        
+        if new_documents:
+            for kind in ('distinct', 'quantiles'):
+                self.save(f"{collection}_{kind}", sketches[kind], watermark)
+        
+        print(f"🔄 Sketches {collection}: {new_documents} nouveaux documents, "
+              f"{len(sketches['distinct'])} registres, {len(sketches['quantiles'])} buckets")
+        return sketches
+    
+    def get_sketch(self, collection, kind, start_date=None, end_date=None, shop_id=None):
+        """Sketches d'une collection ('distinct' ou 'quantiles') filtrés par période et shop"""
+        sketch = self.load(f"{collection}_{kind}")
+        if sketch.empty:
+            return empty_sketch(kind)
+        
+        if shop_id and shop_id != 'all':
+            sketch = sketch[sketch['shopId'] == shop_id]
+        
+        if start_date:
+            sketch = sketch[sketch['day'] >= pd.to_datetime(start_date)]
+        
+        if end_date:
+            sketch = sketch[sketch['day'] <= pd.to_datetime(end_date)]
+        
+        return sketch.reset_index(drop=True)
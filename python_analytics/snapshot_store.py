@@ -0,0 +1,208 @@
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+try:
+    import fcntl
+except ImportError:  # Windows: pas de verrou inter-processus
+    fcntl = None
+
+# Dossier des snapshots locaux (un fichier Parquet par collection)
+SNAPSHOT_DIR = os.environ.get('ANALYTICS_SNAPSHOT_DIR', '/tmp/analytics_snapshots')
+
+# Clé des métadonnées Parquet portant le watermark: données et watermark sont remplacés ensemble
+WATERMARK_METADATA_KEY = b'analytics_watermark'
+
+def iso_utc(value):
+    """createdAt en chaîne ISO UTC, au format des chaînes de l'application (toISOString: 2024-01-03T10:00:00.000Z)
+    
+    Les Timestamp Firestore et datetime (naïfs: supposés UTC) sont convertis, les chaînes gardées telles quelles;
+    None pour toute autre valeur
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        value = value.astimezone(timezone.utc)
+        return value.strftime('%Y-%m-%dT%H:%M:%S.') + f"{value.microsecond // 1000:03d}Z"
+    return None
+
+def normalize_for_parquet(df):
+    """Rend les colonnes objet homogènes pour Parquet (timestamps en ISO, maps/listes en JSON)"""
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        values = df[column].dropna()
+        if values.empty or values.map(lambda value: isinstance(value, str)).all():
+            continue
+        
+        def to_text(value):
+            if value is None or (isinstance(value, float) and pd.isna(value)):
+                return None
+            if isinstance(value, str):
+                return value
+            if isinstance(value, datetime):
+                return value.isoformat()
+            if isinstance(value, (dict, list)):
+                return json.dumps(value, default=str, ensure_ascii=False)
+            return str(value)
+        
+        # Colonnes numériques mixtes (int/float) : laisser pandas les convertir
+        if values.map(lambda value: isinstance(value, (int, float)) and not isinstance(value, bool)).all():
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        else:
+            df[column] = df[column].map(to_text)
+    return df
+
+class SnapshotStore:
+    """Snapshot local en Parquet des collections Firestore, synchronisé par watermark sur createdAt"""
+    
+    def __init__(self, base_dir=None):
+        self.base_dir = base_dir or SNAPSHOT_DIR
+        if not os.path.exists(self.base_dir):
+            os.makedirs(self.base_dir)
+    
+    def _data_path(self, collection):
+        return os.path.join(self.base_dir, f"{collection}.parquet")
+    
+    def _meta_path(self, collection):
+        return os.path.join(self.base_dir, f"{collection}.meta.json")
+    
+    def _lock_path(self, collection):
+        return os.path.join(self.base_dir, f"{collection}.lock")
+    
+    @contextmanager
+    def lock(self, collection):
+        """Verrou exclusif sur une collection, entre threads et entre processus (une synchro à la fois)"""
+        with open(self._lock_path(collection), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    
+    def _atomic_write(self, path, write_func):
+        """Écrit dans un fichier temporaire puis le renomme (pas de snapshot à moitié écrit)"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.base_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            write_func(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    def get_metadata(self, collection):
+        """Retourne les métadonnées du snapshot (watermark, nombre de lignes, date de synchro)"""
+        path = self._meta_path(collection)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+    
+    @staticmethod
+    def _read_watermark(source):
+        metadata = pq.read_schema(source).metadata or {}
+        if WATERMARK_METADATA_KEY not in metadata:
+            return None, False
+        return json.loads(metadata[WATERMARK_METADATA_KEY]), True
+    
+    def get_watermark(self, collection):
+        """Valeur brute du plus grand createdAt déjà présent dans le snapshot"""
+        return self.load_with_watermark(collection, watermark_only=True)[1]
+    
+    def load(self, collection):
+        """Charge le snapshot d'une collection (DataFrame vide si absent)"""
+        return self.load_with_watermark(collection)[0]
+    
+    def load_with_watermark(self, collection, watermark_only=False):
+        """Données et watermark lus dans le même fichier (cohérents même si une synchro le remplace entre-temps)"""
+        path = self._data_path(collection)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return pd.DataFrame(), None
+        with f:
+            watermark, found = self._read_watermark(f)
+            if not found:
+                # Snapshot écrit avant que le watermark ne soit stocké dans le fichier
+                watermark = self.get_metadata(collection).get('watermark')
+            if watermark_only:
+                return None, watermark
+            f.seek(0)
+            return pd.read_parquet(f), watermark
+    
+    def merge(self, collection, new_df):
+        """Fusionne les nouveaux documents dans le snapshot par 'id' et avance le watermark"""
+        with self.lock(collection):
+            return self._merge(collection, new_df)
+    
+    def _merge(self, collection, new_df):
+        snapshot_df, watermark = self.load_with_watermark(collection)
+        
+        if new_df.empty:
+            return snapshot_df
+        
+        new_df = normalize_for_parquet(new_df)
+        
+        if snapshot_df.empty:
+            merged_df = new_df
+        else:
+            # La dernière version d'un document l'emporte
+            merged_df = pd.concat([snapshot_df, new_df], ignore_index=True)
+            merged_df = merged_df.drop_duplicates(subset='id', keep='last')
+            merged_df = merged_df.reset_index(drop=True)
+            merged_df = normalize_for_parquet(merged_df)
+        
+        watermark = self.advance_watermark(watermark, new_df)
+        self.save(collection, merged_df, watermark)
+        
+        return merged_df
+    
+    def save(self, collection, df, watermark):
+        """Écrit atomiquement les données et leur watermark (un seul fichier), puis les métadonnées descriptives"""
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}),
+            WATERMARK_METADATA_KEY: json.dumps(watermark).encode('utf-8')
+        })
+        self._atomic_write(self._data_path(collection), lambda tmp_path: pq.write_table(table, tmp_path))
+        
+        metadata = {
+            'watermark': watermark,
+            'rows': len(df),
+            'synced_at': datetime.now().isoformat()
+        }
+        self._atomic_write(
+            self._meta_path(collection),
+            lambda tmp_path: self._write_json(tmp_path, metadata)
+        )
+    
+    @staticmethod
+    def advance_watermark(watermark, df):
+        """Plus grand createdAt (chaîne ISO UTC, voir iso_utc) entre le watermark courant et les documents reçus"""
+        if 'createdAt' in df.columns:
+            created = df['createdAt'].dropna().map(iso_utc).dropna()
+            if not created.empty and (watermark is None or created.max() > watermark):
+                watermark = created.max()
+        return watermark
+    
+    def clear(self, collection):
+        """Supprime le snapshot d'une collection (la prochaine synchro sera complète)"""
+        for path in (self._data_path(collection), self._meta_path(collection), self._lock_path(collection)):
+            if os.path.exists(path):
+                os.remove(path)
+    
+    @staticmethod
+    def _write_json(path, data):
+        with open(path, 'w') as f:
+            json.dump(data, f)
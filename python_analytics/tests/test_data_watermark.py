@@ -0,0 +1,53 @@
+"""
+Watermarks: les suppressions et les modifications (updatedAt) doivent changer l'état des collections,
+sinon les rapports en cache seraient resservis périmés; le watermark des synchros avance quel que soit
+le type de createdAt (chaîne, datetime, Timestamp)
+"""
+
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from data_extractor import DataExtractor
+from local_backend import LocalFirestore
+from snapshot_store import SnapshotStore
+
+def make_extractor(tmp_path):
+    db = LocalFirestore(str(tmp_path / 'firestore.sqlite3'))
+    db.write('operations', [
+        ('a', {'shopId': 'shop000', 'total_general': 10, 'createdAt': '2024-01-01T10:00:00'}),
+        ('b', {'shopId': 'shop000', 'total_general': 20, 'createdAt': '2024-01-02T10:00:00'}),
+        ('c', {'shopId': 'shop001', 'total_general': 30, 'createdAt': '2024-01-03T10:00:00'})
+    ])
+    return DataExtractor(db=db, page_size=500)
+
+def test_watermark_changes_on_delete_and_update(tmp_path):
+    extractor = make_extractor(tmp_path)
+    initial = extractor.get_data_watermark(('operations',))
+    assert initial == (('2024-01-03T10:00:00', 3, None),)
+    assert extractor.get_data_watermark(('operations',)) == initial
+    
+    # Suppression d'un document ancien: le dernier createdAt ne bouge pas, le nombre de documents si
+    extractor.db.collection('operations').document('a').delete()
+    deleted = extractor.get_data_watermark(('operations',))
+    assert deleted[0][0] == initial[0][0] and deleted != initial
+    
+    # Modification qui renseigne updatedAt
+    extractor.db.write('operations', [
+        ('b', {'shopId': 'shop000', 'total_general': 25, 'createdAt': '2024-01-02T10:00:00', 'updatedAt': '2024-02-01T09:00:00'})
+    ])
+    assert extractor.get_data_watermark(('operations',)) == (('2024-01-03T10:00:00', 2, '2024-02-01T09:00:00'),)
+
+def test_advance_watermark_with_mixed_createdat_types():
+    page = pd.DataFrame({'createdAt': [
+        '2024-01-02T10:00:00.000Z',
+        pd.Timestamp('2024-01-05 08:30:00', tz='Europe/Paris'),
+        datetime(2024, 1, 4, 12, 0, 0, 250000),
+        datetime(2024, 1, 3, 9, 0, tzinfo=timezone.utc),
+        None
+    ]})
+    
+    # Timestamp Firestore/pandas et datetime comparés en chaînes ISO UTC (datetime naïf supposé UTC)
+    assert SnapshotStore.advance_watermark(None, page) == '2024-01-05T07:30:00.000Z'
+    assert SnapshotStore.advance_watermark('2024-02-01T00:00:00.000Z', page) == '2024-02-01T00:00:00.000Z'
+    assert SnapshotStore.advance_watermark(None, page.iloc[[2]]) == '2024-01-04T12:00:00.250Z'
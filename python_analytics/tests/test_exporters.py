@@ -0,0 +1,36 @@
+"""
+Exports en flux: les blocs (pages Firestore) n'ont pas forcément les mêmes colonnes, dans le même ordre,
+ni les mêmes types que le premier bloc
+"""
+
+import gzip
+import io
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from exporters import iter_csv_gz, iter_parquet
+
+def pages():
+    return [
+        pd.DataFrame({'id': ['1', '2'], 'montant': [5, 7], 'clientId': pd.Categorical(['c1', 'c2'])}),
+        pd.DataFrame({'clientId': pd.Categorical(['c3']), 'id': ['3'], 'montant': [9.0], 'note': ['nouvelle']}),
+        pd.DataFrame({'id': ['4'], 'montant': ['12.5'], 'clientId': [None]})
+    ]
+
+def test_csv_rows_follow_the_header_columns():
+    data = gzip.decompress(b''.join(iter_csv_gz(pages())))
+    exported = pd.read_csv(io.BytesIO(data), dtype={'id': str})
+    
+    assert list(exported.columns) == ['id', 'montant', 'clientId']
+    assert exported.loc[2].tolist() == ['3', 9.0, 'c3']
+    assert exported.loc[3, 'montant'] == 12.5
+
+def test_parquet_casts_later_pages_to_the_writer_schema():
+    exported = pq.read_table(io.BytesIO(b''.join(iter_parquet(pages())))).to_pandas()
+    
+    assert list(exported.columns) == ['id', 'montant', 'clientId']
+    assert exported['id'].tolist() == ['1', '2', '3', '4']
+    assert exported['montant'].tolist() == [5.0, 7.0, 9.0, 12.5]
+    assert exported['clientId'].tolist()[:3] == ['c1', 'c2', 'c3']
+    assert pd.isna(exported['clientId'].iloc[3])
@@ -0,0 +1,28 @@
+"""
+Rétention des jobs: seuls les jobs terminés ou en échec depuis plus longtemps que la rétention sont supprimés
+"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+from job_queue import JobQueue
+
+def test_prune_removes_only_old_finished_jobs(tmp_path):
+    jobs = JobQueue(lambda params: params, db_path=str(tmp_path / 'jobs.sqlite3'))
+    old = (datetime.now() - timedelta(days=2)).isoformat()
+    recent = datetime.now().isoformat()
+    with sqlite3.connect(jobs.db_path) as conn:
+        conn.executemany(
+            "INSERT INTO jobs (id, status, params, created_at, finished_at) VALUES (?, ?, '{}', ?, ?)",
+            [
+                ('ancien-fini', 'done', old, old),
+                ('ancien-echec', 'failed', old, old),
+                ('recent-fini', 'done', recent, recent),
+                ('en-attente', 'queued', old, None),
+                ('en-cours', 'running', old, None)
+            ]
+        )
+    
+    assert jobs.prune(older_than=86400) == 2
+    assert {job['jobId'] for job in jobs.list()} == {'recent-fini', 'en-attente', 'en-cours'}
+    assert jobs.prune(older_than=0) == 0
@@ -0,0 +1,127 @@
+"""
+États fusionnables: agrégats journaliers, sketches et AggregateState calculés par blocs doivent être
+identiques à ceux calculés en une fois, et une synchro sans nouveau document ne doit rien changer
+"""
+
+import pandas as pd
+import pytest
+
+from aggregations import AggregateState
+from benchmark import generate_dataset
+from data_extractor import DataExtractor
+from local_backend import LocalFirestore
+from rollups import ROLLUP_SPECS, RollupStore, compute_rollup, merge_rollups, rollup_keys
+from schemas import apply_schema
+from sketches import SKETCH_KEYS, SKETCH_SPECS, SketchStore, compute_sketches, merge_sketches
+
+ROWS = 3000
+SHOPS = 4
+
+@pytest.fixture(scope='module')
+def documents():
+    """Documents bruts, tels que lus dans Firestore"""
+    return generate_dataset(ROWS, SHOPS, seed=1)
+
+@pytest.fixture(scope='module')
+def frames(documents):
+    """Documents passés par le schéma (dtypes de l'application)"""
+    return {collection: apply_schema(collection, df)[0] for collection, df in documents.items()}
+
+def halves(df):
+    middle = len(df) // 2
+    return df.iloc[:middle], df.iloc[middle:]
+
+def chunks(df, size=700):
+    return [df.iloc[start:start + size] for start in range(0, len(df), size)]
+
+def normalized(df, keys):
+    """Table triée par clés, index et dtypes neutralisés pour la comparaison"""
+    df = df.sort_values(keys).reset_index(drop=True)
+    return df.astype({key: str for key in keys if key != 'day'})
+
+@pytest.mark.parametrize('collection', list(ROLLUP_SPECS))
+def test_rollup_of_union_equals_merge_of_rollups(frames, collection):
+    first, second = halves(frames[collection])
+    keys = rollup_keys(collection)
+    
+    expected = normalized(compute_rollup(collection, frames[collection]), keys)
+    merged = normalized(merge_rollups(collection, compute_rollup(collection, first), compute_rollup(collection, second)), keys)
+    
+    pd.testing.assert_frame_equal(merged, expected, check_dtype=False)
+
+@pytest.mark.parametrize('collection', list(SKETCH_SPECS))
+def test_sketch_of_union_equals_merge_of_sketches(frames, collection):
+    first, second = halves(frames[collection])
+    expected = compute_sketches(collection, frames[collection])
+    first_sketches, second_sketches = compute_sketches(collection, first), compute_sketches(collection, second)
+    
+    for kind, keys in SKETCH_KEYS.items():
+        merged = merge_sketches(kind, first_sketches[kind], second_sketches[kind])
+        pd.testing.assert_frame_equal(normalized(merged, keys), normalized(expected[kind], keys), check_dtype=False)
+
+@pytest.fixture
+def extractor(tmp_path):
+    return DataExtractor(db=LocalFirestore(str(tmp_path / 'firestore.sqlite3')), page_size=500)
+
+def test_rollup_sync_is_idempotent(tmp_path, documents, frames, extractor):
+    first, second = halves(documents['depots'])
+    store = RollupStore(str(tmp_path / 'rollups'))
+    keys = rollup_keys('depots')
+    
+    extractor.db.import_dataframe('depots', first)
+    store.sync(extractor, 'depots')
+    extractor.db.import_dataframe('depots', second)
+    synced = normalized(store.sync(extractor, 'depots'), keys)
+    
+    # Deuxième synchro sans nouveau document: totaux et watermark inchangés
+    watermark = store.get_watermark('depots')
+    again = normalized(store.sync(extractor, 'depots'), keys)
+    pd.testing.assert_frame_equal(again, synced)
+    assert store.get_watermark('depots') == watermark
+    
+    # Synchro en deux fois = agrégats calculés sur toutes les lignes
+    assert synced['count'].sum() == ROWS
+    expected = normalized(compute_rollup('depots', frames['depots']), keys)
+    pd.testing.assert_frame_equal(synced, expected, check_dtype=False)
+
+def test_sketch_sync_is_idempotent(tmp_path, documents, frames, extractor):
+    store = SketchStore(str(tmp_path / 'sketches'))
+    extractor.db.import_dataframe('depots', documents['depots'])
+    
+    synced = store.sync(extractor, 'depots')
+    again = store.sync(extractor, 'depots')
+    
+    expected = compute_sketches('depots', frames['depots'])
+    for kind, keys in SKETCH_KEYS.items():
+        pd.testing.assert_frame_equal(normalized(again[kind], keys), normalized(synced[kind], keys))
+        pd.testing.assert_frame_equal(normalized(synced[kind], keys), normalized(expected[kind], keys), check_dtype=False)
+    assert synced['quantiles']['count'].sum() == ROWS
+
+def test_combine_of_chunks_equals_full_state(frames):
+    collections = ('operations', 'depots', 'clients', 'mouvements')
+    full = AggregateState.from_frames(*(frames[collection] for collection in collections))
+    
+    parts = [AggregateState.from_frames(operations_df=chunk) for chunk in chunks(frames['operations'])]
+    parts += [AggregateState.from_frames(depots_df=chunk) for chunk in chunks(frames['depots'])]
+    parts += [AggregateState.from_frames(mouvements_df=chunk) for chunk in chunks(frames['mouvements'])]
+    parts.append(AggregateState.from_frames(clients_df=frames['clients']))
+    combined = AggregateState.combine(parts)
+    
+    assert combined.rows == full.rows
+    for collection, keys in AggregateState.KEYS.items():
+        pd.testing.assert_frame_equal(
+            normalized(combined.tables[collection], keys),
+            normalized(full.tables[collection], keys),
+            check_dtype=False, check_categorical=False
+        )
+
+def test_outdated_rollup_is_rebuilt_even_without_documents(tmp_path, frames, extractor):
+    store = RollupStore(str(tmp_path / 'rollups'))
+    outdated = compute_rollup('depots', frames['depots']).drop(columns='clientId')
+    store.save('depots', outdated, '2024-12-31T00:00:00Z')
+    
+    rebuilt = store.sync(extractor, 'depots')
+    
+    assert rebuilt.empty
+    assert store.load('depots').empty
+    assert store.get_watermark('depots') is None
@@ -0,0 +1,39 @@
+"""
+Plan de requêtes partagé par l'API et le CLI: période de chaque type de rapport et historique des analyses
+"""
+
+from datetime import datetime
+
+import pandas as pd
+
+from report_planner import plan_report
+
+def test_periods_by_report_type():
+    today = datetime.now().strftime("%Y-%m-%d")
+    
+    assert (plan_report('daily').start_date, plan_report('daily').end_date) == (today, today)
+    assert plan_report('daily', start_date='2024-03-04').end_date == '2024-03-04'
+    
+    month = plan_report('monthly', month_year='2024-02')
+    assert (month.start_date, month.end_date) == ('2024-02-01', '2024-02-29')
+    
+    current = plan_report('monthly')
+    assert current.start_date == datetime.now().replace(day=1).strftime("%Y-%m-%d") and current.end_date == today
+    
+    assert plan_report('yearly').start_date == f"{datetime.now().year}-01-01"
+    assert plan_report('custom').start_date is None
+
+def test_history_is_read_only_for_requested_analyses():
+    plan = plan_report('custom', start_date='2024-12-01', end_date='2024-12-31', analyses=('tendances_ventes',))
+    
+    assert plan.query_range('operations') == ('2023-11-01', '2024-12-31')
+    assert plan.query_range('depots') == ('2024-12-01', '2024-12-31')
+    assert plan_report('custom', start_date='2024-12-01', end_date='2024-12-31').history == {}
+
+def test_in_period_drops_the_history():
+    plan = plan_report('custom', start_date='2024-12-01', end_date='2024-12-31', analyses=('variation_ventes',))
+    operations = pd.DataFrame({'date': pd.to_datetime(['2024-11-15', '2024-12-01', '2024-12-31', '2025-01-01'])})
+    
+    kept = plan.in_period({'operations': operations})['operations']
+    
+    assert kept['date'].dt.strftime('%Y-%m-%d').tolist() == ['2024-12-01', '2024-12-31']
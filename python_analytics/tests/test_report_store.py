@@ -0,0 +1,45 @@
+"""
+Éviction du store: le fichier de verrou d'une entrée en cours de rendu n'est jamais supprimé, et un
+verrou attendu pendant une éviction porte toujours sur le fichier présent dans locks/
+"""
+
+import os
+import threading
+
+from report_store import ReportStore
+
+def test_evict_keeps_lock_files_that_are_held(tmp_path):
+    store = ReportStore(root=str(tmp_path), max_bytes=1 << 20)
+    store.put('libre', 'libre.xlsx', data=b'x' * 100)
+    store.put('tenu', 'tenu.xlsx', data=b'x' * 100)
+    for key in ('libre', 'tenu'):
+        with store.lock(key):
+            pass
+    
+    store.max_bytes = 0
+    with store.lock('tenu'):
+        assert store.evict() == 2
+        assert os.path.exists(store._lock_path('tenu'))
+    assert not os.path.exists(store._lock_path('libre'))
+    assert store.get('tenu') is None and not os.path.exists(store.path('tenu'))
+
+def test_lock_waiting_during_removal_reopens_the_lock_file(tmp_path):
+    store = ReportStore(root=str(tmp_path))
+    acquired = threading.Event()
+    kept = []
+    
+    def waiter():
+        with store.lock('cle'):
+            acquired.set()
+            # Verrou obtenu sur le fichier présent: une suppression sans attente échoue
+            store._remove_lock_file('cle')
+            kept.append(os.path.exists(store._lock_path('cle')))
+    
+    with store.lock('cle'):
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        assert not acquired.wait(0.2)
+        # Suppression pendant l'attente (comme evict sans verrou): le fichier attendu devient orphelin
+        os.remove(store._lock_path('cle'))
+    thread.join(5)
+    assert acquired.is_set() and kept == [True]
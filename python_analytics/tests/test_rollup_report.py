@@ -0,0 +1,72 @@
+"""
+Le rapport de synthèse calculé depuis les agrégats journaliers (ou depuis un état agrégé bloc par bloc) a les
+mêmes onglets et les mêmes lignes que celui calculé sur les données brutes, y compris avec des shops, clients
+ou types manquants
+"""
+
+import pandas as pd
+
+from aggregations import AggregateState
+from benchmark import generate_dataset
+from data_analyzer import DataAnalyzer
+from excel_generator import ExcelGenerator
+from rollups import ROLLUP_SPECS, compute_rollup, with_missing_keys
+from schemas import apply_schema
+
+def dataset_with_missing_keys():
+    documents = generate_dataset(2000, 3, seed=2)
+    documents['operations'].loc[::97, 'shopId'] = None
+    documents['depots'].loc[::89, 'clientId'] = None
+    documents['depots'].loc[::101, 'shopId'] = None
+    documents['mouvements'].loc[::83, 'type'] = None
+    return {collection: apply_schema(collection, df)[0] for collection, df in documents.items()}
+
+def test_rollup_report_matches_raw_report(tmp_path):
+    frames = dataset_with_missing_keys()
+    rollups = {collection: compute_rollup(collection, frames[collection]) for collection in ROLLUP_SPECS}
+    generator = ExcelGenerator()
+    
+    raw = generator.create_sales_report(
+        frames['operations'], frames['depots'], frames['clients'], frames['mouvements'],
+        str(tmp_path / 'brut.xlsx'), include_raw_data=False
+    )
+    summary = generator.create_rollup_report(
+        rollups['operations'], rollups['depots'], rollups['mouvements'], str(tmp_path / 'agrege.xlsx')
+    )
+    
+    raw_sheets = pd.read_excel(raw, sheet_name=None)
+    rollup_sheets = pd.read_excel(summary, sheet_name=None)
+    assert list(rollup_sheets) == list(raw_sheets)
+    for name, sheet in raw_sheets.items():
+        pd.testing.assert_frame_equal(rollup_sheets[name], sheet, check_dtype=False, rtol=1e-4)
+
+def test_missing_keys_are_not_counted_as_shops():
+    frames = dataset_with_missing_keys()
+    rollup = with_missing_keys(compute_rollup('operations', frames['operations']))
+    
+    assert rollup['shopId'].nunique() == frames['operations']['shopId'].nunique()
+    assert rollup['count'].sum() == len(frames['operations'])
+
+def test_summary_report_from_state_matches_raw_report(tmp_path):
+    frames = dataset_with_missing_keys()
+    analyzer = DataAnalyzer()
+    for collection in AggregateState.TABLES:
+        df = frames[collection]
+        for start in range(0, len(df), 700):
+            analyzer.update_state(**{f"{collection}_df": df.iloc[start:start + 700]})
+    generator = ExcelGenerator()
+    
+    raw = generator.create_sales_report(
+        frames['operations'], frames['depots'], frames['clients'], frames['mouvements'],
+        str(tmp_path / 'brut.xlsx'), include_raw_data=False
+    )
+    from_state = generator.create_sales_report(
+        None, None, None, None, str(tmp_path / 'etat.xlsx'), include_raw_data=False,
+        aggregates=analyzer.state.aggregates()
+    )
+    
+    raw_sheets = pd.read_excel(raw, sheet_name=None)
+    state_sheets = pd.read_excel(from_state, sheet_name=None)
+    assert list(state_sheets) == list(raw_sheets)
+    for name, sheet in raw_sheets.items():
+        pd.testing.assert_frame_equal(state_sheets[name], sheet, check_dtype=False, rtol=1e-4)
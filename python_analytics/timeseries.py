@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+# Fenêtres glissantes calculées (jours calendaires)
+ROLLING_WINDOWS = (7, 30)
+
+# Identifiant de la série agrégée sur tous les shops
+ALL_SHOPS = 'all'
+
+def calendar_change(values):
+    """Variation (%) par rapport à la période calendaire précédente, et non à la ligne précédente
+    
+    values: Series indexée par période (dates pour 'day', Period sinon), comme operations_by_period.
+    Une période précédente sans ventes donne NaN (pct_change comparait à la dernière période ayant des données).
+    """
+    if values.empty:
+        return values.astype(float)
+    if isinstance(values.index, pd.PeriodIndex):
+        periods = values.index
+    else:
+        periods = pd.PeriodIndex(pd.to_datetime(values.index), freq='D')
+    current = values.to_numpy(dtype=float)
+    previous = pd.Series(current, index=periods).reindex(periods - 1).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(previous != 0, (current / previous - 1) * 100, np.nan)
+    return pd.Series(change, index=values.index, name=values.name)
+
+class SalesTimeSeries:
+    """Séries de ventes journalières denses: une matrice (shops × jours du calendrier), jours sans ventes à 0
+    
+    Construite depuis la table (jour, shop) -> somme, nombre (DatasetAggregates.operations_day_shop ou les
+    agrégats journaliers de rollups.py). Moyennes glissantes, cumuls mois/année et comparaisons à l'année
+    précédente sont calculés pour tous les shops à la fois, par des opérations sur les colonnes de la matrice:
+    aucune boucle Python par shop ni par jour.
+    """
+    
+    def __init__(self, day_shop):
+        day_shop = day_shop[day_shop['day'].notna()]
+        days = pd.to_datetime(day_shop['day']).dt.normalize()
+        shop_codes, shops = pd.factorize(day_shop['shopId'].astype(object).fillna('inconnu'), sort=True)
+        
+        self.start = days.min()
+        self.calendar = pd.date_range(self.start, days.max(), freq='D')
+        self.shops = list(shops)
+        
+        # Ligne par shop + une ligne pour le total tous shops
+        day_index = ((days - self.start) // pd.Timedelta(days=1)).to_numpy()
+        shape = (len(self.shops) + 1, len(self.calendar))
+        self.sales = np.zeros(shape)
+        self.operations = np.zeros(shape, dtype=np.int64)
+        np.add.at(self.sales, (shop_codes, day_index), day_shop['sum'].to_numpy(dtype=float))
+        np.add.at(self.operations, (shop_codes, day_index), day_shop['count'].to_numpy(dtype=np.int64))
+        self.sales[-1] = self.sales[:-1].sum(axis=0)
+        self.operations[-1] = self.operations[:-1].sum(axis=0)
+        
+        # Sommes cumulées avec une colonne de zéros en tête: somme de [i, j) = cumsum[:, j] - cumsum[:, i]
+        self._cumsum = np.zeros((shape[0], shape[1] + 1))
+        np.cumsum(self.sales, axis=1, out=self._cumsum[:, 1:])
+        self._metrics = None
+    
+    def _range_sum(self, starts):
+        """Somme des ventes du jour starts[i] au jour i inclus, pour chaque jour i et chaque shop"""
+        ends = np.arange(1, len(self.calendar) + 1)
+        return self._cumsum[:, ends] - self._cumsum[:, starts]
+    
+    def rolling_sum(self, window):
+        """Somme sur les `window` derniers jours calendaires (NaN tant que la fenêtre n'est pas complète)"""
+        positions = np.arange(len(self.calendar))
+        result = self._range_sum(np.maximum(positions + 1 - window, 0))
+        result[:, :window - 1] = np.nan
+        return result
+    
+    def period_to_date(self, freq):
+        """Cumul depuis le début du mois ('M') ou de l'année ('Y'), borné au début de l'historique"""
+        period_starts = self.calendar.to_period(freq).start_time
+        starts = ((period_starts - self.start) // pd.Timedelta(days=1)).to_numpy()
+        return self._range_sum(np.maximum(starts, 0))
+    
+    def last_year_positions(self):
+        """Position du même jour l'année précédente (29 février -> 28 février), -1 avant le début de l'historique"""
+        last_year = self.calendar - pd.DateOffset(years=1)
+        return ((last_year - self.start) // pd.Timedelta(days=1)).to_numpy().clip(min=-1)
+    
+    def last_year(self, values):
+        """Valeurs du même jour calendaire l'année précédente (NaN si hors historique)"""
+        positions = self.last_year_positions()
+        result = values[:, positions.clip(min=0)].astype(float)
+        result[:, positions < 0] = np.nan
+        return result
+    
+    def metrics(self):
+        """Toutes les métriques, sous forme de matrices (shops + total) × jours (calculées une fois)"""
+        if self._metrics is not None:
+            return self._metrics
+        metrics = {
+            'ventes': self.sales,
+            'nombre_operations': self.operations
+        }
+        for window in ROLLING_WINDOWS:
+            metrics[f'ventes_{window}j'] = self.rolling_sum(window)
+            metrics[f'moyenne_{window}j'] = metrics[f'ventes_{window}j'] / window
+        metrics['cumul_mois'] = self.period_to_date('M')
+        metrics['cumul_annee'] = self.period_to_date('Y')
+        
+        # Même période l'année précédente et variation (%)
+        for name in ['ventes'] + [f'ventes_{window}j' for window in ROLLING_WINDOWS] + ['cumul_mois', 'cumul_annee']:
+            previous = self.last_year(metrics[name])
+            metrics[f'{name}_n1'] = previous
+            with np.errstate(divide='ignore', invalid='ignore'):
+                metrics[f'variation_{name}_n1'] = np.where(previous > 0, (metrics[name] / previous - 1) * 100, np.nan)
+        self._metrics = metrics
+        return metrics
+    
+    def to_frame(self, start_date=None, end_date=None, shop_id=None, decimals=None):
+        """Table longue (jour, shop, métriques) restreinte à une période et un shop ('all' = total)
+        
+        L'historique antérieur à start_date sert aux fenêtres et comparaisons sans apparaître dans le résultat.
+        """
+        lo = 0 if start_date is None else self.calendar.searchsorted(pd.Timestamp(start_date))
+        hi = len(self.calendar) if end_date is None else self.calendar.searchsorted(pd.Timestamp(end_date), side='right')
+        rows = np.arange(len(self.shops) + 1)
+        if shop_id is not None:
+            names = self.shops + [ALL_SHOPS]
+            rows = np.array([names.index(shop_id)]) if shop_id in names else np.array([], dtype=int)
+        
+        days = self.calendar[lo:hi]
+        shop_names = np.array(self.shops + [ALL_SHOPS], dtype=object)
+        frame = {
+            'date': np.tile(days.to_numpy(), len(rows)),
+            'shopId': np.repeat(shop_names[rows], len(days))
+        }
+        for name, values in self.metrics().items():
+            values = values[rows, lo:hi].ravel()
+            frame[name] = values if decimals is None else values.round(decimals)
+        return pd.DataFrame(frame)